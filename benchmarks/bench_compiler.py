@@ -0,0 +1,48 @@
+"""
+Compares the interpreted ``Packer.unpack``/``Packer.pack`` against the functions generated by
+``construct3.compiler.compile_packer``. Run from the repository root with
+``PYTHONPATH=. python benchmarks/bench_compiler.py``
+"""
+import timeit
+from io import BytesIO
+from construct3 import Struct, Raw, Embedded, this, uint8, uint16b, uint32b, uint32l, float64l, Padding
+from construct3.compiler import compile_packer
+
+
+header = Struct(
+    "version" / uint8,
+    "flags" / uint8,
+    "length" / uint16b,
+    "sequence" / uint32b,
+    "timestamp" / float64l,
+    Padding(2),
+    Embedded(Struct(
+        "source" / uint32l,
+        "destination" / uint32l,
+    )),
+    "payload" / Raw(this.length),
+)
+data = b"\x01\x02\x00\x05\x00\x00\x00\x07" + b"\x00" * 8 + b"\x00\x00" + b"\x01\x00\x00\x00\x02\x00\x00\x00hello"
+
+
+def bench(name, func, number):
+    best = min(timeit.repeat(func, number = number, repeat = 5))
+    print("%-22s %10.0f records/sec" % (name, number / best))
+    return best
+
+def main(number = 20000):
+    compiled = compile_packer(header)
+    assert compiled.unpack(data) == header.unpack(data)
+    obj = header.unpack(data)
+    assert compiled.pack(obj) == header.pack(obj) == data
+
+    t1 = bench("interpreted unpack", lambda: header.unpack(BytesIO(data)), number)
+    t2 = bench("compiled unpack", lambda: compiled.unpack(BytesIO(data)), number)
+    print("%-22s %10.1fx" % ("unpack speedup", t1 / t2))
+    t1 = bench("interpreted pack", lambda: header.pack(obj), number)
+    t2 = bench("compiled pack", lambda: compiled.pack(obj), number)
+    print("%-22s %10.1fx" % ("pack speedup", t1 / t2))
+
+
+if __name__ == "__main__":
+    main()
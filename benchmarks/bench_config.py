@@ -0,0 +1,71 @@
+"""
+Measures the overhead of ``Config.set()`` frames, once with the original implementation (a generator-based
+context manager that copied the whole configuration on every frame) and once with the current one (which only
+saves the attributes that the frame sets): for a single frame, as the configuration holds more attributes, and
+per level, by unpacking Structs nested at increasing depths. Run from the repository root with
+``PYTHONPATH=. python benchmarks/bench_config.py``
+"""
+import timeit
+from contextlib import contextmanager
+from construct3 import Struct, uint8
+from construct3.lib.config import Config
+try:
+    from io import BytesIO
+except ImportError:
+    from cStringIO import StringIO as BytesIO
+
+
+class CopyingConfig(object):
+    """The previous implementation, kept here for comparison"""
+    @contextmanager
+    def set(self, **kwargs):
+        prev = self.__dict__.copy()
+        self.__dict__.update(kwargs)
+        yield
+        self.__dict__ = prev
+    def __getattr__(self, name):
+        return None
+    def __delattr__(self, name):
+        self.__dict__.pop(name, None)
+
+def make_nested(depth):
+    pkr = Struct("x" / uint8)
+    for _ in range(depth):
+        pkr = Struct("x" / uint8, "inner" / pkr)
+    return pkr
+
+def measure(func, number):
+    return min(timeit.repeat(func, number = number, repeat = 7)) / number
+
+def measure_frame(cfg_class, number, extra = 0):
+    cfg = cfg_class()
+    cfg.container = cfg.container_factory = cfg.name = None
+    for i in range(extra):
+        setattr(cfg, "attr%d" % (i,), i)
+    def run():
+        with cfg.set(container = 1, ctx = 2, container_factory = 3):
+            pass
+    return measure(run, number)
+
+def measure_nested(pkr, data, cfg_class, number):
+    def run():
+        pkr._unpack(BytesIO(data), {}, cfg_class())
+    return measure(run, number)
+
+def main(number = 5000):
+    print("%-6s %14s %14s %8s" % ("attrs", "copying (us)", "frames (us)", "speedup"))
+    for extra in (0, 8, 32):
+        t1 = measure_frame(CopyingConfig, number * 10, extra)
+        t2 = measure_frame(Config, number * 10, extra)
+        print("%-6d %14.2f %14.2f %7.2fx" % (extra + 3, t1 * 1e6, t2 * 1e6, t1 / t2))
+    print()
+    print("%-6s %14s %14s %8s" % ("depth", "copying (us)", "frames (us)", "speedup"))
+    for depth in (1, 4, 16, 64):
+        pkr = make_nested(depth)
+        data = b"\x01" * (depth + 1)
+        t1 = measure_nested(pkr, data, CopyingConfig, number)
+        t2 = measure_nested(pkr, data, Config, number)
+        print("%-6d %14.2f %14.2f %7.2fx" % (depth, t1 * 1e6, t2 * 1e6, t1 / t2))
+
+if __name__ == "__main__":
+    main()
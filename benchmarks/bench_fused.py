@@ -0,0 +1,38 @@
+"""
+Measures the interpreted unpacking of a fixed-layout numeric header with and without the fusion of adjacent
+``Formatted`` members. Run from the repository root with ``PYTHONPATH=. python benchmarks/bench_fused.py``
+"""
+import timeit
+from construct3 import Struct, uint8, uint16b, uint32b
+
+
+def make_header():
+    return Struct(
+        "version" / uint8,
+        "tos" / uint8,
+        "total_length" / uint16b,
+        "identification" / uint16b,
+        "fragment" / uint16b,
+        "ttl" / uint8,
+        "protocol" / uint8,
+        "checksum" / uint16b,
+        "source" / uint32b,
+        "destination" / uint32b,
+    )
+
+def main(number = 20000):
+    data = b"\x45\x00\x00\x3c\xa0\xe3\x00\x00\x80\x11\x61\x85\xc0\xa8\x02\x05\xd4\x74\xa1\x26"
+    fused = make_header()
+    unfused = make_header()
+    unfused._plan = list(unfused.members)
+    assert fused.unpack(data) == unfused.unpack(data)
+
+    t1 = min(timeit.repeat(lambda: unfused.unpack(data), number = number, repeat = 5))
+    t2 = min(timeit.repeat(lambda: fused.unpack(data), number = number, repeat = 5))
+    print("%-22s %10.0f records/sec" % ("unfused unpack", number / t1))
+    print("%-22s %10.0f records/sec" % ("fused unpack", number / t2))
+    print("%-22s %10.1fx" % ("speedup", t1 / t2))
+
+
+if __name__ == "__main__":
+    main()
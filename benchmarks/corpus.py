@@ -0,0 +1,173 @@
+"""
+The reference formats measured by ``benchmarks/run.py``. Every case is a packer along with a generator of
+synthetic records (plain dicts, lists or values), seeded so that every run measures the same data
+"""
+import random
+from construct3 import (Struct, Sequence, Raw, Embedded, PascalString, this, uint8, uint16b, uint16l, uint32b,
+    uint32l, uint64l, sint32l, float32l, float64b, float64l, flag)
+from construct3.packers import Switch
+from construct3_protocols.ip import ipv4_header
+
+
+class Case(object):
+    def __init__(self, name, packer, generate, count):
+        self.name = name
+        self.packer = packer
+        self.generate = generate
+        self.count = count
+
+    def records(self, scale = 1.0, seed = 0):
+        """Returns a list of ``count * scale`` (at least one) synthetic records"""
+        rng = random.Random("%s:%d" % (self.name, seed))
+        return [self.generate(rng) for _ in range(max(1, int(self.count * scale)))]
+
+
+def _text(rng, maxlen):
+    return "".join(rng.choice("abcdefghijklmnopqrstuvwxyz0123456789") for _ in range(rng.randint(0, maxlen)))
+
+def _bytes(rng, length):
+    return bytes(bytearray(rng.getrandbits(8) for _ in range(length)))
+
+#
+# fixed numeric structs
+#
+fixed_numeric = Struct(
+    "version" / uint8,
+    "flags" / uint8,
+    "length" / uint16b,
+    "sequence" / uint32b,
+    "offset" / uint64l,
+    "delta" / sint32l,
+    "ratio" / float32l,
+    "timestamp" / float64b,
+    "checksum" / uint16l,
+    "source" / uint32l,
+    "destination" / uint32l,
+)
+
+def gen_fixed_numeric(rng):
+    return dict(version = rng.randint(0, 255), flags = rng.randint(0, 255), length = rng.randint(0, 65535),
+        sequence = rng.getrandbits(32), offset = rng.getrandbits(64), delta = rng.randint(-2 ** 31, 2 ** 31 - 1),
+        ratio = 0.5, timestamp = rng.random() * 1e9, checksum = rng.getrandbits(16), source = rng.getrandbits(32),
+        destination = rng.getrandbits(32))
+
+#
+# nested embedded structs
+#
+nested_embedded = Struct(
+    "kind" / uint8,
+    Embedded(Struct(
+        "x" / float64l,
+        "y" / float64l,
+        Embedded(Struct(
+            "id" / uint32l,
+            "valid" / flag,
+        )),
+    )),
+    "point" / Struct(
+        "lat" / float64l,
+        "lon" / float64l,
+        Embedded(Struct("alt" / sint32l)),
+    ),
+    "length" / uint8,
+    "tag" / Raw(this.length),
+)
+
+def gen_nested_embedded(rng):
+    length = rng.randint(0, 16)
+    return dict(kind = rng.randint(0, 255), x = rng.random(), y = rng.random(), id = rng.getrandbits(32),
+        valid = rng.random() < 0.5, point = dict(lat = rng.uniform(-90, 90), lon = rng.uniform(-180, 180),
+        alt = rng.randint(-1000, 9000)), length = length, tag = _bytes(rng, length))
+
+#
+# bit-level headers
+#
+def gen_ipv4_header(rng):
+    header_length = 4 * rng.randint(5, 8)
+    total_length = rng.randint(header_length, 1500)
+    return dict(version = 4, header_length = header_length,
+        tos = dict(precedence = rng.randint(0, 7), minimize_delay = rng.random() < 0.5,
+            high_throuput = rng.random() < 0.5, high_reliability = False, minimize_cost = False),
+        total_length = total_length, payload_length = total_length - header_length, identification = rng.getrandbits(16),
+        flags = dict(dont_fragment = rng.random() < 0.5, more_fragments = False), frame_offset = 0,
+        ttl = rng.randint(1, 255), protocol = rng.choice(["ICMP", "TCP", "UDP"]), checksum = rng.getrandbits(16),
+        source = ".".join(str(rng.randint(0, 255)) for _ in range(4)),
+        destination = ".".join(str(rng.randint(0, 255)) for _ in range(4)),
+        options = _bytes(rng, header_length - 20))
+
+#
+# length-prefixed strings
+#
+pascal_strings = Struct(
+    "name" / PascalString(uint8),
+    "description" / PascalString(uint16b),
+    "length" / uint16b,
+    "payload" / Raw(this.length),
+    "tags" / Sequence(PascalString(uint8), PascalString(uint8), PascalString(uint8)),
+)
+
+def gen_pascal_strings(rng):
+    length = rng.randint(0, 256)
+    return dict(name = _text(rng, 24), description = _text(rng, 200), length = length,
+        payload = _bytes(rng, length), tags = [_text(rng, 8) for _ in range(3)])
+
+#
+# large ranges
+#
+large_range = Struct(
+    "count" / uint32b,
+    "samples" / uint16l[this.count],
+    "points" / Struct("x" / float32l, "y" / float32l)[16],
+)
+
+def gen_large_range(rng):
+    count = rng.randint(500, 2000)
+    return dict(count = count, samples = [rng.getrandbits(16) for _ in range(count)],
+        points = [dict(x = 0.25, y = -1.5) for _ in range(16)])
+
+#
+# switch-heavy formats
+#
+message = Struct(
+    "kind" / uint8,
+    "body" / Switch(this.kind, {
+        0 : uint32b,
+        1 : PascalString(uint8),
+        2 : Struct("x" / float64l, "y" / float64l),
+        3 : Struct("length" / uint8, "data" / Raw(this.length)),
+        4 : uint16l[4],
+    }, default = uint8),
+)
+switch_heavy = Struct(
+    "count" / uint8,
+    "messages" / message[this.count],
+)
+
+def _gen_body(rng, kind):
+    if kind == 0:
+        return rng.getrandbits(32)
+    elif kind == 1:
+        return _text(rng, 16)
+    elif kind == 2:
+        return dict(x = rng.random(), y = rng.random())
+    elif kind == 3:
+        length = rng.randint(0, 16)
+        return dict(length = length, data = _bytes(rng, length))
+    elif kind == 4:
+        return [rng.getrandbits(16) for _ in range(4)]
+    else:
+        return rng.randint(0, 255)
+
+def gen_switch_heavy(rng):
+    kinds = [rng.randint(0, 5) for _ in range(rng.randint(16, 64))]
+    return dict(count = len(kinds), messages = [dict(kind = kind, body = _gen_body(rng, kind)) for kind in kinds])
+
+
+cases = [
+    Case("fixed_numeric", fixed_numeric, gen_fixed_numeric, 5000),
+    Case("nested_embedded", nested_embedded, gen_nested_embedded, 2000),
+    Case("ipv4_header", ipv4_header, gen_ipv4_header, 2000),
+    Case("pascal_strings", pascal_strings, gen_pascal_strings, 2000),
+    Case("large_range", large_range, gen_large_range, 50),
+    Case("switch_heavy", switch_heavy, gen_switch_heavy, 200),
+]
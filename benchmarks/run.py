@@ -0,0 +1,160 @@
+"""
+Measures pack, unpack and sizeof (records/sec and bytes/sec) of the reference formats in
+``benchmarks/corpus.py``, both interpreted and compiled. Run with::
+
+    python benchmarks/run.py -o results.json
+
+and compare a later run against it with ``--baseline results.json``: every measurement that slowed down by more
+than ``--threshold`` percent is reported as a regression (and the exit status is 1)
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+from io import BytesIO
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from construct3 import __version__
+from construct3.compiler import compile_packer
+from construct3.packers import PackerError
+import corpus
+
+
+_clock = getattr(time, "perf_counter", time.time)
+
+def measure(func, min_time, repeat):
+    """Returns the best time (in seconds) of a single call to ``func``, calling it in loops that take at least
+    ``min_time`` seconds, ``repeat`` times"""
+    loops = 1
+    while True:
+        start = _clock()
+        for _ in range(loops):
+            func()
+        elapsed = _clock() - start
+        if elapsed >= min_time:
+            break
+        loops *= 2 if elapsed * 4 >= min_time else 8
+    best = elapsed
+    for _ in range(repeat - 1):
+        start = _clock()
+        for _ in range(loops):
+            func()
+        best = min(best, _clock() - start)
+    return best / loops
+
+def _unpack_all(packer, buffers):
+    def unpack():
+        for buf in buffers:
+            packer.unpack(BytesIO(buf))
+    return unpack
+
+def _pack_all(packer, objs):
+    def pack():
+        for obj in objs:
+            packer.pack(obj)
+    return pack
+
+def _sizeof_all(packer, count):
+    def sizeof():
+        for _ in range(count):
+            packer.sizeof()
+    return sizeof
+
+def run_case(case, args):
+    objs = case.records(args.scale, args.seed)
+    buffers = [case.packer.pack(obj) for obj in objs]
+    # the decoded records (rather than the generated dicts) are packed, as they are what applications pack
+    objs = [case.packer.unpack(buf) for buf in buffers]
+    total = sum(len(buf) for buf in buffers)
+    variants = [("interpreted", case.packer)]
+    if not args.no_compiled:
+        variants.append(("compiled", compile_packer(case.packer)))
+    results = []
+    for variant, packer in variants:
+        assert [packer.pack(obj) for obj in objs] == buffers, "%s/%s does not round-trip" % (case.name, variant)
+        ops = [("unpack", _unpack_all(packer, buffers)), ("pack", _pack_all(packer, objs))]
+        try:
+            packer.sizeof()
+        except (PackerError, KeyError, TypeError):
+            # the size of variable-sized formats depends on the record
+            pass
+        else:
+            ops.append(("sizeof", _sizeof_all(packer, len(objs))))
+        for op, func in ops:
+            if args.ops and op not in args.ops:
+                continue
+            elapsed = measure(func, args.min_time, args.repeat)
+            result = dict(case = case.name, variant = variant, op = op, records = len(objs), bytes = total,
+                seconds = elapsed, records_per_sec = len(objs) / elapsed)
+            if op != "sizeof":
+                result["bytes_per_sec"] = total / elapsed
+            results.append(result)
+            report(result)
+    return results
+
+def report(result):
+    rate = result.get("bytes_per_sec")
+    print("%-16s %-12s %-7s %12.0f records/sec %10s" % (result["case"], result["variant"], result["op"],
+        result["records_per_sec"], "%.2f MB/sec" % (rate / 1e6,) if rate is not None else ""))
+
+def compare(results, baseline, threshold):
+    """Prints the change of every measurement relative to the baseline; returns the regressions (measurements
+    that slowed down by more than ``threshold`` percent)"""
+    old = dict(((r["case"], r["variant"], r["op"]), r) for r in baseline["results"])
+    regressions = []
+    print("")
+    print("compared with %s (threshold %.0f%%)" % (baseline.get("meta", {}).get("timestamp", "baseline"), threshold))
+    for result in results:
+        key = (result["case"], result["variant"], result["op"])
+        if key not in old:
+            continue
+        change = (result["records_per_sec"] / old[key]["records_per_sec"] - 1) * 100
+        regressed = change < -threshold
+        if regressed:
+            regressions.append(dict(result, change = change))
+        print("%-16s %-12s %-7s %+8.1f%%%s" % (key + (change, "  REGRESSION" if regressed else "")))
+    return regressions
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "construct3 benchmark suite")
+    parser.add_argument("-o", "--output", help = "save the results to this JSON file")
+    parser.add_argument("-b", "--baseline", help = "compare the results against this JSON file")
+    parser.add_argument("-t", "--threshold", type = float, default = 10.0,
+        help = "slowdown (in percent) reported as a regression (default: %(default)s)")
+    parser.add_argument("-k", "--cases", nargs = "+", metavar = "CASE",
+        help = "only run these cases (%s)" % (", ".join(case.name for case in corpus.cases),))
+    parser.add_argument("--ops", nargs = "+", choices = ["pack", "unpack", "sizeof"], help = "only run these ops")
+    parser.add_argument("--no-compiled", action = "store_true", help = "skip the compiled backend")
+    parser.add_argument("--scale", type = float, default = 1.0, help = "scale the number of records per case")
+    parser.add_argument("--seed", type = int, default = 0, help = "seed of the synthetic records")
+    parser.add_argument("--min-time", type = float, default = 0.2, help = "minimal duration of a timing loop")
+    parser.add_argument("--repeat", type = int, default = 3, help = "number of timing loops (the best is kept)")
+    args = parser.parse_args(argv)
+
+    cases = corpus.cases
+    if args.cases:
+        unknown = set(args.cases) - set(case.name for case in cases)
+        if unknown:
+            parser.error("unknown case(s): %s" % (", ".join(sorted(unknown)),))
+        cases = [case for case in cases if case.name in args.cases]
+    results = []
+    for case in cases:
+        results.extend(run_case(case, args))
+
+    output = dict(meta = dict(timestamp = time.strftime("%Y-%m-%dT%H:%M:%S"), construct3 = __version__,
+        python = platform.python_version(), implementation = platform.python_implementation(),
+        platform = platform.platform(), scale = args.scale, seed = args.seed), results = results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(output, f, indent = 2, sort_keys = True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
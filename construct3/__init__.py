@@ -8,6 +8,7 @@ from construct3.numbers import (uint8, sint8, uint16b, sint16b, uint16l, sint16l
     TwosComplement, MaskedInteger)
 from construct3.macros import If, PascalString, Array, Bijection, Enum, flag, BitStruct
 from construct3.adapters import Computed, OneOf, NoneOf, StringAdapter, LengthValue, Padding
+from construct3.profiling import profile
 
 __author__ = "Tomer Filiba <tomerfiliba@gmail.com>"
 
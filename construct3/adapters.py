@@ -1,4 +1,5 @@
 from construct3.packers import Adapter, noop, Raw, PackerError, _contextify, UnnamedPackerMixin, Sequence
+from construct3.lib.thisexpr import compile_expr
 from construct3.lib import this
 from construct3.lib.containers import Container
 from construct3.lib.config import Config
@@ -44,12 +45,16 @@ class NoneOf(SymmetricAdapter):
         return obj
 
 class Computed(SymmetricAdapter):
-    __slots__ = ["expr"]
+    __slots__ = ["expr", "_plan"]
     def __init__(self, expr):
         SymmetricAdapter.__init__(self, noop)
         self.expr = _contextify(expr)
+        self._plan = None
     def codec(self, obj, ctx):
-        return self.expr(ctx)
+        plan = self._plan
+        if plan is None:
+            plan = self._plan = compile_expr(self.expr)
+        return plan(ctx)
 
 class Mapping(Adapter):
     __slots__ = ["pkr", "enc_mapping", "enc_default", "dec_mapping", "dec_default"]
@@ -66,6 +71,8 @@ class Mapping(Adapter):
             raise KeyError("%r is unknown and a default value is not given" % (obj,))
         return self.enc_default
     def decode(self, obj, ctx):
+        if obj.__class__ is memoryview:
+            obj = obj.tobytes()
         if obj in self.dec_mapping:
             return self.dec_mapping[obj]
         if self.dec_default is NotImplemented:
@@ -99,6 +106,8 @@ class StringAdapter(Adapter):
         Adapter.__init__(self, underlying)
         self.encoding = encoding
     def decode(self, obj, ctx):
+        if obj.__class__ is memoryview:
+            obj = obj.tobytes()
         return obj.decode(self.encoding)
     def encode(self, obj, ctx):
         return obj.encode(self.encoding)
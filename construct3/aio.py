@@ -0,0 +1,133 @@
+"""
+asyncio integration: decoding records from an ``asyncio.StreamReader`` and encoding them to an
+``asyncio.StreamWriter``. Requires Python 3.5+; this module is only imported when used.
+
+:func:`unpack_async` reads exactly the bytes of one record: a single ``readexactly()`` for fixed-size packers,
+and for length-prefixed ones (see :func:`construct3.streaming.framer`) the prefix first, then the rest.
+:class:`AsyncRecordStream` is an async iterator over the records of a stream of any packer, and
+:class:`AsyncRecordWriter` packs each message into a reusable buffer and writes it with a single ``write()``.
+"""
+from collections import deque
+from weakref import WeakKeyDictionary
+from construct3.packers import PackerError
+from construct3.layout import analyze
+from construct3.lib.buffers import CopyingBufferStream, BufferOverflowError
+from construct3.lib.config import Config
+from construct3.streaming import Decoder, _frame_function, _Incomplete
+
+
+_frames = WeakKeyDictionary()
+
+def _get_frame(packer):
+    try:
+        return _frames[packer]
+    except KeyError:
+        frame = _frames[packer] = _frame_function(packer)
+        return frame
+
+async def unpack_async(packer, reader):
+    """Reads and unpacks a single record from the given ``asyncio.StreamReader``. The packer must be
+    self-delimiting up front (fixed-size or length-prefixed), so that no bytes beyond the record are consumed;
+    otherwise ``PackerError`` is raised (use :class:`AsyncRecordStream` for such packers). Raises
+    ``asyncio.IncompleteReadError`` if the stream ends in the middle of the record"""
+    frame = _get_frame(packer)
+    if frame is None:
+        raise PackerError("%r is not length-prefixed or fixed-size; use AsyncRecordStream to read it" % (packer,))
+    data = b""
+    while True:
+        try:
+            size = frame(memoryview(data), 0, {})
+        except _Incomplete as ex:
+            data += await reader.readexactly(ex.needed - len(data))
+        else:
+            break
+    if size > len(data):
+        data += await reader.readexactly(size - len(data))
+    return packer._unpack(CopyingBufferStream(data), {}, Config())
+
+
+class AsyncRecordStream(object):
+    """
+    An async iterator over the records read from an ``asyncio.StreamReader``::
+
+        async for record in AsyncRecordStream(packer, reader):
+            ...
+
+    Data is read in chunks of up to ``chunk_size`` bytes and decoded by a :class:`construct3.streaming.Decoder`,
+    so it works for any packer. The iteration stops at the end of the stream; ending in the middle of a record
+    raises :class:`construct3.streaming.TruncatedRecordError`, and corrupt records raise
+    :class:`construct3.streaming.RecordError`
+    """
+    def __init__(self, packer, reader, chunk_size = 64 * 1024):
+        self.packer = packer
+        self.reader = reader
+        self.chunk_size = chunk_size
+        self._decoder = Decoder(packer)
+        self._records = deque()
+
+    def __repr__(self):
+        return "AsyncRecordStream(%r, offset = %d)" % (self.packer, self.offset)
+    @property
+    def offset(self):
+        """The number of bytes consumed by the records decoded so far"""
+        return self._decoder.offset
+
+    def __aiter__(self):
+        return self
+    async def __anext__(self):
+        while not self._records:
+            data = await self.reader.read(self.chunk_size)
+            if not data:
+                self._records.extend(self._decoder.close())
+                if not self._records:
+                    raise StopAsyncIteration()
+                break
+            self._records.extend(self._decoder.feed(data))
+        return self._records.popleft()
+
+
+def _pack_into(packer, obj, buffer):
+    # returns ``(buffer, count)``, replacing the buffer by a larger one as long as the object does not fit
+    while True:
+        try:
+            return buffer, packer.pack_into(obj, buffer)
+        except BufferOverflowError:
+            # packing has no side effects, so it is simply retried with a larger buffer
+            buffer = bytearray(max(len(buffer) * 2, 64))
+
+
+class AsyncRecordWriter(object):
+    """
+    Packs records into a reusable buffer (grown as needed, starting at ``size_hint`` bytes or the packer's fixed
+    size) and writes each one to an ``asyncio.StreamWriter`` with a single ``write()`` call. ``send()`` also
+    waits for the writer to drain
+    """
+    def __init__(self, packer, writer, size_hint = 4096):
+        self.packer = packer
+        self.writer = writer
+        layout = analyze(packer)
+        if layout.fixed:
+            size_hint = max(size_hint, layout.size)
+        self._buffer = bytearray(size_hint)
+
+    def __repr__(self):
+        return "AsyncRecordWriter(%r)" % (self.packer,)
+
+    def write(self, obj):
+        self._buffer, count = _pack_into(self.packer, obj, self._buffer)
+        # the transport may hold on to the data it was given, so it gets a copy rather than a view of the buffer
+        self.writer.write(memoryview(self._buffer)[:count].tobytes())
+    async def send(self, obj):
+        self.write(obj)
+        await self.writer.drain()
+
+async def pack_async(packer, obj, writer, size_hint = 4096):
+    """Packs the given object and writes it to the ``asyncio.StreamWriter`` with a single ``write()``, then
+    waits for the writer to drain (use an :class:`AsyncRecordWriter` to send many messages). The object is
+    packed into a buffer of its own (of the packer's fixed size, or starting at ``size_hint`` bytes), which
+    is written as a view rather than copied"""
+    layout = analyze(packer)
+    buffer, count = _pack_into(packer, obj, bytearray(layout.size if layout.fixed else size_hint))
+    # the buffer is not reused, so the transport may hold on to a view of it
+    writer.write(memoryview(buffer)[:count])
+    await writer.drain()
@@ -0,0 +1,198 @@
+"""
+Batch decoding and encoding of many small, independent buffers (e.g., datagrams). Unlike calling
+:func:`Packer.unpack` per buffer, a batch reuses a single stream (re-pointed at every buffer) and a single
+:class:`Config`, and packers that boil down to a single struct format (fixed-size Structs or Sequences made of
+numbers, or a number by itself) skip the interpreter altogether: a batch of exactly-sized buffers is decoded
+with one ``struct.iter_unpack`` over their concatenation.
+
+A failing item does not abort the batch: by default (``errors = "capture"``) its exception takes its place in
+the results, so results stay aligned with the input. ``errors = "raise"`` propagates the first exception.
+"""
+from operator import itemgetter
+from weakref import WeakKeyDictionary
+from construct3.packers import Struct, Sequence, Embedded, FusedFormatted, RawError
+from construct3.fusion import fuse_formatted, split_format
+from construct3.lib.buffers import BufferStream, CopyingBufferStream
+from construct3.lib.config import Config
+from construct3.lib.containers import Container
+try:
+    from io import BytesIO
+except ImportError:
+    from cStringIO import StringIO as BytesIO
+
+
+_error_modes = ("capture", "raise")
+
+class _FusedPlan(object):
+    # a packer that is a single struct format: ``build`` turns a tuple of values into the unpacked object and
+    # ``values`` does the opposite
+    __slots__ = ["fmt", "build", "values"]
+    def __init__(self, fmt, build, values):
+        self.fmt = fmt
+        self.build = build
+        self.values = values
+
+def _first(values):
+    return values[0]
+
+def _singleton_tuple(obj):
+    return (obj,)
+
+def _fused_plan(pkr):
+    if split_format(pkr) is not None:
+        return _FusedPlan(pkr.fmt, _first, _singleton_tuple)
+    if type(pkr) is Struct:
+        members = pkr.members
+        if not members or any(not name or isinstance(pkr2, Embedded) for name, pkr2 in members):
+            return None
+    elif type(pkr) is Sequence:
+        members = list(enumerate(pkr.members))
+        if not members:
+            return None
+    else:
+        return None
+    plan = fuse_formatted(members, minrun = 1)
+    if len(plan) != 1 or type(plan[0][1]) is not FusedFormatted:
+        return None
+    names, fused = plan[0]
+    fmt = fused.fmt
+    if type(pkr) is Sequence:
+        factory = pkr.container_factory or Container
+        if factory is list:
+            return _FusedPlan(fmt, list, tuple)
+        def build(values):
+            obj = factory()
+            for v in values:
+                obj.append(v)
+            return obj
+        return _FusedPlan(fmt, build, tuple)
+    get = itemgetter(*names) if len(names) > 1 else (lambda obj, _name = names[0]: (obj[_name],))
+    if pkr.record_class is not None:
+        record_cls = pkr.record_class
+        return _FusedPlan(fmt, lambda values: record_cls(*values), get)
+    factory = pkr.container_factory or Container
+    if factory is Container or factory is dict:
+        return _FusedPlan(fmt, lambda values: factory(zip(names, values)), get)
+    def build(values):
+        obj = factory()
+        for name, v in zip(names, values):
+            obj[name] = v
+        return obj
+    return _FusedPlan(fmt, build, get)
+
+_plans = WeakKeyDictionary()
+
+def _get_plan(pkr):
+    try:
+        return _plans[pkr]
+    except KeyError:
+        plan = _plans[pkr] = _fused_plan(pkr)
+        return plan
+
+
+#=======================================================================================================================
+# unpacking
+#=======================================================================================================================
+def _unpack_fused(plan, buffers, capture):
+    fmt = plan.fmt
+    build = plan.build
+    size = fmt.size
+    for buf in buffers:
+        try:
+            if len(buf) < size:
+                raise RawError("Expected buffer of length %d, got %d" % (size, len(buf)))
+            obj = build(fmt.unpack_from(buf))
+        except Exception as ex:
+            if not capture:
+                raise
+            obj = ex
+        yield obj
+
+def _unpack_interpreted(packer, buffers, zero_copy, capture):
+    stream = (BufferStream if zero_copy else CopyingBufferStream)(b"")
+    cfg = Config()
+    for buf in buffers:
+        stream.reset(buf)
+        try:
+            obj = packer._unpack(stream, {}, cfg)
+        except Exception as ex:
+            if not capture:
+                raise
+            obj = ex
+            cfg = Config()
+        yield obj
+    stream.reset(b"")
+
+def iter_unpack_many(packer, buffers, zero_copy = False, errors = "capture"):
+    """Returns a generator that unpacks an object from each of the given buffers in turn
+    (see :func:`unpack_many`)"""
+    if errors not in _error_modes:
+        raise ValueError("errors must be one of %s, got %r" % (", ".join(_error_modes), errors))
+    plan = _get_plan(packer)
+    if plan is not None:
+        return _unpack_fused(plan, buffers, errors == "capture")
+    return _unpack_interpreted(packer, buffers, zero_copy, errors == "capture")
+
+def unpack_many(packer, buffers, zero_copy = False, errors = "capture"):
+    """
+    Unpacks an object from each of the given buffers, returning a list of the results (in the order of the
+    buffers). As with :func:`Packer.unpack`, trailing data in a buffer is ignored; ``zero_copy`` decodes raw data
+    as ``memoryview`` slices of the buffers. With ``errors = "capture"``, an item that fails to unpack is
+    replaced by its exception; with ``errors = "raise"``, the exception propagates
+    """
+    plan = _get_plan(packer)
+    iter_unpack = getattr(plan.fmt, "iter_unpack", None) if plan is not None else None
+    if iter_unpack is not None and errors in _error_modes:
+        if not isinstance(buffers, (list, tuple)):
+            buffers = list(buffers)
+        size = plan.fmt.size
+        if all(len(buf) == size for buf in buffers):
+            return [plan.build(values) for values in iter_unpack(b"".join(buffers))]
+    return list(iter_unpack_many(packer, buffers, zero_copy, errors))
+
+
+#=======================================================================================================================
+# packing
+#=======================================================================================================================
+def _pack_fused(plan, objs, capture):
+    pack = plan.fmt.pack
+    values = plan.values
+    for obj in objs:
+        try:
+            data = pack(*values(obj))
+        except Exception as ex:
+            if not capture:
+                raise
+            data = ex
+        yield data
+
+def _pack_interpreted(packer, objs, capture):
+    stream = BytesIO()
+    cfg = Config()
+    for obj in objs:
+        stream.seek(0)
+        stream.truncate()
+        try:
+            packer._pack(obj, stream, {}, cfg)
+            data = stream.getvalue()
+        except Exception as ex:
+            if not capture:
+                raise
+            data = ex
+            cfg = Config()
+        yield data
+
+def iter_pack_many(packer, objs, errors = "capture"):
+    """Returns a generator that packs each of the given objects in turn (see :func:`pack_many`)"""
+    if errors not in _error_modes:
+        raise ValueError("errors must be one of %s, got %r" % (", ".join(_error_modes), errors))
+    plan = _get_plan(packer)
+    if plan is not None:
+        return _pack_fused(plan, objs, errors == "capture")
+    return _pack_interpreted(packer, objs, errors == "capture")
+
+def pack_many(packer, objs, errors = "capture"):
+    """Packs each of the given objects, returning a list of the resulting byte strings (in the order of the
+    objects). With ``errors = "capture"``, an object that fails to pack is replaced by its exception; with
+    ``errors = "raise"``, the exception propagates"""
+    return list(iter_pack_many(packer, objs, errors))
@@ -0,0 +1,2 @@
+from construct3.compiler.python_backend import compile_packer, generate, CompiledPacker
+from construct3.compiler.cache import CompilerCache, LazyCompiled, cached_compile, default_cache, structural_key
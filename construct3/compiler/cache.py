@@ -0,0 +1,129 @@
+"""
+Process-wide, in-memory cache of compiled packers. Packers are keyed by their structure, so two packer trees
+built separately (e.g., from the same configuration) share a single compiled function.
+"""
+import threading
+from collections import OrderedDict
+from struct import Struct as _StructFormat
+from construct3.packers import Packer, CtxConst, _derived_attributes
+from construct3.lib.thisexpr import Path, BinExpr, UniExpr
+from construct3.compiler.python_backend import compile_packer
+
+
+# attributes that are derived lazily from the others (execution plans), and so are not part of the structure
+_derived = ("__weakref__", "__dict__") + _derived_attributes
+
+def _attributes(obj):
+    names = []
+    for cls in type(obj).mro():
+        for name in getattr(cls, "__slots__", ()):
+            if name not in names and name not in _derived:
+                names.append(name)
+    for name in sorted(getattr(obj, "__dict__", ())):
+        if name not in names:
+            names.append(name)
+    return names
+
+def structural_key(obj):
+    """Returns a hashable key describing the structure of the given packer (or any value it holds). Packers that
+    are built the same way have equal keys; callables (lambdas, etc.) are compared by identity, and other values
+    by their type and value (so ``1``, ``1.0`` and ``True`` differ)"""
+    if isinstance(obj, Packer):
+        key = [type(obj)]
+        for name in _attributes(obj):
+            try:
+                value = getattr(obj, name)
+            except AttributeError:
+                continue
+            key.append((name, structural_key(value)))
+        if getattr(obj, "_hits", None) is not None:
+            # switches compiled while counting their hits generate different code
+            key.append(("_hits", True))
+        return tuple(key)
+    elif isinstance(obj, CtxConst):
+        return (CtxConst, structural_key(obj.value))
+    elif isinstance(obj, Path):
+        key = []
+        while obj is not None:
+            key.append(structural_key(obj._Path__name))
+            obj = obj._Path__parent
+        return (Path,) + tuple(key)
+    elif isinstance(obj, BinExpr):
+        return (BinExpr, obj.op, structural_key(obj.lhs), structural_key(obj.rhs))
+    elif isinstance(obj, UniExpr):
+        return (UniExpr, obj.op, structural_key(obj.operand))
+    elif isinstance(obj, _StructFormat):
+        return (_StructFormat, obj.format)
+    elif isinstance(obj, (tuple, list)):
+        return (type(obj),) + tuple(structural_key(item) for item in obj)
+    elif isinstance(obj, dict):
+        return (type(obj),) + tuple((structural_key(k), structural_key(v)) for k, v in obj.items())
+    try:
+        hash(obj)
+    except TypeError:
+        return ("id", id(obj))
+    return (type(obj), obj)
+
+
+class CompilerCache(object):
+    """An LRU cache of compiled packers, keyed by :func:`structural_key`"""
+    def __init__(self, maxsize = 256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    def __repr__(self):
+        return "CompilerCache(size = %d, maxsize = %d, hits = %d, misses = %d)" % (
+            len(self), self.maxsize, self.hits, self.misses)
+    def __len__(self):
+        return len(self._entries)
+
+    def compile(self, pkr):
+        key = structural_key(pkr)
+        with self._lock:
+            compiled = self._entries.get(key)
+            if compiled is not None:
+                self._entries.pop(key)
+                self._entries[key] = compiled
+                self.hits += 1
+                return compiled
+            self.misses += 1
+        compiled = compile_packer(pkr)
+        with self._lock:
+            self._entries[key] = compiled
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last = False)
+        return compiled
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+default_cache = CompilerCache()
+
+def cached_compile(pkr):
+    """Compiles the given packer through the process-wide cache"""
+    return default_cache.compile(pkr)
+
+
+class LazyCompiled(Packer):
+    """Wraps a packer, compiling it (through the cache) the first time it is used"""
+    __slots__ = ["packer", "cache", "_compiled"]
+    def __init__(self, packer, cache = None):
+        self.packer = packer
+        self.cache = default_cache if cache is None else cache
+        self._compiled = None
+    def __repr__(self):
+        return "LazyCompiled(%r)" % (self.packer,)
+    def _get_compiled(self):
+        if self._compiled is None:
+            self._compiled = self.cache.compile(self.packer)
+        return self._compiled
+    def _unpack(self, stream, ctx, cfg):
+        return self._get_compiled()._unpack(stream, ctx, cfg)
+    def _pack(self, obj, stream, ctx, cfg):
+        self._get_compiled()._pack(obj, stream, ctx, cfg)
+    def _sizeof(self, ctx, cfg):
+        return self._get_compiled()._sizeof(ctx, cfg)
@@ -1,8 +1,24 @@
-import struct as _struct
-from srcgen.python import PythonModule, STMT, DEF, IMPORT, FROM_IMPORT, IF, FOR, WHILE, DOC, SEP
-from construct3.packers import Packer, Struct, Sequence, Raw, CtxConst, Adapter, noop
-from construct3.numbers import Formatted
-from construct3.lib.thisexpr import Path, BinExpr, UniExpr, opnames
+"""
+Python backend of the compiler: translates a Packer tree into specialized ``unpack``, ``pack`` and ``sizeof``
+functions. The generated code follows the semantics of the interpreted ``_unpack``/``_pack``/``_sizeof`` chain,
+but without the per-level method calls, ``cfg.set()`` frames and context-expression evaluation. Nodes that have
+no visitor are called through their interpreted implementation.
+"""
+import sys
+import operator
+from contextlib import contextmanager
+import six
+from six.moves import xrange
+from construct3.packers import (Packer, PackerError, RawError, RangeError, SwitchError, Struct, Sequence, Raw,
+    Range, Switch, Pointer, Bitwise, Embedded, CtxConst, Adapter, FusedFormatted, noop, anchor)
+from construct3.numbers import Formatted, Bits
+from construct3.adapters import Computed, Mapping, Flags, Padding, PaddingError
+from construct3.lib.binutil import (BitStreamReader, BitStreamWriter, bytes_to_int, int_to_bytes, bits_to_num,
+    _to_bitstr)
+from construct3.lib.containers import Container
+from construct3.lib.thisexpr import Path, BinExpr, UniExpr, _binsyms, _unisyms
+from construct3.fusion import fuse_formatted
+from construct3.lazy import LazyStruct, LazyRange
 
 
 _registry = {}
@@ -18,184 +34,1033 @@ def _get_visitor(pkr):
             return _registry[cls]
     raise TypeError("Cannot generate code for %r" % (pkr,))
 
-class BaseVisitor(object):
-    @classmethod
-    def setup(cls, pkr):
-        pass
-    @classmethod
-    def generate_unpacker(cls, pkr, streamvar, ctxvar):
-        raise NotImplementedError()
-    @classmethod
-    def generate_packer(cls, pkr, streamvar, ctxvar):
-        raise NotImplementedError()
+_literal_types = (bool, float, type(None), bytes, six.text_type) + six.integer_types
+
 
-class Variable(object):
-    _all_vars = frozenset(range(5000))
-    _used_vars = set()
+class CodeGenerator(object):
+    """Accumulates the generated source and the namespace (constants) it runs in"""
     def __init__(self):
-        self.id = min(self._all_vars - self._used_vars)
-        self._used_vars.add(self.id)
-    def __enter__(self):
-        pass
-    def __exit__(self, t, v, tb):
-        self.free()
-    def free(self):
-        self._used_vars.discard(self.id)
-        self.id = None
-    def __del__(self):
-        self.free()
-    def __str__(self):
-        if self.id is None:
-            raise ValueError("Variable has been freed")
-        return "var%d" % (self.id,)
-    __repr__ = __str__
-    def __hash__(self):
-        return hash(str(self))
-    def __eq__(self, other):
-        return str(self) == str(other)
-    def __ne__(self, other):
-        return str(self) != str(other)
-    def __add__(self, other):
-        return str(self) + other
+        self.lines = []
+        self.indentation = 0
+        self.namespace = {
+            "PackerError" : PackerError,
+            "RawError" : RawError,
+            "RangeError" : RangeError,
+            "SwitchError" : SwitchError,
+            "BitStreamReader" : BitStreamReader,
+            "BitStreamWriter" : BitStreamWriter,
+            "PaddingError" : PaddingError,
+            "Container" : Container,
+            "xrange" : xrange,
+            "_maxsize" : sys.maxsize,
+        }
+        self._consts = {}
+        self._counter = 0
+        self.current_name = None
+        self.bit_streams = set()
+        self.functions = []
+
+    def var(self, prefix = "v"):
+        self._counter += 1
+        return "_%s%d" % (prefix, self._counter)
+    def const(self, obj, prefix = "c"):
+        key = id(obj)
+        if key not in self._consts:
+            name = self.var(prefix)
+            self.namespace[name] = obj
+            self._consts[key] = name
+        return self._consts[key]
+    def literal(self, obj):
+        if isinstance(obj, _literal_types):
+            return repr(obj)
+        return self.const(obj)
+
+    def emit(self, fmt, *args):
+        self.lines.append("    " * self.indentation + (fmt.format(*args) if args else fmt))
+    @contextmanager
+    def block(self, fmt, *args):
+        self.emit(fmt + ":", *args)
+        self.indentation += 1
+        mark = len(self.lines)
+        yield
+        if len(self.lines) == mark:
+            self.emit("pass")
+        self.indentation -= 1
+
+    @contextmanager
+    def function(self, name, args, bit_stream = False):
+        """Generates a separate, top-level function (e.g., for a switch case), which is placed before the main
+        functions in the source. ``bit_stream`` tells whether its ``stream`` argument is a bit stream"""
+        saved = self.lines, self.indentation, self.bit_streams
+        self.lines = []
+        self.indentation = 0
+        self.bit_streams = set(["stream"]) if bit_stream else set()
+        with self.block("def {0}({1})", name, args):
+            yield
+        self.lines.append("")
+        self.functions.extend(self.lines)
+        self.lines, self.indentation, self.bit_streams = saved
+    def emit_global(self, fmt, *args):
+        """Emits a top-level statement, placed after the functions generated so far"""
+        self.functions.append(fmt.format(*args) if args else fmt)
+
+    def source(self):
+        return "\n".join(self.functions + self.lines) + "\n"
+
+
+class Scope(object):
+    """The compile-time view of a context dict: ``names`` maps the members that have already been processed to
+    the local variables holding them, while ``ctxvar`` is the runtime dict (used by callables and fallbacks)"""
+    __slots__ = ["ctxvar", "parent", "names", "factory"]
+    def __init__(self, ctxvar, parent = None, factory = Container):
+        self.ctxvar = ctxvar
+        self.parent = parent
+        self.names = {}
+        self.factory = factory
 
 def _path_to_list(path):
     elems = []
-    while path and path._Path__parent:
+    while path._Path__parent is not None:
         elems.insert(0, path._Path__name)
         path = path._Path__parent
     return elems
 
-def _generate_expr(expr, ctx):
+def _generate_path(gen, path, scope):
+    elems = _path_to_list(path)
+    base = scope.ctxvar
+    while elems:
+        head = elems[0]
+        if head == "_" and scope.parent is not None:
+            scope = scope.parent
+            base = scope.ctxvar
+            elems.pop(0)
+        else:
+            if head in scope.names:
+                base = scope.names[head]
+                elems.pop(0)
+            else:
+                base = scope.ctxvar
+            break
+    return "%s%s" % (base, "".join("[%r]" % (e,) for e in elems))
+
+def generate_expr(gen, expr, scope):
+    """Returns a python expression (as a string) that evaluates the given contextual expression"""
     if isinstance(expr, CtxConst):
-        return repr(expr.value)
+        return gen.literal(expr.value)
     elif isinstance(expr, Path):
-        path = _path_to_list(expr)
-        while path:
-            if path[0] in ctx:
-                ctx = ctx[path[0]]
-                path.pop(0)
-            else:
-                break
-        #return "%s%s" % (ctx["this"], "".join("[%r]" % (p,) for p in path))
-        return "%s%s" % (ctx, "".join("[%r]" % (p,) for p in path))
+        return _generate_path(gen, expr, scope)
     elif isinstance(expr, BinExpr):
-        return "(%s %s %s)" % (_generate_expr(expr.lhs, ctx), opnames[expr.op], _generate_expr(expr.rhs, ctx))
+        lhs = generate_expr(gen, expr.lhs, scope)
+        rhs = generate_expr(gen, expr.rhs, scope)
+        if expr.op in _binsyms:
+            return "(%s %s %s)" % (lhs, _binsyms[expr.op], rhs)
+        elif expr.op is operator.contains:
+            return "(%s in %s)" % (rhs, lhs)
+        return "%s(%s, %s)" % (gen.const(expr.op), lhs, rhs)
     elif isinstance(expr, UniExpr):
-        return "%s%s" % (opnames[expr.op], _generate_expr(expr.operand, ctx))
-    elif isinstance(expr, (bool, int, float, long, str, unicode)):
+        operand = generate_expr(gen, expr.operand, scope)
+        if expr.op in _unisyms:
+            return "(%s%s)" % (_unisyms[expr.op], operand)
+        return "%s(%s)" % (gen.const(expr.op), operand)
+    elif isinstance(expr, _literal_types):
         return repr(expr)
+    elif hasattr(expr, "__call__"):
+        return "%s(%s)" % (gen.const(expr), scope.ctxvar)
     else:
-        raise ValueError(expr)
+        return gen.const(expr)
 
-#=======================================================================================================================
-@register(Sequence)
-class SequenceVisitor(BaseVisitor):
+def _constant_value(expr):
+    """Returns ``(True, value)`` if the expression does not depend on the context"""
+    if isinstance(expr, CtxConst):
+        return True, expr.value
+    elif isinstance(expr, _literal_types):
+        return True, expr
+    return False, None
+
+class BaseVisitor(object):
     @classmethod
-    def setup(cls, pkr):
-        for pkr2 in pkr.members:
-            _get_visitor(pkr2).setup(pkr2)
+    def generate_unpacker(cls, gen, pkr, stream, scope):
+        raise NotImplementedError()
+    @classmethod
+    def generate_packer(cls, gen, pkr, obj, stream, scope):
+        raise NotImplementedError()
+    @classmethod
+    def generate_sizeof(cls, gen, pkr, scope):
+        raise NotImplementedError()
+
+def _generate_unpacker(gen, pkr, stream, scope):
+    return _get_visitor(pkr).generate_unpacker(gen, pkr, stream, scope)
+
+def _generate_packer(gen, pkr, obj, stream, scope):
+    _get_visitor(pkr).generate_packer(gen, pkr, obj, stream, scope)
+
+def _generate_sizeof(gen, pkr, scope):
+    """Returns either an ``int`` (when the size is known at compile time) or an expression string"""
+    return _get_visitor(pkr).generate_sizeof(gen, pkr, scope)
+
+def _generate_sum(sizes):
+    consts = sum(s for s in sizes if isinstance(s, six.integer_types))
+    exprs = [s for s in sizes if not isinstance(s, six.integer_types)]
+    if not exprs:
+        return consts
+    if consts:
+        exprs.append(str(consts))
+    return "(%s)" % (" + ".join(exprs),)
 
+#=======================================================================================================================
+@register(Packer)
+class FallbackVisitor(BaseVisitor):
+    """Calls the interpreted implementation of the node"""
+    @classmethod
+    def generate_unpacker(cls, gen, pkr, stream, scope):
+        res = gen.var()
+        gen.emit("{0} = {1}._unpack({2}, {3}, cfg)", res, gen.const(pkr, "node"), stream, scope.ctxvar)
+        return res
     @classmethod
-    def generate_unpacker(cls, pkr, streamvar, ctx):
-        res = Variable()
-        STMT("{0} = []", res)
-        ctx2 = {"_" : ctx}
-        for i, pkr2 in enumerate(pkr.members):
-            tmp = _generate_unpacker(pkr2, streamvar, ctx2)
-            ctx2[i] = tmp
-            STMT("{0}.append({1})", res, tmp)
+    def generate_packer(cls, gen, pkr, obj, stream, scope):
+        gen.emit("{0}._pack({1}, {2}, {3}, cfg)", gen.const(pkr, "node"), obj, stream, scope.ctxvar)
+    @classmethod
+    def generate_sizeof(cls, gen, pkr, scope):
+        res = gen.var()
+        gen.emit("{0} = {1}._sizeof({2}, cfg)", res, gen.const(pkr, "node"), scope.ctxvar)
         return res
 
-@register(Struct)
-class StructVisitor(BaseVisitor):
+@register(LazyStruct)
+@register(LazyRange)
+class LazyVisitor(FallbackVisitor):
+    """Lazy structs and ranges keep their interpreted (lazy) semantics"""
+
+@register(type(noop))
+class NoopVisitor(BaseVisitor):
     @classmethod
-    def setup(cls, pkr):
-        for _, pkr2 in pkr.members:
-            _get_visitor(pkr2).setup(pkr2)
+    def generate_unpacker(cls, gen, pkr, stream, scope):
+        return "None"
+    @classmethod
+    def generate_packer(cls, gen, pkr, obj, stream, scope):
+        pass
+    @classmethod
+    def generate_sizeof(cls, gen, pkr, scope):
+        return 0
 
+@register(type(anchor))
+class AnchorVisitor(BaseVisitor):
     @classmethod
-    def generate_unpacker(cls, pkr, streamvar, ctx):
-        res = Variable()
-        STMT("{0} = {{}}", res)
-        ctx2 = {"_" : ctx}
-        for name, pkr2 in pkr.members:
-            tmp = _generate_unpacker(pkr2, streamvar, ctx2)
-            ctx2[name] = tmp
-            STMT("{0}[{1!r}] = {2}", res, name, tmp)
+    def generate_unpacker(cls, gen, pkr, stream, scope):
+        res = gen.var()
+        gen.emit("{0} = {1}.tell()", res, stream)
         return res
+    @classmethod
+    def generate_packer(cls, gen, pkr, obj, stream, scope):
+        gen.emit("{0}[{1!r}] = {2}.tell()", scope.ctxvar, gen.current_name, stream)
+    @classmethod
+    def generate_sizeof(cls, gen, pkr, scope):
+        return 0
+
+def _generate_read(gen, stream, length):
+    res = gen.var()
+    gen.emit("{0} = {1}.read({2})", res, stream, length)
+    with gen.block("if len({0}) != {1}", res, length):
+        gen.emit("raise RawError('Expected buffer of length %d, got %d' % ({0}, len({1})))", length, res)
+    return res
+
+@register(Raw)
+class RawVisitor(BaseVisitor):
+    @classmethod
+    def _length(cls, gen, pkr, scope):
+        isconst, value = _constant_value(pkr.length)
+        if isconst:
+            return repr(value)
+        length = gen.var("n")
+        gen.emit("{0} = {1}", length, generate_expr(gen, pkr.length, scope))
+        return length
+
+    @classmethod
+    def generate_unpacker(cls, gen, pkr, stream, scope):
+        return _generate_read(gen, stream, cls._length(gen, pkr, scope))
+    @classmethod
+    def generate_packer(cls, gen, pkr, obj, stream, scope):
+        length = cls._length(gen, pkr, scope)
+        with gen.block("if len({0}) != {1}", obj, length):
+            gen.emit("raise RawError('Expected buffer of length %d, got %d' % ({0}, len({1})))", length, obj)
+        gen.emit("{0}.write({1})", stream, obj)
+    @classmethod
+    def generate_sizeof(cls, gen, pkr, scope):
+        isconst, value = _constant_value(pkr.length)
+        if isconst:
+            return value
+        return generate_expr(gen, pkr.length, scope)
 
 @register(Adapter)
 class AdapterVisitor(BaseVisitor):
     @classmethod
-    def setup(cls, pkr):
-        _get_visitor(pkr.underlying).setup(pkr.underlying)
-        FROM_IMPORT(pkr.__class__.__module__, pkr.__class__.__name__)
+    def generate_unpacker(cls, gen, pkr, stream, scope):
+        obj = _generate_unpacker(gen, pkr.underlying, stream, scope)
+        res = gen.var()
+        gen.emit("{0} = {1}({2}, {3})", res, gen.const(pkr.decode, "dec"), obj, scope.ctxvar)
+        return res
+    @classmethod
+    def generate_packer(cls, gen, pkr, obj, stream, scope):
+        obj2 = gen.var()
+        gen.emit("{0} = {1}({2}, {3})", obj2, gen.const(pkr.encode, "enc"), obj, scope.ctxvar)
+        _generate_packer(gen, pkr.underlying, obj2, stream, scope)
+    @classmethod
+    def generate_sizeof(cls, gen, pkr, scope):
+        return _generate_sizeof(gen, pkr.underlying, scope)
 
+@register(Bits)
+class BitsVisitor(AdapterVisitor):
     @classmethod
-    def generate_unpacker(cls, pkr, streamvar, ctx):
-        res = _generate_unpacker(pkr.underlying, streamvar, ctx)
-        STMT("{0} = {1.__class__.__name__}.decode.im_func(None, {0}, {{}})", res, pkr)
+    def generate_unpacker(cls, gen, pkr, stream, scope):
+        if stream not in gen.bit_streams or pkr.swapped:
+            return AdapterVisitor.generate_unpacker(gen, pkr, stream, scope)
+        res = gen.var()
+        with gen.block("try"):
+            gen.emit("{0} = {1}.read_int({2!r})", res, stream, pkr.width)
+        with gen.block("except EOFError as ex"):
+            gen.emit("raise RawError(str(ex))")
+        if pkr.signed:
+            with gen.block("if {0} >> {1!r}", res, pkr.width - 1):
+                gen.emit("{0} -= {1!r}", res, 1 << pkr.width)
         return res
+    @classmethod
+    def generate_packer(cls, gen, pkr, obj, stream, scope):
+        if stream not in gen.bit_streams or pkr.swapped:
+            return AdapterVisitor.generate_packer(gen, pkr, obj, stream, scope)
+        if not pkr.signed:
+            with gen.block("if {0} < 0", obj):
+                gen.emit("raise ValueError('%r is negative, but field is not signed' % ({0},))", obj)
+        gen.emit("{0}.write_int(int({1}), {2!r})", stream, obj, pkr.width)
 
 @register(Formatted)
 class FormattedVisitor(BaseVisitor):
     @classmethod
-    def setup(cls, pkr):
-        IMPORT("struct as _struct")
+    def generate_unpacker(cls, gen, pkr, stream, scope):
+        data = _generate_read(gen, stream, pkr.fmt.size)
+        res = gen.var()
+        gen.emit("{0}, = {1}.unpack({2})", res, gen.const(pkr.fmt, "fmt"), data)
+        return res
+    @classmethod
+    def generate_packer(cls, gen, pkr, obj, stream, scope):
+        gen.emit("{0}.write({1}.pack({2}))", stream, gen.const(pkr.fmt, "fmt"), obj)
+    @classmethod
+    def generate_sizeof(cls, gen, pkr, scope):
+        return pkr.fmt.size
 
+@register(FusedFormatted)
+class FusedFormattedVisitor(BaseVisitor):
     @classmethod
-    def generate_unpacker(cls, pkr, streamvar, ctx):
-        res = Variable()
-        STMT("{0}, = _struct.unpack({1!r}, {2}.read({3}))", res, pkr.FORMAT, streamvar, 
-            _struct.calcsize(pkr.FORMAT))
+    def generate_values(cls, gen, pkr, stream):
+        """Unpacks into one variable per fused member; returns the list of variables"""
+        data = _generate_read(gen, stream, pkr.fmt.size)
+        res = [gen.var() for _ in pkr.members]
+        gen.emit("{0}, = {1}.unpack({2})", ", ".join(res), gen.const(pkr.fmt, "fmt"), data)
         return res
-
-@register(Raw)
-class RawVisitor(BaseVisitor):
     @classmethod
-    def generate_unpacker(cls, pkr, streamvar, ctx):
-        res = Variable()
-        STMT("{0} = {1}.read({2})", res, streamvar, _generate_expr(pkr.length, ctx))
+    def generate_unpacker(cls, gen, pkr, stream, scope):
+        res = gen.var()
+        gen.emit("{0} = ({1},)", res, ", ".join(cls.generate_values(gen, pkr, stream)))
         return res
+    @classmethod
+    def generate_packer(cls, gen, pkr, obj, stream, scope):
+        gen.emit("{0}.write({1}.pack(*{2}))", stream, gen.const(pkr.fmt, "fmt"), obj)
+    @classmethod
+    def generate_sizeof(cls, gen, pkr, scope):
+        return pkr.fmt.size
 
-@register(type(noop))
-class NoopsVisitor(BaseVisitor):
+@register(Computed)
+class ComputedVisitor(BaseVisitor):
     @classmethod
-    def generate_unpacker(cls, pkr, streamvar, ctx):
+    def generate_unpacker(cls, gen, pkr, stream, scope):
+        res = gen.var()
+        gen.emit("{0} = {1}", res, generate_expr(gen, pkr.expr, scope))
+        return res
+    @classmethod
+    def generate_packer(cls, gen, pkr, obj, stream, scope):
         pass
+    @classmethod
+    def generate_sizeof(cls, gen, pkr, scope):
+        return 0
+
+@register(Padding)
+class PaddingVisitor(BaseVisitor):
+    @classmethod
+    def generate_unpacker(cls, gen, pkr, stream, scope):
+        length = RawVisitor._length(gen, pkr.underlying, scope)
+        data = _generate_read(gen, stream, length)
+        if pkr.strict:
+            with gen.block("if {0} != {1} * {2}", data, gen.literal(pkr.padchar), length):
+                gen.emit("raise PaddingError('Wrong padding pattern %r' % ({0},))", data)
+        return "None"
+    @classmethod
+    def generate_packer(cls, gen, pkr, obj, stream, scope):
+        isconst, value = _constant_value(pkr.length)
+        if isconst:
+            gen.emit("{0}.write({1})", stream, gen.literal(pkr.padchar * value))
+        else:
+            length = RawVisitor._length(gen, pkr.underlying, scope)
+            gen.emit("{0}.write({1} * {2})", stream, gen.literal(pkr.padchar), length)
+    @classmethod
+    def generate_sizeof(cls, gen, pkr, scope):
+        return RawVisitor.generate_sizeof(gen, pkr.underlying, scope)
+
+@register(Mapping)
+class MappingVisitor(BaseVisitor):
+    @classmethod
+    def _generate_lookup(cls, gen, mapping, default, obj):
+        res = gen.var()
+        with gen.block("if {0} in {1}", obj, gen.const(mapping, "map")):
+            gen.emit("{0} = {1}[{2}]", res, gen.const(mapping, "map"), obj)
+        with gen.block("else"):
+            if default is NotImplemented:
+                gen.emit("raise KeyError('%r is unknown and a default value is not given' % ({0},))", obj)
+            else:
+                gen.emit("{0} = {1}", res, gen.literal(default))
+        return res
+
+    @classmethod
+    def generate_unpacker(cls, gen, pkr, stream, scope):
+        obj = _generate_unpacker(gen, pkr.underlying, stream, scope)
+        return cls._generate_lookup(gen, pkr.dec_mapping, pkr.dec_default, obj)
+    @classmethod
+    def generate_packer(cls, gen, pkr, obj, stream, scope):
+        obj2 = cls._generate_lookup(gen, pkr.enc_mapping, pkr.enc_default, obj)
+        _generate_packer(gen, pkr.underlying, obj2, stream, scope)
+    @classmethod
+    def generate_sizeof(cls, gen, pkr, scope):
+        return _generate_sizeof(gen, pkr.underlying, scope)
+
+@register(Flags)
+class FlagsVisitor(BaseVisitor):
+    @classmethod
+    def generate_unpacker(cls, gen, pkr, stream, scope):
+        obj = _generate_unpacker(gen, pkr.underlying, stream, scope)
+        res = gen.var()
+        gen.emit("{0} = Container(({1}))", res, "".join("(%r, bool(%s & %r)), " % (name, obj, mask)
+            for name, mask in pkr.flags.items()))
+        return res
+    @classmethod
+    def generate_packer(cls, gen, pkr, obj, stream, scope):
+        num = gen.var()
+        gen.emit("{0} = 0", num)
+        for name, mask in pkr.flags.items():
+            with gen.block("if {0}.get({1!r}, None)", obj, name):
+                gen.emit("{0} |= {1!r}", num, mask)
+        _generate_packer(gen, pkr.underlying, num, stream, scope)
+    @classmethod
+    def generate_sizeof(cls, gen, pkr, scope):
+        return _generate_sizeof(gen, pkr.underlying, scope)
 
 #=======================================================================================================================
+def _is_inlinable_embedding(pkr, kind):
+    return isinstance(pkr, Embedded) and type(pkr.underlying) is kind
+
+def _embedded_struct(pkr):
+    # the Struct whose fields an embedded member stores, if it can be inlined: either a Struct or a bit struct
+    # (a Bitwise over a Struct)
+    pkr = pkr.underlying
+    if type(pkr) is Bitwise:
+        pkr = pkr.underlying
+    return pkr if type(pkr) is Struct else None
+
+@register(Struct)
+class StructVisitor(BaseVisitor):
+    @classmethod
+    def _compilable(cls, pkr):
+        for _, mem in pkr.members:
+            if isinstance(mem, Embedded):
+                inner = _embedded_struct(mem)
+                if inner is None or not cls._compilable(inner):
+                    return False
+        return True
+
+    @classmethod
+    def _unpack_members(cls, gen, pkr, stream, scope, res):
+        # with res = None (record structs), the values are only kept in locals and in the context
+        store = "{2}[{1!r}] = {3}" if res is None else "{0}[{1!r}] = {2}[{1!r}] = {3}"
+        for name, pkr2 in fuse_formatted(pkr.members):
+            if isinstance(pkr2, Embedded):
+                if type(pkr2.underlying) is Bitwise:
+                    cls._unpack_bit_members(gen, pkr2.underlying, stream, scope, res, store)
+                else:
+                    cls._unpack_members(gen, pkr2.underlying, stream, scope, res)
+                continue
+            if isinstance(pkr2, FusedFormatted):
+                for name2, obj in zip(name, FusedFormattedVisitor.generate_values(gen, pkr2, stream)):
+                    gen.emit(store, res, name2, scope.ctxvar, obj)
+                    scope.names[name2] = obj
+                continue
+            gen.current_name = name
+            obj = _generate_unpacker(gen, pkr2, stream, scope)
+            if name:
+                gen.emit(store, res, name, scope.ctxvar, obj)
+                scope.names[name] = obj
+
+    @classmethod
+    def generate_unpacker(cls, gen, pkr, stream, scope):
+        if not cls._compilable(pkr):
+            return FallbackVisitor.generate_unpacker(gen, pkr, stream, scope)
+        factory = pkr.container_factory or scope.factory
+        scope2 = Scope(gen.var("ctx"), scope, factory)
+        res = gen.var("obj")
+        gen.emit("{0} = {{'_' : {1}}}", scope2.ctxvar, scope.ctxvar)
+        if pkr.record_class is not None:
+            cls._unpack_members(gen, pkr, stream, scope2, None)
+            gen.emit("{0} = {1}({2})", res, gen.const(pkr.record_class, "record"),
+                ", ".join(scope2.names[name] for name in pkr.record_class._fields))
+        else:
+            gen.emit("{0} = {1}()", res, gen.literal(factory) if factory is not Container else "Container")
+            cls._unpack_members(gen, pkr, stream, scope2, res)
+        return res
+
+    @classmethod
+    def _unpack_bit_members(cls, gen, pkr, stream, scope, res, store):
+        # the fields of an embedded bit struct are stored in the enclosing struct, either out of a single integer
+        # (as by BitwiseVisitor) or from a bit stream
+        fields = pkr._get_fields()
+        if not fields:
+            stream2 = gen.var("bits")
+            gen.bit_streams.add(stream2)
+            gen.emit("{0} = BitStreamReader({1})", stream2, stream)
+            cls._unpack_members(gen, pkr.underlying, stream2, scope, res)
+            gen.emit("{0}.close()", stream2)
+            return
+        size, members = fields
+        num = BitwiseVisitor.generate_int(gen, stream, size)
+        for member in members:
+            name = member[0]
+            obj = BitwiseVisitor.unpack_field(gen, member, num, scope)
+            if name:
+                gen.emit(store, res, name, scope.ctxvar, obj)
+                scope.names[name] = obj
+
+    @classmethod
+    def _pack_members(cls, gen, pkr, obj, stream, scope, getter):
+        for name, pkr2 in fuse_formatted(pkr.members):
+            if isinstance(pkr2, Embedded):
+                if type(pkr2.underlying) is Bitwise:
+                    cls._pack_bit_members(gen, pkr2.underlying, obj, stream, scope, getter)
+                else:
+                    cls._pack_members(gen, pkr2.underlying, obj, stream, scope, getter)
+                continue
+            if isinstance(pkr2, FusedFormatted):
+                objs = []
+                for name2 in name:
+                    obj2 = gen.var()
+                    gen.emit("{0} = {1}[{2!r}] = " + getter, obj2, scope.ctxvar, name2, obj)
+                    scope.names[name2] = obj2
+                    objs.append(obj2)
+                gen.emit("{0}.write({1}.pack({2}))", stream, gen.const(pkr2.fmt, "fmt"), ", ".join(objs))
+                continue
+            gen.current_name = name
+            if name:
+                obj2 = gen.var()
+                gen.emit("{0} = {1}[{2!r}] = " + getter, obj2, scope.ctxvar, name, obj)
+                scope.names[name] = obj2
+            else:
+                obj2 = "None"
+            _generate_packer(gen, pkr2, obj2, stream, scope)
+
+    @classmethod
+    def _pack_bit_members(cls, gen, pkr, obj, stream, scope, getter):
+        fields = pkr._get_fields()
+        if not fields:
+            stream2 = gen.var("bits")
+            gen.bit_streams.add(stream2)
+            gen.emit("{0} = BitStreamWriter({1})", stream2, stream)
+            cls._pack_members(gen, pkr.underlying, obj, stream2, scope, getter)
+            gen.emit("{0}.close()", stream2)
+            return
+        size, members = fields
+        parts = []
+        for member in members:
+            name = member[0]
+            if name:
+                obj2 = gen.var()
+                gen.emit("{0} = {1}[{2!r}] = " + getter, obj2, scope.ctxvar, name, obj)
+                scope.names[name] = obj2
+            else:
+                obj2 = "None"
+            parts.extend(BitwiseVisitor.pack_field(gen, member, obj2, scope))
+        BitwiseVisitor.generate_write(gen, stream, parts, size)
+
+    @classmethod
+    def generate_packer(cls, gen, pkr, obj, stream, scope):
+        if not cls._compilable(pkr):
+            return FallbackVisitor.generate_packer(gen, pkr, obj, stream, scope)
+        scope2 = Scope(gen.var("ctx"), scope)
+        gen.emit("{0} = {{'_' : {1}}}", scope2.ctxvar, scope.ctxvar)
+        if pkr.record_class is not None:
+            # fields are read as attributes; other mappings (e.g., dicts) are converted to records first
+            record = gen.const(pkr.record_class, "record")
+            obj2 = gen.var()
+            gen.emit("{0} = {1}", obj2, obj)
+            with gen.block("if {0}.__class__ is not {1}", obj2, record):
+                gen.emit("{0} = {1}({2})", obj2, record,
+                    ", ".join("%s[%r]" % (obj2, name) for name in pkr.record_class._fields))
+            cls._pack_members(gen, pkr, obj2, stream, scope2, "{3}.{2}")
+        else:
+            cls._pack_members(gen, pkr, obj, stream, scope2, "{3}[{2!r}]")
+
+    @classmethod
+    def _member_sizes(cls, gen, pkr, scope):
+        sizes = []
+        for _, pkr2 in pkr.members:
+            if isinstance(pkr2, Embedded) and type(pkr2.underlying) is Bitwise:
+                size = _generate_sum(cls._member_sizes(gen, pkr2.underlying.underlying, scope))
+                sizes.append(size // 8 if isinstance(size, six.integer_types) else "(%s // 8)" % (size,))
+            elif isinstance(pkr2, Embedded):
+                sizes.extend(cls._member_sizes(gen, pkr2.underlying, scope))
+            else:
+                sizes.append(_generate_sizeof(gen, pkr2, scope))
+        return sizes
+
+    @classmethod
+    def generate_sizeof(cls, gen, pkr, scope):
+        if not cls._compilable(pkr):
+            return FallbackVisitor.generate_sizeof(gen, pkr, scope)
+        scope2 = Scope(gen.var("ctx"), scope)
+        mark = len(gen.lines)
+        gen.emit("{0} = {{'_' : {1}}}", scope2.ctxvar, scope.ctxvar)
+        size = _generate_sum(cls._member_sizes(gen, pkr, scope2))
+        if isinstance(size, six.integer_types):
+            del gen.lines[mark:]
+        return size
+
+def _produces_value(pkr):
+    return not isinstance(pkr, Padding) and pkr is not noop
+
+# the interpreted Sequence skips members whose value is None; the values of members that are not of these types
+# are checked at runtime
+_never_none_types = (Formatted, Raw, Bits, Range, Struct, Sequence)
+
+@register(Sequence)
+class SequenceVisitor(BaseVisitor):
+    @classmethod
+    def _compilable(cls, pkr):
+        return all(_is_inlinable_embedding(mem, Sequence) for mem in pkr.members if isinstance(mem, Embedded))
+
+    @classmethod
+    def _unpack_members(cls, gen, pkr, stream, scope, res, index = None):
+        # once a member may have been skipped, the index of the following members is only known at runtime:
+        # ``index`` is then the variable holding it (and is returned)
+        for _, pkr2 in fuse_formatted(enumerate(pkr.members)):
+            if isinstance(pkr2, Embedded):
+                index = cls._unpack_members(gen, pkr2.underlying, stream, scope, res, index)
+                continue
+            if isinstance(pkr2, FusedFormatted):
+                for obj in FusedFormattedVisitor.generate_values(gen, pkr2, stream):
+                    gen.emit("{0}.append({1})", res, obj)
+                    cls._store_member(gen, scope, obj, index)
+                continue
+            gen.current_name = len(scope.names) if index is None else None
+            obj = _generate_unpacker(gen, pkr2, stream, scope)
+            if not _produces_value(pkr2) or obj == "None":
+                continue
+            if isinstance(pkr2, _never_none_types):
+                gen.emit("{0}.append({1})", res, obj)
+                cls._store_member(gen, scope, obj, index)
+                continue
+            if index is None:
+                index = gen.var("index")
+                gen.emit("{0} = {1!r}", index, len(scope.names))
+            with gen.block("if {0} is not None", obj):
+                gen.emit("{0}.append({1})", res, obj)
+                cls._store_member(gen, scope, obj, index)
+        return index
+
+    @classmethod
+    def _store_member(cls, gen, scope, obj, index):
+        if index is None:
+            index = len(scope.names)
+            gen.emit("{0}[{1!r}] = {2}", scope.ctxvar, index, obj)
+            scope.names[index] = obj
+        else:
+            # members with a runtime index are only looked up in the context dict
+            gen.emit("{0}[{1}] = {2}", scope.ctxvar, index, obj)
+            gen.emit("{0} += 1", index)
+
+    @classmethod
+    def generate_unpacker(cls, gen, pkr, stream, scope):
+        if not cls._compilable(pkr):
+            return FallbackVisitor.generate_unpacker(gen, pkr, stream, scope)
+        factory = pkr.container_factory or scope.factory
+        scope2 = Scope(gen.var("ctx"), scope, factory)
+        res = gen.var("obj")
+        gen.emit("{0} = {1}()", res, gen.literal(factory) if factory is not list else "list")
+        gen.emit("{0} = {{'_' : {1}}}", scope2.ctxvar, scope.ctxvar)
+        cls._unpack_members(gen, pkr, stream, scope2, res)
+        return res
+
+    @classmethod
+    def _pack_members(cls, gen, pkr, obj, stream, scope):
+        for _, pkr2 in fuse_formatted(enumerate(pkr.members)):
+            if isinstance(pkr2, Embedded):
+                cls._pack_members(gen, pkr2.underlying, obj, stream, scope)
+                continue
+            if isinstance(pkr2, FusedFormatted):
+                objs = []
+                for _ in pkr2.members:
+                    index = len(scope.names)
+                    obj2 = gen.var()
+                    gen.emit("{0} = {1}[{2!r}] = {3}[{2!r}]", obj2, scope.ctxvar, index, obj)
+                    scope.names[index] = obj2
+                    objs.append(obj2)
+                gen.emit("{0}.write({1}.pack({2}))", stream, gen.const(pkr2.fmt, "fmt"), ", ".join(objs))
+                continue
+            index = len(scope.names)
+            gen.current_name = index
+            if _produces_value(pkr2):
+                obj2 = gen.var()
+                gen.emit("{0} = {1}[{2!r}] = {3}[{2!r}]", obj2, scope.ctxvar, index, obj)
+                scope.names[index] = obj2
+            else:
+                obj2 = "None"
+            _generate_packer(gen, pkr2, obj2, stream, scope)
+
+    @classmethod
+    def generate_packer(cls, gen, pkr, obj, stream, scope):
+        if not cls._compilable(pkr):
+            return FallbackVisitor.generate_packer(gen, pkr, obj, stream, scope)
+        scope2 = Scope(gen.var("ctx"), scope)
+        gen.emit("{0} = {{'_' : {1}}}", scope2.ctxvar, scope.ctxvar)
+        cls._pack_members(gen, pkr, obj, stream, scope2)
+
+    @classmethod
+    def _member_sizes(cls, gen, pkr, scope):
+        sizes = []
+        for pkr2 in pkr.members:
+            if isinstance(pkr2, Embedded):
+                sizes.extend(cls._member_sizes(gen, pkr2.underlying, scope))
+            else:
+                sizes.append(_generate_sizeof(gen, pkr2, scope))
+        return sizes
+
+    @classmethod
+    def generate_sizeof(cls, gen, pkr, scope):
+        if not cls._compilable(pkr):
+            return FallbackVisitor.generate_sizeof(gen, pkr, scope)
+        scope2 = Scope(gen.var("ctx"), scope)
+        mark = len(gen.lines)
+        gen.emit("{0} = {{'_' : {1}}}", scope2.ctxvar, scope.ctxvar)
+        size = _generate_sum(cls._member_sizes(gen, pkr, scope2))
+        if isinstance(size, six.integer_types):
+            del gen.lines[mark:]
+        return size
+
+@register(Range)
+class RangeVisitor(BaseVisitor):
+    @classmethod
+    def _bounds(cls, gen, pkr, scope):
+        minconst, mincount = _constant_value(pkr.mincount)
+        maxconst, maxcount = _constant_value(pkr.maxcount)
+        if minconst and maxconst:
+            return repr(mincount or 0), "_maxsize" if maxcount is None else repr(maxcount)
+        mincount, maxcount = gen.var("min"), gen.var("max")
+        gen.emit("{0} = {1}", mincount, generate_expr(gen, pkr.mincount, scope))
+        with gen.block("if {0} is None", mincount):
+            gen.emit("{0} = 0", mincount)
+        gen.emit("{0} = {1}", maxcount, generate_expr(gen, pkr.maxcount, scope))
+        with gen.block("if {0} is None", maxcount):
+            gen.emit("{0} = _maxsize", maxcount)
+        return mincount, maxcount
+
+    @classmethod
+    def _expected(cls, mincount, maxcount):
+        return "({0} if {0} == {1} else '%s..%s' % ({0}, {1}))".format(mincount, maxcount)
+
+    @classmethod
+    def generate_unpacker(cls, gen, pkr, stream, scope):
+        mincount, maxcount = cls._bounds(gen, pkr, scope)
+        scope2 = Scope(gen.var("ctx"), scope, scope.factory)
+        res, index, item = gen.var("obj"), gen.var("i"), gen.var()
+        gen.emit("{0} = []", res)
+        gen.emit("{0} = {{'_' : {1}}}", scope2.ctxvar, scope.ctxvar)
+        with gen.block("for {0} in xrange({1})", index, maxcount):
+            with gen.block("try"):
+                obj = _generate_unpacker(gen, pkr.itempkr, stream, scope2)
+                gen.emit("{0} = {1}", item, obj)
+            with gen.block("except PackerError as ex"):
+                with gen.block("if {0} >= {1}", index, mincount):
+                    gen.emit("break")
+                gen.emit("raise RangeError('Expected %s items, found %s\\nUnderlying exception: %r' % "
+                    "({0}, {1}, ex))", cls._expected(mincount, maxcount), index)
+            gen.emit("{0}[{1}] = {2}", scope2.ctxvar, index, item)
+            gen.emit("{0}.append({1})", res, item)
+        return res
+
+    @classmethod
+    def generate_packer(cls, gen, pkr, obj, stream, scope):
+        mincount, maxcount = cls._bounds(gen, pkr, scope)
+        with gen.block("if len({0}) < {1} or len({0}) > {2}", obj, mincount, maxcount):
+            gen.emit("raise RangeError('Expected %s items, found %s' % ({0}, len({1})))",
+                cls._expected(mincount, maxcount), obj)
+        scope2 = Scope(gen.var("ctx"), scope)
+        index, item = gen.var("i"), gen.var()
+        gen.emit("{0} = {{'_' : {1}}}", scope2.ctxvar, scope.ctxvar)
+        with gen.block("for {0}, {1} in enumerate({2})", index, item, obj):
+            gen.emit("{0}[{1}] = {2}", scope2.ctxvar, index, item)
+            _generate_packer(gen, pkr.itempkr, item, stream, scope2)
+
+    @classmethod
+    def generate_sizeof(cls, gen, pkr, scope):
+        minconst, mincount = _constant_value(pkr.mincount)
+        maxconst, maxcount = _constant_value(pkr.maxcount)
+        if minconst and maxconst and mincount == maxcount and mincount is not None:
+            count = mincount
+        elif pkr.mincount is pkr.maxcount:
+            count = gen.var("n")
+            gen.emit("{0} = {1}", count, generate_expr(gen, pkr.mincount, scope))
+        else:
+            return FallbackVisitor.generate_sizeof(gen, pkr, scope)
+        scope2 = Scope(gen.var("ctx"), scope)
+        mark = len(gen.lines)
+        gen.emit("{0} = {{'_' : {1}}}", scope2.ctxvar, scope.ctxvar)
+        itemsize = _generate_sizeof(gen, pkr.itempkr, scope2)
+        if isinstance(itemsize, six.integer_types):
+            del gen.lines[mark:]
+            if isinstance(count, six.integer_types):
+                return count * itemsize
+        return "(%s * %s)" % (count, itemsize)
+
+@register(Switch)
+class SwitchVisitor(BaseVisitor):
+    """Every case becomes a function of its own, and the cases are dispatched through a dict of these functions,
+    so choosing a case costs a dict lookup and a call, regardless of the number of cases"""
+    @classmethod
+    def _generate_dispatch(cls, gen, pkr, scope, args, generate_case, bit_stream = False):
+        table = gen.var("cases")
+        funcs = {}
+        for val, pkr2 in list(pkr.cases.items()) + [(NotImplemented, pkr.default)]:
+            if pkr2 is NotImplemented:
+                continue
+            if id(pkr2) not in funcs:
+                funcs[id(pkr2)] = gen.var("case")
+                with gen.function(funcs[id(pkr2)], args, bit_stream):
+                    generate_case(pkr2, Scope("ctx", None, scope.factory))
+        gen.emit_global("{0} = {{{1}}}", table, ", ".join("%s : %s" % (gen.literal(val), funcs[id(pkr2)])
+            for val, pkr2 in pkr.cases.items()))
+        key = gen.var("key")
+        gen.emit("{0} = {1}", key, generate_expr(gen, pkr.expr, scope))
+        if pkr._hits is not None:
+            # only switches that count their hits when compiled pay for counting
+            hits = gen.var("hits")
+            gen.emit("{0} = {1}._hits", hits, gen.const(pkr, "switch"))
+            with gen.block("if {0} is not None", hits):
+                gen.emit("{0}[{1}] = {0}.get({1}, 0) + 1", hits, key)
+        if pkr.default is NotImplemented:
+            func = gen.var("func")
+            gen.emit("{0} = {1}.get({2})", func, table, key)
+            with gen.block("if {0} is None", func):
+                gen.emit("raise SwitchError('Cannot find a handler for %r' % ({0},))", key)
+            return func
+        return "{0}.get({1}, {2})".format(table, key, funcs[id(pkr.default)])
+
+    @classmethod
+    def generate_unpacker(cls, gen, pkr, stream, scope):
+        def generate_case(pkr2, scope2):
+            gen.emit("return {0}", _generate_unpacker(gen, pkr2, "stream", scope2))
+        func = cls._generate_dispatch(gen, pkr, scope, "stream, ctx, cfg", generate_case,
+            stream in gen.bit_streams)
+        res = gen.var()
+        gen.emit("{0} = {1}({2}, {3}, cfg)", res, func, stream, scope.ctxvar)
+        return res
+    @classmethod
+    def generate_packer(cls, gen, pkr, obj, stream, scope):
+        def generate_case(pkr2, scope2):
+            _generate_packer(gen, pkr2, "obj", "stream", scope2)
+        func = cls._generate_dispatch(gen, pkr, scope, "obj, stream, ctx, cfg", generate_case,
+            stream in gen.bit_streams)
+        gen.emit("{0}({1}, {2}, {3}, cfg)", func, obj, stream, scope.ctxvar)
+    @classmethod
+    def generate_sizeof(cls, gen, pkr, scope):
+        def generate_case(pkr2, scope2):
+            gen.emit("return {0}", _generate_sizeof(gen, pkr2, scope2))
+        func = cls._generate_dispatch(gen, pkr, scope, "ctx, cfg", generate_case)
+        res = gen.var()
+        gen.emit("{0} = {1}({2}, cfg)", res, func, scope.ctxvar)
+        return res
 
-def _generate_unpacker(pkr, streamvar, ctxvar):
-    return _get_visitor(pkr).generate_unpacker(pkr, streamvar, ctxvar)
+@register(Pointer)
+class PointerVisitor(BaseVisitor):
+    @classmethod
+    def generate_unpacker(cls, gen, pkr, stream, scope):
+        pos = gen.var("pos")
+        gen.emit("{0} = {1}.tell()", pos, stream)
+        gen.emit("{0}.seek({1})", stream, generate_expr(gen, pkr.offset, scope))
+        res = _generate_unpacker(gen, pkr.underlying, stream, scope)
+        gen.emit("{0}.seek({1})", stream, pos)
+        return res
+    @classmethod
+    def generate_packer(cls, gen, pkr, obj, stream, scope):
+        pos = gen.var("pos")
+        gen.emit("{0} = {1}.tell()", pos, stream)
+        gen.emit("{0}.seek({1})", stream, generate_expr(gen, pkr.offset, scope))
+        _generate_packer(gen, pkr.underlying, obj, stream, scope)
+        gen.emit("{0}.seek({1})", stream, pos)
+    @classmethod
+    def generate_sizeof(cls, gen, pkr, scope):
+        return 0
+
+@register(Bitwise)
+class BitwiseVisitor(BaseVisitor):
+    @classmethod
+    def generate_int(cls, gen, stream, size):
+        """Reads the ``size`` bytes of a bit struct (on the fast path) as a single integer"""
+        data = _generate_read(gen, stream, size)
+        num = gen.var("num")
+        gen.emit("{0} = {1}({2})", num, gen.const(bytes_to_int, "toint"), data)
+        return num
+    @classmethod
+    def generate_write(cls, gen, stream, parts, size):
+        gen.emit("{0}.write({1}({2}, {3!r}))", stream, gen.const(int_to_bytes, "tobytes"), " | ".join(parts), size)
 
-def generate(pkr, name):
-    with PythonModule(name) as mod:
-        _get_visitor(pkr).setup(pkr)
-        SEP()
-        with DEF("%s_unpack" % (name,), ["stream"]):
-            ctx = {}
-            res = _generate_unpacker(pkr, "stream", ctx)
-            STMT("return {0}", res)
-    return mod
+    @classmethod
+    def unpack_field(cls, gen, member, num, scope):
+        """Extracts a field (see ``_bit_members``) out of the integer ``num``, returning the variable holding it"""
+        name, shift, mask, adapters, leaf, submembers = member
+        if submembers is not None:
+            return cls._unpack_fields(gen, leaf, submembers, num, scope)
+        obj = gen.var()
+        gen.emit("{0} = ({1} >> {2!r}) & {3!r}", obj, num, shift, mask)
+        if isinstance(leaf, Raw):
+            gen.emit("{0} = {1}({0}, {2!r})", obj, gen.const(_to_bitstr, "bitstr"), leaf.length.value)
+        elif leaf.signed:
+            with gen.block("if {0} >> {1!r}", obj, leaf.width - 1):
+                gen.emit("{0} -= {1!r}", obj, 1 << leaf.width)
+        for adapter in adapters:
+            gen.emit("{0} = {1}({0}, {2})", obj, gen.const(adapter.decode, "dec"), scope.ctxvar)
+        return obj
 
+    @classmethod
+    def _unpack_fields(cls, gen, pkr, members, num, scope):
+        factory = pkr.container_factory or scope.factory
+        scope2 = Scope(gen.var("ctx"), scope, factory)
+        gen.emit("{0} = {{'_' : {1}}}", scope2.ctxvar, scope.ctxvar)
+        for member in members:
+            name = member[0]
+            obj = cls.unpack_field(gen, member, num, scope2)
+            if name:
+                gen.emit("{0}[{1!r}] = {2}", scope2.ctxvar, name, obj)
+                scope2.names[name] = obj
+        res = gen.var("obj")
+        if pkr.record_class is not None:
+            gen.emit("{0} = {1}({2})", res, gen.const(pkr.record_class, "record"),
+                ", ".join(scope2.names[name] for name in pkr.record_class._fields))
+        elif factory is Container:
+            gen.emit("{0} = Container(({1}))", res, "".join("(%r, %s), " % (name, scope2.names[name])
+                for name, _, _, _, _, _ in members if name))
+        else:
+            gen.emit("{0} = {1}()", res, gen.literal(factory))
+            for name, _, _, _, _, _ in members:
+                if name:
+                    gen.emit("{0}[{1!r}] = {2}", res, name, scope2.names[name])
+        return res
 
+    @classmethod
+    def pack_field(cls, gen, member, obj, scope):
+        """Returns the (integer) parts that a field, whose value ``obj`` holds, contributes to the bit struct"""
+        name, shift, mask, adapters, leaf, submembers = member
+        if submembers is not None:
+            return cls._pack_fields(gen, submembers, obj, scope)
+        for adapter in reversed(adapters):
+            obj2 = gen.var()
+            gen.emit("{0} = {1}({2}, {3})", obj2, gen.const(adapter.encode, "enc"), obj, scope.ctxvar)
+            obj = obj2
+        if isinstance(leaf, Raw):
+            with gen.block("if len({0}) != {1!r}", obj, leaf.length.value):
+                gen.emit("raise RawError('Expected buffer of length %d, got %d' % ({0!r}, len({1})))",
+                    leaf.length.value, obj)
+            return ["(%s(%s) << %d)" % (gen.const(bits_to_num, "bitnum"), obj, shift)]
+        if not leaf.signed:
+            with gen.block("if {0} < 0", obj):
+                gen.emit("raise ValueError('%r is negative, but field is not signed' % ({0},))", obj)
+        return ["((int(%s) & %d) << %d)" % (obj, mask, shift)]
 
-if __name__ == "__main__":
-    from construct3.lib import this
-    from construct3.numbers import byte
-    from construct3.adapters import LengthValue
-    #testpkr = Sequence(byte, byte, Sequence(byte, byte, Raw(this[0] + this[1] + this._[0] + this._[1])))
-    testpkr = Struct("len" / byte, "gth" / byte, "data" / Raw(this.len + this.gth))
-    mod = generate(testpkr, "test")
-    print testpkr
-    mod.dump("testpacker.py")
-    import testpacker
-    from io import BytesIO
-    data = BytesIO("\x03\x02helloXX")
-    #data = BytesIO("\x01\x01\x01\x02helloXX")
-    print testpacker.test_unpack(data)
+    @classmethod
+    def _pack_fields(cls, gen, members, obj, scope):
+        scope2 = Scope(gen.var("ctx"), scope)
+        gen.emit("{0} = {{'_' : {1}}}", scope2.ctxvar, scope.ctxvar)
+        parts = []
+        for member in members:
+            name = member[0]
+            if name:
+                obj2 = gen.var()
+                gen.emit("{0} = {1}[{2!r}] = {3}[{2!r}]", obj2, scope2.ctxvar, name, obj)
+                scope2.names[name] = obj2
+            else:
+                obj2 = "None"
+            parts.extend(cls.pack_field(gen, member, obj2, scope2))
+        return parts
 
+    @classmethod
+    def generate_unpacker(cls, gen, pkr, stream, scope):
+        fields = pkr._get_fields()
+        if fields:
+            size, members = fields
+            num = cls.generate_int(gen, stream, size)
+            return cls._unpack_fields(gen, pkr.underlying, members, num, scope)
+        stream2 = gen.var("bits")
+        gen.bit_streams.add(stream2)
+        gen.emit("{0} = BitStreamReader({1})", stream2, stream)
+        res = _generate_unpacker(gen, pkr.underlying, stream2, scope)
+        gen.emit("{0}.close()", stream2)
+        return res
+    @classmethod
+    def generate_packer(cls, gen, pkr, obj, stream, scope):
+        fields = pkr._get_fields()
+        if fields:
+            size, members = fields
+            cls.generate_write(gen, stream, cls._pack_fields(gen, members, obj, scope), size)
+            return
+        stream2 = gen.var("bits")
+        gen.bit_streams.add(stream2)
+        gen.emit("{0} = BitStreamWriter({1})", stream2, stream)
+        _generate_packer(gen, pkr.underlying, obj, stream2, scope)
+        gen.emit("{0}.close()", stream2)
+    @classmethod
+    def generate_sizeof(cls, gen, pkr, scope):
+        size = _generate_sizeof(gen, pkr.underlying, scope)
+        if isinstance(size, six.integer_types):
+            return size // 8
+        return "(%s // 8)" % (size,)
 
+#=======================================================================================================================
+class CompiledPacker(Packer):
+    """A packer whose ``_unpack``, ``_pack`` and ``_sizeof`` are generated python functions. It can be used
+    anywhere the original packer could"""
+    __slots__ = ["packer", "source", "_unpacker", "_packer", "_sizer"]
+    def __init__(self, packer, source, unpacker, packer_func, sizer):
+        self.packer = packer
+        self.source = source
+        self._unpacker = unpacker
+        self._packer = packer_func
+        self._sizer = sizer
+    def __repr__(self):
+        return "CompiledPacker(%r)" % (self.packer,)
+    def _unpack(self, stream, ctx, cfg):
+        return self._unpacker(stream, ctx, cfg)
+    def _pack(self, obj, stream, ctx, cfg):
+        self._packer(obj, stream, ctx, cfg)
+    def _sizeof(self, ctx, cfg):
+        return self._sizer(ctx, cfg)
 
+def generate(pkr):
+    """Generates the source of the ``unpack``, ``pack`` and ``sizeof`` functions of the given packer, returning
+    a ``(source, namespace)`` tuple"""
+    gen = CodeGenerator()
+    with gen.block("def unpack(stream, ctx, cfg)"):
+        gen.emit("return {0}", _generate_unpacker(gen, pkr, "stream", Scope("ctx")))
+    gen.emit("")
+    with gen.block("def pack(obj, stream, ctx, cfg)"):
+        _generate_packer(gen, pkr, "obj", "stream", Scope("ctx"))
+    gen.emit("")
+    with gen.block("def sizeof(ctx, cfg)"):
+        gen.emit("return {0}", _generate_sizeof(gen, pkr, Scope("ctx")))
+    return gen.source(), gen.namespace
 
+def compile_packer(pkr):
+    """Compiles the given packer into a :class:`CompiledPacker`"""
+    source, namespace = generate(pkr)
+    code = compile(source, "<compiled %s>" % (type(pkr).__name__,), "exec")
+    six.exec_(code, namespace)
+    return CompiledPacker(pkr, source, namespace["unpack"], namespace["pack"], namespace["sizeof"])
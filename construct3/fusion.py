@@ -0,0 +1,64 @@
+"""
+Fusion of the members of Structs and Sequences: runs of adjacent fixed-size numbers are read and written with
+a single struct format (used by Structs, Sequences, the compiler and the batch and vectorized paths)
+"""
+from construct3.packers import FusedFormatted
+from construct3.numbers import Formatted
+
+
+_byteorders = {"<" : "<", ">" : ">", "!" : ">", "=" : "=", "@" : "@"}
+
+def split_format(pkr):
+    """Returns the ``(byteorder, code)`` of a plain :class:`Formatted` packer, or ``None`` if the packer cannot
+    be fused. Single-byte formats have no byte order (``None``), so they may join any run"""
+    if not isinstance(pkr, Formatted):
+        return None
+    cls = type(pkr)
+    if (cls.decode is not Formatted.decode or cls.encode is not Formatted.encode or
+            cls._unpack is not Formatted._unpack or cls._pack is not Formatted._pack):
+        return None
+    fmt = pkr.FORMAT
+    if fmt[0] in _byteorders:
+        order, code = _byteorders[fmt[0]], fmt[1:]
+    else:
+        order, code = "@", fmt
+    if len(code) != 1:
+        return None
+    if pkr.fmt.size == 1:
+        return None, code
+    if order == "@":
+        # native alignment would insert padding between the fused fields
+        return None
+    return order, code
+
+def _flush(plan, run, order, minrun):
+    if len(run) >= minrun:
+        fmt = (order or "<") + "".join(code for _, _, code in run)
+        plan.append((tuple(name for name, _, _ in run), FusedFormatted(fmt, [pkr for _, pkr, _ in run])))
+    else:
+        plan.extend((name, pkr) for name, pkr, _ in run)
+
+def fuse_formatted(members, minrun = 2):
+    """Merges runs of (at least ``minrun``) consecutive, named :class:`Formatted` members that share the same
+    byte order into a single :class:`FusedFormatted` step. ``members`` is a sequence of ``(name, packer)``
+    pairs (a ``None`` name means the member is unnamed); the result is a list of the same form, in which the
+    names of a fused step are given as a tuple"""
+    plan = []
+    run = []
+    order = None
+    for name, pkr in members:
+        info = None if name is None else split_format(pkr)
+        if info is None:
+            _flush(plan, run, order, minrun)
+            plan.append((name, pkr))
+            run, order = [], None
+            continue
+        order2, code = info
+        if order2 is not None and order is not None and order2 != order:
+            _flush(plan, run, order, minrun)
+            run, order = [], None
+        if order2 is not None:
+            order = order2
+        run.append((name, pkr, code))
+    _flush(plan, run, order, minrun)
+    return plan
@@ -0,0 +1,220 @@
+"""
+Static layout analysis: classifies every packer as fixed-size, context-dependent or unknown, and computes the
+total size and the offsets of the fields of fixed-layout packers. The analysis runs once per packer (results
+are cached), so that ``sizeof()``, buffer preallocation and random access into arrays of fixed-size records
+do not need to walk the tree at runtime. Since the cases of a ``Switch`` may change, the layouts that depend on
+them are checked against the cases whenever they are taken from the cache.
+"""
+import operator
+import threading
+from functools import partial
+from weakref import WeakKeyDictionary, ref
+from six import get_unbound_function
+from construct3.packers import (Packer, Adapter, Raw, Struct, Sequence, Range, While, Switch, Bitwise, Embedded,
+    Pointer, FusedFormatted, CtxConst, noop, anchor)
+from construct3.numbers import Formatted
+from construct3.adapters import Computed
+from construct3.macros import _truth
+from construct3.lib.thisexpr import UniExpr
+from construct3.lib.buffers import BufferStream
+
+
+FIXED = "fixed"
+CONTEXTUAL = "contextual"
+UNKNOWN = "unknown"
+_severity = {FIXED : 0, CONTEXTUAL : 1, UNKNOWN : 2}
+
+class Layout(object):
+    """The result of the analysis. ``size`` is only known for ``FIXED`` layouts; ``fields`` maps member names
+    (or indices, for Sequences) to ``(offset, layout)`` for every member whose offset is known statically"""
+    __slots__ = ["kind", "size", "fields"]
+    def __init__(self, kind, size = None, fields = None):
+        self.kind = kind
+        self.size = size if kind == FIXED else None
+        self.fields = fields if fields is not None else {}
+    def __repr__(self):
+        if self.kind == FIXED:
+            return "Layout(fixed, size = %d)" % (self.size,)
+        return "Layout(%s)" % (self.kind,)
+    @property
+    def fixed(self):
+        return self.kind == FIXED
+    def offsetof(self, name):
+        return self.fields[name][0]
+
+def _worst(kinds):
+    return max(kinds, key = _severity.__getitem__) if kinds else FIXED
+
+
+_registry = {}
+def register(pkr_cls):
+    def deco(func):
+        _registry[pkr_cls] = func
+        return func
+    return deco
+
+# maps packers to ``(layout, switches)``, where ``switches`` lists the ``(switch, cases)`` that the layout was
+# computed from (see _cases)
+_cache = WeakKeyDictionary()
+_analyzing = threading.local()
+
+def _cases(switch):
+    return (id(switch.expr), id(switch.default), tuple((val, id(pkr)) for val, pkr in switch.cases.items()))
+
+def _unchanged(switches):
+    for switch, cases in switches:
+        switch = switch()
+        if switch is None or _cases(switch) != cases:
+            return False
+    return True
+
+def analyze(pkr):
+    """Returns the (cached) :class:`Layout` of the given packer"""
+    stack = getattr(_analyzing, "stack", None)
+    if stack is None:
+        stack = _analyzing.stack = []
+    entry = _cache.get(pkr)
+    if entry is None or (entry[1] and not _unchanged(entry[1])):
+        stack.append([])
+        try:
+            layout = _analyze(pkr)
+        finally:
+            switches = stack.pop()
+        if isinstance(pkr, Switch):
+            switches.append((ref(pkr), _cases(pkr)))
+        entry = _cache[pkr] = (layout, tuple(switches))
+    if stack:
+        stack[-1].extend(entry[1])
+    return entry[0]
+
+def depends_on_cases(pkr):
+    """Whether the layout of the given packer depends on the cases of a ``Switch`` (and so may change)"""
+    analyze(pkr)
+    return bool(_cache[pkr][1])
+
+def _analyze(pkr):
+    sizeof = get_unbound_function(type(pkr)._sizeof)
+    for cls in type(pkr).mro():
+        if cls in _registry:
+            # subclasses that compute their own size are not what the registered analysis describes
+            if get_unbound_function(cls._sizeof) is sizeof:
+                return _registry[cls](pkr)
+            return Layout(UNKNOWN)
+    return Layout(UNKNOWN)
+
+def _const(expr):
+    if isinstance(expr, CtxConst):
+        return True, expr.value
+    return False, None
+
+#=======================================================================================================================
+@register(Packer)
+def _analyze_unknown(pkr):
+    return Layout(UNKNOWN)
+
+@register(type(noop))
+@register(type(anchor))
+@register(Pointer)
+@register(Computed)
+def _analyze_empty(pkr):
+    return Layout(FIXED, 0)
+
+@register(Raw)
+def _analyze_raw(pkr):
+    isconst, length = _const(pkr.length)
+    return Layout(FIXED, length) if isconst else Layout(CONTEXTUAL)
+
+@register(Formatted)
+@register(FusedFormatted)
+def _analyze_formatted(pkr):
+    return Layout(FIXED, pkr.fmt.size)
+
+@register(Adapter)
+def _analyze_adapter(pkr):
+    return analyze(pkr.underlying)
+
+@register(Embedded)
+def _analyze_embedded(pkr):
+    return analyze(pkr.underlying)
+
+@register(Bitwise)
+def _analyze_bitwise(pkr):
+    layout = analyze(pkr.underlying)
+    if layout.kind == FIXED:
+        return Layout(FIXED, layout.size // 8)
+    return Layout(layout.kind)
+
+def _analyze_members(members):
+    kinds = []
+    fields = {}
+    offset = 0
+    for name, pkr in members:
+        layout = analyze(pkr)
+        if isinstance(pkr, Embedded) and offset is not None:
+            for name2, (offset2, layout2) in layout.fields.items():
+                fields[name2] = (offset + offset2, layout2)
+        elif name is not None and offset is not None:
+            fields[name] = (offset, layout)
+        kinds.append(layout.kind)
+        offset = offset + layout.size if offset is not None and layout.kind == FIXED else None
+    kind = _worst(kinds)
+    return Layout(kind, offset, fields)
+
+@register(Struct)
+def _analyze_struct(pkr):
+    return _analyze_members(pkr.members)
+
+@register(Sequence)
+def _analyze_sequence(pkr):
+    return _analyze_members(enumerate(pkr.members))
+
+@register(Range)
+def _analyze_range(pkr):
+    minconst, mincount = _const(pkr.mincount)
+    maxconst, maxcount = _const(pkr.maxcount)
+    item = analyze(pkr.itempkr)
+    if minconst and maxconst and mincount is not None and mincount == maxcount:
+        if item.kind == FIXED:
+            return Layout(FIXED, mincount * item.size)
+        return Layout(item.kind)
+    if pkr.mincount is pkr.maxcount:
+        return Layout(_worst([CONTEXTUAL, item.kind]))
+    return Layout(UNKNOWN)
+
+@register(While)
+def _analyze_while(pkr):
+    return Layout(UNKNOWN)
+
+def _exhaustive(pkr):
+    # whether every value of the switch's key has a packer: with a default, or for the boolean keys of If
+    if pkr.default is not NotImplemented:
+        return True
+    expr = pkr.expr
+    boolean = ((isinstance(expr, UniExpr) and expr.op is operator.truth) or
+        (isinstance(expr, partial) and expr.func is _truth))
+    return boolean and True in pkr.cases and False in pkr.cases
+
+@register(Switch)
+def _analyze_switch(pkr):
+    cases = list(pkr.cases.values())
+    if pkr.default is not NotImplemented:
+        cases.append(pkr.default)
+    layouts = [analyze(case) for case in cases]
+    if not layouts:
+        return Layout(CONTEXTUAL)
+    # otherwise, the size depends on whether the key has a case at all (sizeof raises if not)
+    if _exhaustive(pkr) and all(l.kind == FIXED for l in layouts) and len(set(l.size for l in layouts)) == 1:
+        return Layout(FIXED, layouts[0].size)
+    return Layout(_worst([CONTEXTUAL] + [l.kind for l in layouts]))
+
+#=======================================================================================================================
+def unpack_record(pkr, buf, index, zero_copy = False):
+    """Unpacks the ``index``-th record of a buffer holding an array of fixed-size records, without parsing the
+    records that precede it"""
+    layout = analyze(pkr)
+    if layout.kind != FIXED:
+        raise TypeError("%r does not have a fixed size (%s)" % (pkr, layout.kind))
+    stream = BufferStream(buf, index * layout.size)
+    if zero_copy:
+        return pkr.unpack(stream, zero_copy = True)
+    return pkr.unpack(stream.read(layout.size).tobytes())
@@ -0,0 +1,450 @@
+"""
+Lazy decoding: :class:`LazyStruct` returns a :class:`LazyContainer` proxy instead of a fully decoded
+``Container``. The proxy keeps a reference to the underlying buffer and decodes each field only when it is first
+accessed (the result is memoized). Fields whose offset is known statically (all the members before them have
+a fixed size, see :mod:`construct3.layout`) are located directly; fields that follow variable-size members
+require the sizes of those members, which are computed from their length prefixes when possible (see
+:func:`construct3.streaming.framer`), and otherwise by decoding them. With ``zero_copy`` the proxy shares the buffer
+being unpacked; from other streams, only the data of the record is read (copied), member by member if its size
+is not known up front.
+
+Likewise, :class:`LazyRange` (and :func:`LazyArray`) return a :class:`LazyList` view, whose items are decoded
+on access, at ``i * itemsize`` for fixed-size items or through an index of offsets for variable-size ones.
+
+Note that errors in fields or items that are never accessed (e.g., validation errors of adapters) are never
+raised.
+"""
+import sys
+from array import array
+from collections import OrderedDict
+from construct3.packers import Struct, Range, Embedded, PackerError, RawError, RangeError
+from construct3.layout import analyze
+from construct3.lib.buffers import BufferStream, CopyingBufferStream
+from construct3.lib.config import Config
+from construct3.lib.containers import Container
+from construct3.streaming import framer
+
+
+def _read_exactly(stream, size):
+    data = stream.read(size)
+    if len(data) != size:
+        raise RawError("Expected buffer of length %d, got %d" % (size, len(data)))
+    return data
+
+def _count_error(mincount, maxcount, found, ex):
+    return RangeError("Expected %s items, found %s\nUnderlying exception: %r" % (
+        mincount if mincount == maxcount else "%s..%s" % (mincount, maxcount), found, ex))
+
+
+class LazyStruct(Struct):
+    """
+    A :class:`Struct` that unpacks into a :class:`LazyContainer`. It cannot contain ``Embedded`` members
+    (and cannot be embedded itself); packing and ``sizeof()`` work exactly like those of a ``Struct``
+    """
+    __slots__ = ["_names", "_sizes", "_static", "_framers"]
+
+    def __init__(self, *members, **kwargs):
+        if "record" in kwargs:
+            raise TypeError("LazyStruct does not support records")
+        Struct.__init__(self, *members, **kwargs)
+        self._names = {}
+        self._framers = None
+        self._sizes = []
+        self._static = [0]
+        for i, (name, pkr) in enumerate(members):
+            if isinstance(pkr, Embedded):
+                raise TypeError("LazyStruct cannot contain Embedded members: %r" % (pkr,))
+            if name:
+                self._names[name] = i
+            layout = analyze(pkr)
+            self._sizes.append(layout.size if layout.fixed else None)
+        # the offsets of the members (relative to the struct), up to the first variable-size member
+        for size in self._sizes:
+            if size is None:
+                break
+            self._static.append(self._static[-1] + size)
+
+    def __repr__(self):
+        return "LazyStruct(%s)" % (", ".join(repr(m) for m in self.members),)
+
+    def _get_framers(self):
+        self._framers = [framer(pkr) if size is None else None for size, (_, pkr) in zip(self._sizes, self.members)]
+        return self._framers
+
+    def _measure(self, obj, index, offset):
+        # the size of a variable-size member at the given offset, if it can be computed without decoding it
+        frame = (self._framers or self._get_framers())[index]
+        if frame is None:
+            return None
+        return frame(obj._buffer[offset:], obj)
+
+    def _unpack(self, stream, ctx, cfg):
+        if cfg.embedded:
+            raise TypeError("LazyStruct cannot be embedded")
+        count = len(self.members)
+        if stream.__class__ is BufferStream:
+            # the buffer is shared, rather than copied
+            obj = LazyContainer(self, stream.buffer, stream.offset, ctx, BufferStream)
+            end = obj._offset(count)
+            if end > len(stream.buffer):
+                raise RawError("Expected buffer of length %d, got %d" % (end - stream.offset,
+                    len(stream.buffer) - stream.offset))
+            stream.offset = end
+            return obj
+        if len(self._static) > count:
+            data = _read_exactly(stream, self._static[-1])
+            return LazyContainer(self, memoryview(data), 0, ctx, CopyingBufferStream)
+        return self._read_through(stream, ctx)
+
+    def _read_through(self, stream, ctx):
+        # reads (copies) the record from the stream member by member, so that nothing past the record is read.
+        # variable-size members that cannot be measured are decoded from the stream (their value is memoized)
+        data = _read_exactly(stream, self._static[-1])
+        obj = LazyContainer(self, memoryview(data), 0, ctx, CopyingBufferStream)
+        obj._offsets = [len(data)]
+        for i in range(len(self._static) - 1, len(self.members)):
+            size = self._sizes[i]
+            if size is None:
+                size = self._measure(obj, i, len(data))
+            if size is None:
+                name, pkr = self.members[i]
+                start = stream.tell()
+                cfg = Config()
+                cfg.name = name
+                value = pkr._unpack(stream, obj, cfg)
+                size = stream.tell() - start
+                stream.seek(start)
+                if name:
+                    obj._values[name] = value
+            data += _read_exactly(stream, size)
+            obj._buffer = memoryview(data)
+            obj._offsets.append(len(data))
+        return obj
+
+
+class LazyContainer(object):
+    """
+    The result of unpacking a :class:`LazyStruct`: a read-mostly, ``Container``-like mapping whose fields are
+    decoded (and memoized) when first accessed, either as attributes or as items. It also serves as the
+    context of its members' expressions (so that, e.g., ``this.length`` only decodes the ``length`` field).
+    Iterating over its keys does not decode anything; ``values()``, ``items()``, ``==`` and ``repr()`` decode
+    all fields. Use :func:`materialize` to obtain a plain ``Container``
+    """
+    __slots__ = ["_packer", "_buffer", "_base", "_parent", "_stream_class", "_offsets", "_values"]
+
+    def __init__(self, packer, buffer, base, parent, stream_class):
+        self._packer = packer
+        self._buffer = buffer
+        self._base = base
+        self._parent = parent
+        self._stream_class = stream_class
+        self._offsets = None
+        self._values = {}
+
+    def _offset(self, index):
+        static = self._packer._static
+        if index < len(static):
+            return self._base + static[index]
+        offsets = self._offsets
+        if offsets is None:
+            offsets = self._offsets = [self._base + static[-1]]
+        first = len(static) - 1
+        sizes = self._packer._sizes
+        while first + len(offsets) <= index:
+            i = first + len(offsets) - 1
+            size = sizes[i]
+            if size is None:
+                size = self._packer._measure(self, i, offsets[-1])
+            if size is None:
+                self._decode(i)
+            else:
+                offsets.append(offsets[-1] + size)
+        return offsets[index - first]
+
+    def _decode(self, index):
+        name, pkr = self._packer.members[index]
+        stream = self._stream_class(self._buffer, self._offset(index))
+        cfg = Config()
+        cfg.name = name
+        obj = pkr._unpack(stream, self, cfg)
+        offsets = self._offsets
+        if offsets is not None and len(self._packer._static) - 1 + len(offsets) == index + 1:
+            offsets.append(stream.offset)
+        if name:
+            self._values[name] = obj
+        return obj
+
+    def __getitem__(self, name):
+        if name == "_":
+            return self._parent
+        try:
+            return self._values[name]
+        except KeyError:
+            pass
+        index = self._packer._names[name]
+        return self._decode(index)
+    def __setitem__(self, name, value):
+        self._values[name] = value
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+    def __setattr__(self, name, value):
+        if name in LazyContainer.__slots__:
+            object.__setattr__(self, name, value)
+        else:
+            self[name] = value
+
+    def __contains__(self, name):
+        return name in self._packer._names or name in self._values
+    def get(self, name, default = None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+    def __iter__(self):
+        for name, _ in self._packer.members:
+            if name:
+                yield name
+        for name in self._values:
+            if name not in self._packer._names:
+                yield name
+    def __len__(self):
+        return sum(1 for _ in self)
+    def keys(self):
+        return list(self)
+    def values(self):
+        return [self[name] for name in self]
+    def items(self):
+        return [(name, self[name]) for name in self]
+
+    def __eq__(self, other):
+        if not hasattr(other, "items"):
+            return NotImplemented
+        return dict(self.items()) == dict(other.items())
+    def __ne__(self, other):
+        res = self.__eq__(other)
+        return res if res is NotImplemented else not res
+    __hash__ = None
+    def __repr__(self):
+        return repr(materialize(self)).replace("Container", "LazyContainer", 1)
+
+
+try:
+    array("q")
+except ValueError:
+    _offset_array = list
+else:
+    def _offset_array():
+        return array("q")
+
+class LazyRange(Range):
+    """
+    A :class:`Range` that unpacks into a :class:`LazyList` view. ``cache_size`` bounds the LRU cache of
+    decoded items (0 disables it). Items only see the context of the range itself (not their siblings).
+
+    For fixed-size items, the number of items is computed from the counts (or from the size of the buffer, for
+    variable counts), without decoding anything. For variable-size items, the items must be scanned to find
+    where the range ends, which builds the index of offsets (the items are not kept). With ``scan = False`` the
+    index is instead built as items are visited, and the stream is left at the start of the range's data; this
+    is only useful when nothing follows the range (e.g., a huge top-level array)
+    """
+    __slots__ = ["cache_size", "scan"]
+    def __init__(self, mincount, maxcount, itempkr, cache_size = 256, scan = True):
+        Range.__init__(self, mincount, maxcount, itempkr)
+        self.cache_size = cache_size
+        self.scan = scan
+
+    def __repr__(self):
+        return "LazyRange(%r, %r, %r)" % (self.mincount, self.maxcount, self.itempkr)
+
+    def _unpack(self, stream, ctx, cfg):
+        mincount, maxcount = self._plan or self._get_plan()
+        mincount = mincount(ctx)
+        if mincount is None:
+            mincount = 0
+        maxcount = maxcount(ctx)
+        if maxcount is None:
+            maxcount = sys.maxsize
+        assert maxcount >= mincount
+        layout = analyze(self.itempkr)
+        itemsize = layout.size if layout.fixed and layout.size else None
+        if stream.__class__ is BufferStream:
+            # the buffer is shared, rather than copied
+            buffer, base, stream_class = stream.buffer, stream.offset, BufferStream
+        elif itemsize is None and self.scan:
+            return self._read_through(stream, {"_" : ctx}, mincount, maxcount)
+        else:
+            # only read (copy) as much as the range may span: all of the rest for greedy ranges and for unscanned
+            # items
+            limit = itemsize * maxcount if itemsize is not None and maxcount < sys.maxsize else -1
+            origin = stream.tell()
+            buffer, base, stream_class = memoryview(stream.read(limit)), 0, CopyingBufferStream
+        view = LazyList(self.itempkr, buffer, base, {"_" : ctx}, stream_class, itemsize, mincount, maxcount,
+            self.cache_size)
+        if itemsize is not None:
+            found = (len(buffer) - base) // itemsize
+            view._count = min(found, maxcount)
+            if view._count < mincount:
+                raise RangeError("Expected %s items, found %s" % (
+                    mincount if mincount == maxcount else "%s..%s" % (mincount, maxcount), found))
+            end = base + view._count * itemsize
+        elif self.scan:
+            end = view._offset(len(view))
+        else:
+            end = base
+        if stream_class is BufferStream:
+            stream.offset = end
+        elif end != len(buffer):
+            stream.seek(origin + end)
+        return view
+
+    def _read_through(self, stream, ctx, mincount, maxcount):
+        # scans the items through the stream to find where the range ends, then reads (copies) only its data
+        origin = stream.tell()
+        offsets = _offset_array()
+        offsets.append(0)
+        while len(offsets) - 1 < maxcount:
+            try:
+                self.itempkr._unpack(stream, ctx, Config())
+            except PackerError as ex:
+                if len(offsets) - 1 < mincount:
+                    raise _count_error(mincount, maxcount, len(offsets) - 1, ex)
+                break
+            offsets.append(stream.tell() - origin)
+        stream.seek(origin)
+        view = LazyList(self.itempkr, memoryview(_read_exactly(stream, offsets[-1])), 0, ctx, CopyingBufferStream,
+            None, mincount, maxcount, self.cache_size)
+        view._offsets = offsets
+        view._count = len(offsets) - 1
+        return view
+
+def LazyArray(count, itempkr, cache_size = 256, scan = True):
+    """A lazy :func:`construct3.Array` (see :class:`LazyRange`)"""
+    return LazyRange(count, count, itempkr, cache_size, scan)
+
+
+class LazyList(object):
+    """
+    The result of unpacking a :class:`LazyRange`: a read-only sequence view that supports ``len()``,
+    indexing, slicing (which returns a list) and iteration, decoding items as they are accessed. Recently
+    accessed items are kept in a bounded LRU cache
+    """
+    __slots__ = ["_itempkr", "_buffer", "_base", "_ctx", "_stream_class", "_itemsize", "_mincount", "_maxcount",
+        "_count", "_offsets", "_cache", "_cache_size"]
+
+    def __init__(self, itempkr, buffer, base, ctx, stream_class, itemsize, mincount, maxcount, cache_size):
+        self._itempkr = itempkr
+        self._buffer = buffer
+        self._base = base
+        self._ctx = ctx
+        self._stream_class = stream_class
+        self._itemsize = itemsize
+        self._mincount = mincount
+        self._maxcount = maxcount
+        self._count = None
+        self._offsets = None
+        self._cache = OrderedDict() if cache_size else None
+        self._cache_size = cache_size
+        if itemsize is None:
+            self._offsets = _offset_array()
+            self._offsets.append(base)
+
+    def _decode_at(self, offset):
+        stream = self._stream_class(self._buffer, offset)
+        return self._itempkr._unpack(stream, self._ctx, Config()), stream.offset
+
+    def _advance(self):
+        # decodes the first item past the index of offsets (of variable-size items), extending the index.
+        # returns (True, item), or (False, None) when the range ends there
+        offsets = self._offsets
+        i = len(offsets) - 1
+        if i >= self._maxcount:
+            self._count = i
+            return False, None
+        try:
+            obj, end = self._decode_at(offsets[i])
+        except PackerError as ex:
+            if i < self._mincount:
+                raise _count_error(self._mincount, self._maxcount, i, ex)
+            self._count = i
+            return False, None
+        offsets.append(end)
+        return True, obj
+
+    def _scan(self, index):
+        while self._count is None and len(self._offsets) <= index:
+            self._advance()
+
+    def _offset(self, index):
+        if self._itemsize is not None:
+            return self._base + index * self._itemsize
+        self._scan(index)
+        return self._offsets[index]
+
+    def __len__(self):
+        if self._count is None:
+            self._scan(sys.maxsize)
+        return self._count
+
+    def _remember(self, index, obj):
+        cache = self._cache
+        if cache is not None:
+            cache[index] = obj
+            if len(cache) > self._cache_size:
+                cache.popitem(last = False)
+        return obj
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if self._count is None:
+            self._scan(index)
+            if self._count is None and index == len(self._offsets) - 1:
+                found, obj = self._advance()
+                if found:
+                    return self._remember(index, obj)
+        if index < 0 or (self._count is not None and index >= self._count):
+            raise IndexError("LazyList index out of range")
+        cache = self._cache
+        if cache is not None and index in cache:
+            obj = cache.pop(index)
+            cache[index] = obj
+            return obj
+        return self._remember(index, self._decode_at(self._offset(index))[0])
+
+    def __iter__(self):
+        i = 0
+        while self._count is None or i < self._count:
+            try:
+                obj = self[i]
+            except IndexError:
+                break
+            yield obj
+            i += 1
+
+    def __eq__(self, other):
+        if not isinstance(other, (list, tuple, LazyList)):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+    def __ne__(self, other):
+        res = self.__eq__(other)
+        return res if res is NotImplemented else not res
+    __hash__ = None
+    def __repr__(self):
+        return "LazyList(<%s items of %r>)" % ("?" if self._count is None else self._count, self._itempkr)
+
+
+def materialize(obj):
+    """Decodes all the fields of a :class:`LazyContainer` or all the items of a :class:`LazyList` (recursively),
+    returning a plain ``Container`` or ``list``"""
+    if isinstance(obj, LazyContainer):
+        return Container((name, materialize(value)) for name, value in obj.items())
+    if isinstance(obj, LazyList):
+        return [materialize(item) for item in obj]
+    return obj
@@ -1,5 +1,11 @@
 from construct3.lib.thisexpr import this
 from construct3.lib.containers import Container
 
+def _reduce_singleton(self):
+    return type(self).__name__
+
 def singleton(cls):
+    """Replaces the class by its (only) instance. The instance is pickled (and copied) by reference to the
+    module-level name it is bound to, so unpickling it returns the same object"""
+    cls.__reduce__ = _reduce_singleton
     return cls()
@@ -1,4 +1,5 @@
 import six
+from binascii import hexlify, unhexlify
 
 
 empty = six.b("")
@@ -17,8 +18,9 @@ if six.PY3:
         return bits
     
     _bitarr = six.b("01")
+    _bit_chars = bytes(_bitarr[i & 1] for i in range(256))
     def bits_to_num(bits, signed = False):
-        bits = bytes(_bitarr[b & 1] for b in bits)
+        bits = bytes(bits).translate(_bit_chars)
         if signed and bits[0] == 49:
             bits = bits[1:]
             bias = 1 << len(bits)
@@ -45,16 +47,14 @@ if six.PY3:
     def int_to_byte(num):
         return bytes((num,)) 
 
+    def bytes_to_int(data):
+        return int.from_bytes(data, "big")
+    def int_to_bytes(num, size):
+        return num.to_bytes(size, "big")
+
     def swap_bytes(bits, bytesize=8):
-        i = 0
-        l = len(bits)
-        output = bytearray((l // bytesize) + bool(l & 7))
-        j = len(output) - 1
-        while i < l:
-            output[j] = bits[i : i + bytesize]
-            i += bytesize
-            j -= 1
-        return output
+        bits = bytes(bits)
+        return empty.join(reversed([bits[i : i + bytesize] for i in range(0, len(bits), bytesize)]))
 else:
     def num_to_bits(number, width = 32):
         number = int(number)
@@ -68,8 +68,9 @@ else:
             i -= 1
         return "".join(bits)
     
+    _bit_chars = "01" * 128
     def bits_to_num(bits, signed = False):
-        bits = "".join("01"[ord(b) & 1] for b in bits)
+        bits = str(bits).translate(_bit_chars)
         if signed and bits[0] == "1":
             bits = bits[1:]
             bias = 1 << len(bits)
@@ -95,6 +96,11 @@ else:
     byte_to_int = ord
     int_to_byte = chr
 
+    def bytes_to_int(data):
+        return int(hexlify(data), 16) if data else 0
+    def int_to_bytes(num, size):
+        return unhexlify("%0*x" % (size * 2, num)) if size else ""
+
     def swap_bytes(bits, bytesize=8):
         i = 0
         l = len(bits)
@@ -108,43 +114,77 @@ else:
 
 
 class BitStreamReader(object):
-    __slots__ = ["stream", "buffer"]
+    """
+    Reads bit fields (MSB first) from a byte stream. Whole bytes are read from the underlying stream into an
+    integer accumulator, from which fields are extracted with shifts and masks. ``read_int()`` returns a
+    field as an integer; ``read()`` returns it as a string of bits (one byte per bit), which is what
+    ``Raw`` and the like expect inside ``Bitwise``
+    """
+    __slots__ = ["stream", "acc", "count"]
     def __init__(self, stream):
         self.stream = stream
-        self.buffer = empty
+        self.acc = 0
+        self.count = 0
+    def _fill(self, count):
+        if count > self.count:
+            data = self.stream.read((count - self.count + 7) >> 3)
+            self.acc = (self.acc << (len(data) << 3)) | bytes_to_int(data)
+            self.count += len(data) << 3
+    def read_int(self, count):
+        self._fill(count)
+        if count > self.count:
+            raise EOFError("Expected %d bits, found %d" % (count, self.count))
+        self.count -= count
+        value = self.acc >> self.count
+        self.acc &= (1 << self.count) - 1
+        return value
     def read(self, count):
         if count == 0:
             return empty
-        if count > len(self.buffer):
-            extra = count - len(self.buffer)
-            data = self.stream.read(extra // 8 + bool(extra & 7))
-            self.buffer += bytes_to_bits(data)
-        buf = self.buffer[:count]
-        self.buffer = self.buffer[count:]
-        return buf
+        self._fill(count)
+        count = min(count, self.count)
+        return _to_bitstr(self.read_int(count), count)
     def close(self):
-        if self.buffer:
-            raise ValueError("Not all data has been consumed (it must sum up to whole bytes)", self.buffer)
+        if self.count:
+            raise ValueError("Not all data has been consumed (it must sum up to whole bytes)",
+                _to_bitstr(self.acc, self.count))
 
 class BitStreamWriter(object):
-    __slots__ = ["stream", "buffer"]
+    """
+    Writes bit fields (MSB first) to a byte stream, collecting them in an integer accumulator and writing
+    whole bytes out of it. ``write_int()`` takes a field as an integer, ``write()`` as a string of bits (one
+    byte per bit)
+    """
+    __slots__ = ["stream", "acc", "count"]
     def __init__(self, stream):
         self.stream = stream
-        self.buffer = empty
+        self.acc = 0
+        self.count = 0
+    def write_int(self, value, count):
+        self.acc = (self.acc << count) | (value & ((1 << count) - 1))
+        self.count += count
+        if self.count >= 4096:
+            self.flush()
     def write(self, bits):
-        self.buffer += bits
+        if bits:
+            self.write_int(bits_to_num(bits), len(bits))
     def flush(self, force_all = False):
-        if not self.buffer:
+        if not self.count:
             return
-        if force_all and len(self.buffer) & 7:
-            raise ValueError("Written data must sum up to whole bytes (got %r bits)" % (len(self.buffer,)))
-        count = (len(self.buffer) >> 3) << 3
-        bits = self.buffer[:count]
-        self.buffer = self.buffer[count:]
-        self.stream.write(bits_to_bytes(bits))
+        if force_all and self.count & 7:
+            raise ValueError("Written data must sum up to whole bytes (got %r bits)" % (self.count,))
+        size = self.count >> 3
+        if size:
+            self.count &= 7
+            self.stream.write(int_to_bytes(self.acc >> self.count, size))
+            self.acc &= (1 << self.count) - 1
     def close(self):
         self.flush(True)
 
+def _to_bitstr(value, count):
+    size = (count + 7) >> 3
+    return bytes_to_bits(int_to_bytes(value, size))[(size << 3) - count:]
+
 _printable = ["."] * 256
 _printable[32:128] = [chr(i) for i in range(32, 128)]
 
@@ -162,6 +202,78 @@ def hexdump(data, linesize = 16):
         dumped.append(fmt % (i, str(hextext), str(rawtext)))
     return "\n".join(dumped)
 
+_colors = ["\x1b[31m", "\x1b[32m", "\x1b[33m", "\x1b[34m", "\x1b[35m", "\x1b[36m"]
+_reset = "\x1b[0m"
+
+def annotated_hexdump(data, spans, linesize = 16, start = 0, end = None, color = False):
+    """
+    Like :func:`hexdump`, but marks the boundaries of the given fields: ``spans`` is a sequence of
+    ``(start, end, label)`` byte ranges, sorted by their start. Adjacent bytes of different fields are separated
+    by ``|`` rather than a space, and every line ends with the labels of the fields that start in it. With
+    ``color``, the bytes of consecutive fields are highlighted in alternating (ANSI) colors. Only the lines
+    covering ``data[start:end]`` are dumped, so that a region of a large buffer can be inspected
+    """
+    if end is None or end > len(data):
+        end = len(data)
+    first = start - start % linesize
+    offsetfmt = "%04X" if end < 65536 else "%08X"
+    # skip the fields that end before the dumped region
+    spans = list(spans)
+    lo, hi = 0, len(spans)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if spans[mid][0] < first:
+            lo = mid + 1
+        else:
+            hi = mid
+    index = lo
+    while index > 0 and spans[index - 1][1] > first:
+        index -= 1
+    dumped = []
+    for i in range(first, end, linesize):
+        line_end = min(i + linesize, end)
+        # the owning field (index into spans, or -1) and the boundaries of every byte in the line
+        owners = []
+        boundaries = set()
+        labels = []
+        j = index
+        while j < len(spans) and spans[j][0] < line_end:
+            s, e, label = spans[j]
+            if e > i:
+                boundaries.add(s)
+                boundaries.add(e)
+            if s >= i:
+                labels.append(str(label))
+            j += 1
+        for offset in range(i, line_end):
+            owner = -1
+            for k in range(index, j):
+                if spans[k][0] <= offset < spans[k][1]:
+                    owner = k
+                    break
+            owners.append(owner)
+        while index < len(spans) and spans[index][1] <= line_end and spans[index][0] < line_end:
+            index += 1
+        hexparts = []
+        rawparts = []
+        for offset, owner in zip(range(i, line_end), owners):
+            if offset > i:
+                hexparts.append("|" if offset in boundaries else " ")
+            byte = byte_to_int(data[offset])
+            text = "%02x" % (byte,)
+            char = _printable[byte]
+            if color and owner >= 0:
+                text = _colors[owner % len(_colors)] + text + _reset
+                char = _colors[owner % len(_colors)] + char + _reset
+            hexparts.append(text)
+            rawparts.append(char)
+        padding = " " * (3 * (linesize - (line_end - i)))
+        line = "%s   %s%s   %s" % (offsetfmt % (i,), "".join(hexparts), padding, "".join(rawparts))
+        if labels:
+            line += " " * (linesize - (line_end - i)) + "   " + ", ".join(labels)
+        dumped.append(line)
+    return "\n".join(dumped)
+
 
 if __name__ == "__main__":
     assert bits_to_num(num_to_bits(17, 8)) == 17 
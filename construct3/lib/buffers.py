@@ -0,0 +1,69 @@
+class BufferOverflowError(ValueError):
+    """Raised when writing past the end of the buffer of a :class:`BufferStream`"""
+    pass
+
+
+class BufferStream(object):
+    """
+    A file-like cursor over an in-memory buffer (``bytes``, ``bytearray``, ``memoryview`` or ``mmap.mmap``)
+    that tracks an integer offset instead of copying data around. ``read()`` returns ``memoryview`` slices of
+    the underlying buffer, ``write()`` assigns into it in place (the buffer must be writable and large
+    enough); ``tell()`` and ``seek()`` simply get and set the offset.
+
+    Note that the slices keep the underlying buffer exported, so an ``mmap`` cannot be closed while decoded
+    objects still reference it.
+    """
+    __slots__ = ["buffer", "offset"]
+    def __init__(self, buffer, offset = 0):
+        self.reset(buffer, offset)
+    def reset(self, buffer, offset = 0):
+        """Points the stream at another buffer, so that a single stream can be reused over many buffers"""
+        view = memoryview(buffer)
+        if view.ndim != 1 or view.itemsize != 1:
+            view = view.cast("B")
+        self.buffer = view
+        self.offset = offset
+    def __repr__(self):
+        return "BufferStream(<%d bytes>, offset = %d)" % (len(self.buffer), self.offset)
+    def __len__(self):
+        return len(self.buffer)
+
+    def read(self, count = -1):
+        start = self.offset
+        if count is None or count < 0:
+            end = len(self.buffer)
+        else:
+            end = min(start + count, len(self.buffer))
+        self.offset = end
+        return self.buffer[start:end]
+    def tell(self):
+        return self.offset
+    def seek(self, offset, whence = 0):
+        if whence == 1:
+            offset += self.offset
+        elif whence == 2:
+            offset += len(self.buffer)
+        if offset < 0:
+            raise ValueError("Negative seek position %d" % (offset,))
+        self.offset = offset
+        return offset
+    def reserve(self, count):
+        """Advances the offset by ``count`` bytes (to be written in place), returning the original offset"""
+        start = self.offset
+        end = start + count
+        if end > len(self.buffer):
+            raise BufferOverflowError("Buffer too small: need %d bytes at offset %d, buffer has %d" % (
+                count, start, len(self.buffer)))
+        self.offset = end
+        return start
+    def write(self, data):
+        start = self.reserve(len(data))
+        self.buffer[start:self.offset] = data
+
+
+class CopyingBufferStream(BufferStream):
+    """A :class:`BufferStream` whose ``read()`` returns ``bytes`` (copies) rather than ``memoryview`` slices,
+    so that the decoded values are the same as those decoded from a regular stream"""
+    __slots__ = ()
+    def read(self, count = -1):
+        return BufferStream.read(self, count).tobytes()
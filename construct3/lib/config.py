@@ -1,16 +1,37 @@
-from contextlib import contextmanager
+_missing = object()
 
 
 class Config(object):
-    @contextmanager
+    """
+    The state that is passed down the packer tree (e.g., ``container``, ``embedded``, ``name``); attributes that
+    were not set read as ``None``. ``set()`` pushes a frame and must be used in a ``with`` statement::
+
+        with cfg.set(container = obj, name = None):
+            ...
+
+    Leaving the block (normally or by an exception) pops the frame, restoring the attributes it set to their
+    previous values (or unsetting them); other attributes assigned within the block keep their new values. A
+    frame only saves the attributes it sets, on a plain stack in the config itself, so pushing one neither
+    copies the whole configuration nor allocates a context manager
+    """
+    __slots__ = ["__dict__", "_frames"]
+    def __init__(self):
+        self._frames = []
     def set(self, **kwargs):
-        prev = self.__dict__.copy()
-        self.__dict__.update(kwargs)
-        yield
-        self.__dict__ = prev
+        attrs = self.__dict__
+        self._frames.append([(name, attrs.get(name, _missing)) for name in kwargs])
+        attrs.update(kwargs)
+        return self
+    def __enter__(self):
+        return self
+    def __exit__(self, t, v, tb):
+        attrs = self.__dict__
+        for name, value in self._frames.pop():
+            if value is _missing:
+                attrs.pop(name, None)
+            else:
+                attrs[name] = value
     def __getattr__(self, name):
         return None
     def __delattr__(self, name):
         self.__dict__.pop(name, None)
-
-
@@ -1,59 +1,172 @@
-import itertools
+import sys
+import keyword
 import six
-_counter = itertools.count()
+from six.moves import copyreg
 
-class Container(dict):
-    __slots__ = ["__order__"]
+if sys.version_info >= (3, 7):
+    _ordered_dict = dict
+else:
+    from collections import OrderedDict as _ordered_dict
+
+# the pure-Python OrderedDict (of Python 2) keeps its linked list in private attributes, which are not items
+_private_prefix = "_OrderedDict__"
+
+
+class Container(_ordered_dict):
+    """An ordered dict whose items can also be accessed as attributes. It relies on the insertion order of the
+    underlying dict, so insertion is O(1) and iteration is linear"""
+    __slots__ = ()
     def __init__(self, iterable = (), **kwargs):
-        dict.__setattr__(self, "__order__", {})
+        _ordered_dict.__init__(self)
         self.update(iterable, **kwargs)
-    def __setitem__(self, key, val):
-        dict.__setitem__(self, key, val)
-        if key not in self.__order__:
-            self.__order__[key] = six.next(_counter)
-    def __delitem__(self, key):
-        dict.__delitem__(self, key)
-        del self.__order__[key]
-    def update(self, iterable, **kwargs):
-        for k, v in iterable:
-            self[k] = v
-        for k, v in kwargs.items():
-            self[k] = v
-    def pop(self, key, *default):
-        dict.pop(self, key, *default)
-        self.__order__.pop(key, None)
-    __getattr__ = dict.__getitem__
-    __setattr__ = __setitem__
-    __delattr__ = __delitem__
+    def update(self, iterable = (), **kwargs):
+        _ordered_dict.update(self, iterable, **kwargs)
+    def __getattr__(self, name):
+        if name.startswith(_private_prefix):
+            raise AttributeError(name)
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+    def __setattr__(self, name, value):
+        if name.startswith(_private_prefix):
+            _ordered_dict.__setattr__(self, name, value)
+        else:
+            self[name] = value
+    def __delattr__(self, name):
+        if name.startswith(_private_prefix):
+            _ordered_dict.__delattr__(self, name)
+            return
+        try:
+            del self[name]
+        except KeyError:
+            raise AttributeError(name)
+    def __repr__(self):
+        if not self:
+            return "%s()" % (self.__class__.__name__,)
+        attrs = "\n  ".join("%s = %s" % (k, "\n  ".join(repr(v).splitlines()))
+            for k, v in self.items())
+        return "%s:\n  %s" % (self.__class__.__name__, attrs)
+
+
+class _RecordMeta(type):
+    pass
+
+@six.add_metaclass(_RecordMeta)
+class Record(object):
+    """
+    Base class of slot-based records, whose field names are known up front (see :func:`record_class`). Records
+    keep their fields in ``__slots__``, so they take a fraction of the memory of a :class:`Container`, while
+    supporting the same attribute and item access
+    """
+    __slots__ = ()
+    _fields = ()
+    def __init__(self, *args, **kwargs):
+        for name, value in zip(self._fields, args):
+            object.__setattr__(self, name, value)
+        for name, value in kwargs.items():
+            self[name] = value
+
+    def __getitem__(self, name):
+        try:
+            return getattr(self, name)
+        except (AttributeError, TypeError):
+            raise KeyError(name)
+    def __setitem__(self, name, value):
+        if name not in self._fields:
+            raise KeyError(name)
+        object.__setattr__(self, name, value)
+    def __delitem__(self, name):
+        try:
+            object.__delattr__(self, name)
+        except (AttributeError, TypeError):
+            raise KeyError(name)
+    def __contains__(self, name):
+        return name in self._fields and hasattr(self, name)
+    def get(self, name, default = None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
     def __iter__(self):
-        items = list(self.__order__.items())
-        items.sort(key = lambda item: item[1])
-        return (k for k, _ in items)
+        return (name for name in self._fields if hasattr(self, name))
+    def __len__(self):
+        return sum(1 for _ in self)
     def keys(self):
-        return list(iter(self))
+        return list(self)
     def values(self):
-        return [self[k] for k in self]
+        return [getattr(self, name) for name in self]
     def items(self):
-        for k in self:
-            yield k, self[k]
-    iterkeys = keys
-    itervalues = values
-    iteritems = items
+        return [(name, getattr(self, name)) for name in self]
+
+    def __eq__(self, other):
+        if not hasattr(other, "items"):
+            return NotImplemented
+        return dict(self.items()) == dict(other.items())
+    def __ne__(self, other):
+        res = self.__eq__(other)
+        return res if res is NotImplemented else not res
+    __hash__ = None
+    def __getstate__(self):
+        return self.items()
+    def __setstate__(self, state):
+        for name, value in state:
+            object.__setattr__(self, name, value)
     def __repr__(self):
-        if not self:
+        if not len(self):
             return "%s()" % (self.__class__.__name__,)
-        attrs = "\n  ".join("%s = %s" % (k, "\n  ".join(repr(v).splitlines())) 
+        attrs = "\n  ".join("%s = %s" % (k, "\n  ".join(repr(v).splitlines()))
             for k, v in self.items())
         return "%s:\n  %s" % (self.__class__.__name__, attrs)
 
+def _is_identifier(name):
+    return (isinstance(name, six.string_types) and not keyword.iskeyword(name) and
+        (name.isidentifier() if six.PY3 else name.replace("_", "a").isalnum() and not name[0].isdigit()))
+
+def record_class(name, fields):
+    """Generates a :class:`Record` subclass with the given field names, whose ``__init__`` sets all fields in a
+    single call. Field names must be valid identifiers that do not collide with the attributes of
+    :class:`Record` (e.g., ``keys``); otherwise ``ValueError`` is raised"""
+    fields = tuple(fields)
+    for f in fields:
+        if not _is_identifier(f) or hasattr(Record, f) or f.startswith("__"):
+            raise ValueError("%r cannot be used as a record field name" % (f,))
+    if len(set(fields)) != len(fields):
+        raise ValueError("Duplicate field names: %r" % (fields,))
+    source = "def __init__(self, %s):\n    %s\n" % (
+        ", ".join("%s = _missing" % (f,) for f in fields),
+        "\n    ".join("if %s is not _missing: self.%s = %s" % (f, f, f) for f in fields) or "pass")
+    scope = {"_missing" : _missing}
+    six.exec_(source, scope)
+    return type(str(name), (Record,), {"__slots__" : fields, "_fields" : fields, "__init__" : scope["__init__"]})
+
+_missing = object()
+
+_record_classes = {}
+
+def _rebuild_record_class(name, fields):
+    # unpickled (generated) record classes are shared by all the records that refer to them
+    key = (name, fields)
+    try:
+        return _record_classes[key]
+    except KeyError:
+        cls = _record_classes[key] = record_class(name, fields)
+        return cls
+
+def _reduce_record_class(cls):
+    module = sys.modules.get(cls.__module__)
+    if getattr(module, cls.__name__, None) is cls:
+        return cls.__name__
+    # generated by record_class(), so it's rebuilt from its name and fields
+    return (_rebuild_record_class, (cls.__name__, cls._fields))
+
+copyreg.pickle(_RecordMeta, _reduce_record_class)
+
 
 if __name__ == "__main__":
     c = Container(aa = 6, b = 7, c = Container(d = 8, e = 9, f = 10))
     del c.aa
     c.aa = 0
     c.xx = Container()
-    print [c, c, c]
-
-
-
-
+    print ([c, c, c])
@@ -1,4 +1,5 @@
 import operator
+import six
 
 operator_truediv = operator.truediv if hasattr(operator, "truediv") else operator.div
 
@@ -107,48 +108,162 @@ class ExprMixin(object):
 
 
 class UniExpr(ExprMixin):
-    __slots__ = ["op", "operand"]
+    __slots__ = ["op", "operand", "_compiled"]
     def __init__(self, op, operand):
         self.op = op
         self.operand = operand
+        self._compiled = None
     def __repr__(self):
-        return "%s%r" % (opnames[self.op], self.operand)
+        if self.op in opnames:
+            return "%s%r" % (opnames[self.op], self.operand)
+        return "%s(%r)" % (getattr(self.op, "__name__", self.op), self.operand)
+    def __reduce__(self):
+        return (UniExpr, (self.op, self.operand))
     def __call__(self, context):
-        operand = self.operand(context) if callable(self.operand) else self.operand
-        return self.op(operand)
+        func = self._compiled
+        if func is None:
+            func = compile_expr(self)
+        return func(context)
 
 
 class BinExpr(ExprMixin):
-    __slots__ = ["op", "lhs", "rhs"]
+    __slots__ = ["op", "lhs", "rhs", "_compiled"]
     def __init__(self, op, lhs, rhs):
         self.op = op
         self.lhs = lhs
         self.rhs = rhs
+        self._compiled = None
     def __repr__(self):
         return "(%r %s %r)" % (self.lhs, opnames[self.op], self.rhs)
+    def __reduce__(self):
+        return (BinExpr, (self.op, self.lhs, self.rhs))
     def __call__(self, context):
-        lhs = self.lhs(context) if callable(self.lhs) else self.lhs
-        rhs = self.rhs(context) if callable(self.rhs) else self.rhs
-        return self.op(lhs, rhs)
+        func = self._compiled
+        if func is None:
+            func = compile_expr(self)
+        return func(context)
 
 
 class Path(ExprMixin):
-    __slots__ = ["__name", "__parent"]
+    __slots__ = ["__name", "__parent", "_compiled"]
     def __init__(self, name, parent = None):
         self.__name = name
         self.__parent = parent
+        self._compiled = None
     def __repr__(self):
         if self.__parent is None:
             return self.__name
         return "%r.%s" % (self.__parent, self.__name)
+    def __reduce__(self):
+        return (Path, (self.__name, self.__parent))
     def __call__(self, context):
-        if self.__parent is None:
-            return context
-        context2 = self.__parent(context)
-        return context2[self.__name]
+        func = self._compiled
+        if func is None:
+            func = compile_expr(self)
+        return func(context)
     def __getattr__(self, name):
+        if name.startswith("__") and name.endswith("__"):
+            # don't hide protocol lookups (e.g., pickle's ``__getstate__``) behind paths
+            raise AttributeError(name)
+        return Path(name, self)
+    def __getitem__(self, name):
         return Path(name, self)
-    __getitem__ = __getattr__
+
+
+#=======================================================================================================================
+# compilation
+#=======================================================================================================================
+_binsyms = {
+    operator.add : "+",
+    operator.sub : "-",
+    operator.mul : "*",
+    operator_truediv : "/",
+    operator.floordiv : "//",
+    operator.mod : "%",
+    operator.pow : "**",
+    operator.xor : "^",
+    operator.lshift : "<<",
+    operator.rshift : ">>",
+    operator.and_ : "&",
+    operator.or_ : "|",
+    operator.gt : ">",
+    operator.ge : ">=",
+    operator.lt : "<",
+    operator.le : "<=",
+    operator.eq : "==",
+    operator.ne : "!=",
+}
+_unisyms = {
+    operator.neg : "-",
+    operator.pos : "+",
+    operator.not_ : "not ",
+    operator.inv : "~",
+}
+_literal_types = (bool, type(None), six.binary_type, six.text_type) + six.integer_types
+
+class _Folded(object):
+    # a subexpression that does not depend on the context, and so was evaluated at compile time
+    __slots__ = ["value"]
+    def __init__(self, value):
+        self.value = value
+
+def _generate(expr, names):
+    """Returns either the python source of the expression (over ``ctx``), or a ``_Folded`` constant"""
+    if isinstance(expr, Path):
+        elems = []
+        while expr._Path__parent is not None:
+            elems.append(expr._Path__name)
+            expr = expr._Path__parent
+        return "ctx" + "".join("[%r]" % (e,) for e in reversed(elems))
+    elif isinstance(expr, (BinExpr, UniExpr)):
+        operands = [expr.lhs, expr.rhs] if isinstance(expr, BinExpr) else [expr.operand]
+        operands = [_generate(e, names) for e in operands]
+        if all(isinstance(e, _Folded) for e in operands):
+            try:
+                return _Folded(expr.op(*[e.value for e in operands]))
+            except Exception:
+                # leave it to runtime, so the error is raised where it would have been
+                pass
+        operands = [_source(e, names) for e in operands]
+        if isinstance(expr, UniExpr):
+            if expr.op in _unisyms:
+                return "(%s%s)" % (_unisyms[expr.op], operands[0])
+        elif expr.op in _binsyms:
+            return "(%s %s %s)" % (operands[0], _binsyms[expr.op], operands[1])
+        return "%s(%s)" % (_name(expr.op, names), ", ".join(operands))
+    elif callable(expr):
+        return "%s(ctx)" % (_name(expr, names),)
+    else:
+        return _Folded(expr)
+
+def _name(obj, names):
+    name = "_k%d" % (len(names),)
+    names[name] = obj
+    return name
+
+def _source(code, names):
+    if not isinstance(code, _Folded):
+        return code
+    if type(code.value) not in _literal_types:
+        return _name(code.value, names)
+    source = repr(code.value)
+    return "(%s)" % (source,) if source.startswith("-") else source
+
+def compile_expr(expr):
+    """Compiles the given contextual expression into a single function of the context (e.g.,
+    ``this.a + this.b * 2`` becomes ``lambda ctx: (ctx['a'] + (ctx['b'] * 2))``), folding the subexpressions
+    that do not depend on the context. The function is cached on the expression, so it is generated only once.
+    Other callables are returned as they are"""
+    if not isinstance(expr, (Path, BinExpr, UniExpr)):
+        return expr
+    func = expr._compiled
+    if func is None:
+        names = {}
+        source = "lambda ctx: %s" % (_source(_generate(expr, names), names),)
+        func = eval(source, names)
+        func.source = source
+        expr._compiled = func
+    return func
 
 
 # let the magic begin!
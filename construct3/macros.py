@@ -1,11 +1,22 @@
+import operator
+from functools import partial
 from six import b
 from construct3.packers import Switch, _contextify, Range, Raw, Struct, Bitwise
+from construct3.lib.thisexpr import ExprMixin, UniExpr
 from construct3.adapters import LengthValue, StringAdapter, Mapping, Padding
 
 
+def _truth(cond, ctx):
+    return bool(cond(ctx))
+
 def If(cond, thenpkr, elsepkr):
-    return Switch(lambda ctx, cond = _contextify(cond): bool(cond(ctx)), 
-        {True : thenpkr, False : elsepkr})
+    # expressions are wrapped by an expression (so the key compiles along with the condition); other callables
+    # by a partial of a module-level function, which (unlike a lambda) keeps the switch picklable
+    if isinstance(cond, ExprMixin):
+        key = UniExpr(operator.truth, cond)
+    else:
+        key = partial(_truth, _contextify(cond))
+    return Switch(key, {True : thenpkr, False : elsepkr})
 
 def PascalString(lengthpkr, encoding = "utf8"):
     return StringAdapter(LengthValue(lengthpkr), encoding)
@@ -1,8 +1,9 @@
 import sys
 import struct as _struct
 from construct3.lib import singleton
-from construct3.packers import Adapter, Raw, Sequence
-from construct3.lib.binutil import num_to_bits, swap_bytes, bits_to_num
+from construct3.packers import Adapter, Raw, Sequence, RawError
+from construct3.lib.buffers import BufferStream
+from construct3.lib.binutil import num_to_bits, swap_bytes, bits_to_num, BitStreamReader, BitStreamWriter
 from construct3.lib.containers import Container
 
 
@@ -18,6 +19,20 @@ class Formatted(Adapter):
         return self.fmt.pack(obj)
     def decode(self, obj, ctx):
         return self.fmt.unpack(obj)[0]
+    def _unpack(self, stream, ctx, cfg):
+        if stream.__class__ is not BufferStream:
+            return self.decode(self.underlying._unpack(stream, ctx, cfg), ctx)
+        offset = stream.offset
+        size = self.fmt.size
+        if offset + size > len(stream.buffer):
+            raise RawError("Expected buffer of length %d, got %d" % (size, len(stream.buffer) - offset))
+        stream.offset = offset + size
+        return self.fmt.unpack_from(stream.buffer, offset)[0]
+    def _pack(self, obj, stream, ctx, cfg):
+        if stream.__class__ is BufferStream:
+            self.fmt.pack_into(stream.buffer, stream.reserve(self.fmt.size), obj)
+        else:
+            self.underlying._pack(self.encode(obj, ctx), stream, ctx, cfg)
 
 @singleton
 class uint8(Formatted):
@@ -131,6 +146,23 @@ class Bits(Adapter):
         if self.swapped:
             obj = swap_bytes(obj, bytesize = self.bytesize)
         return bits_to_num(obj, signed = self.signed)
+    def _unpack(self, stream, ctx, cfg):
+        # inside Bitwise, read the field directly as an integer
+        if stream.__class__ is not BitStreamReader or self.swapped:
+            return Adapter._unpack(self, stream, ctx, cfg)
+        try:
+            obj = stream.read_int(self.width)
+        except EOFError as ex:
+            raise RawError(str(ex))
+        if self.signed and obj >> (self.width - 1):
+            obj -= 1 << self.width
+        return obj
+    def _pack(self, obj, stream, ctx, cfg):
+        if stream.__class__ is not BitStreamWriter or self.swapped:
+            return Adapter._pack(self, obj, stream, ctx, cfg)
+        if obj < 0 and not self.signed:
+            raise ValueError("%r is negative, but field is not signed" % (obj,))
+        stream.write_int(int(obj), self.width)
 
 bit = Bits(1)
 nibble = Bits(4)
@@ -150,13 +182,17 @@ class TwosComplement(Adapter):
     def decode(self, obj, ctx):
         return obj - self.maxval if obj & self.midval else obj
 
-uint24b = Adapter(Sequence(uint8, uint16b), 
-    decode = lambda obj, _: (obj[0] << 16) | obj[1],
-    encode = lambda obj, _: (obj >> 16, obj & 0xffff))
+# module-level functions (rather than lambdas), so that these packers can be pickled
+def _join_uint24(obj, _):
+    return (obj[0] << 16) | obj[1]
+def _split_uint24(obj, _):
+    return (obj >> 16, obj & 0xffff)
+def _swap_uint24(obj, _):
+    return ((obj >> 16) & 0xff) | (obj & 0xff00) | ((obj & 0xff) << 16)
+
+uint24b = Adapter(Sequence(uint8, uint16b), decode = _join_uint24, encode = _split_uint24)
 sint24b = TwosComplement(uint24b, 24)
-uint24l = Adapter(uint24b, 
-    decode = lambda obj, _: ((obj >> 16) & 0xff) | (obj & 0xff00) | ((obj & 0xff) << 16),
-    encode = lambda obj, _: ((obj >> 16) & 0xff) | (obj & 0xff00) | ((obj & 0xff) << 16))
+uint24l = Adapter(uint24b, decode = _swap_uint24, encode = _swap_uint24)
 sint24l = TwosComplement(uint24l, 24)
 
 class MaskedInteger(Adapter):
@@ -1,15 +1,21 @@
 from construct3.lib import singleton
 import sys
-from construct3.lib.binutil import BitStreamReader, BitStreamWriter
-from construct3.lib.containers import Container
+import struct as _struct
+from operator import getitem as _getitem
+from weakref import WeakKeyDictionary
+from construct3.lib.binutil import (BitStreamReader, BitStreamWriter, bytes_to_int, int_to_bytes, bits_to_num,
+    _to_bitstr)
+from construct3.lib.containers import Container, Record, record_class
 from construct3.lib.config import Config
+from construct3.lib.buffers import BufferStream
+from construct3.lib.thisexpr import compile_expr
 try:
     from io import BytesIO
 except ImportError:
     from cStringIO import StringIO as BytesIO
 
 import six
-from six.moves import xrange
+from six.moves import xrange, copyreg
 
 
 class PackerError(Exception):
@@ -22,25 +28,112 @@ class SwitchError(PackerError):
     pass
 
 
+_static_sizes = WeakKeyDictionary()
+
+# attributes that are derived lazily from the others (execution plans), which are not pickled
+_derived_attributes = ("_plan", "_fields", "_hits", "_framers")
+
+def _reduce_struct_format(fmt):
+    return (_struct.Struct, (fmt.format,))
+
+copyreg.pickle(_struct.Struct, _reduce_struct_format)
+
 class Packer(object):
-    __slots__ = ()
+    __slots__ = ["__weakref__"]
+    def __getstate__(self):
+        state = dict(getattr(self, "__dict__", ()))
+        for cls in type(self).__mro__:
+            for name in getattr(cls, "__slots__", ()):
+                if name in ("__weakref__", "__dict__") or name in _derived_attributes or name in state:
+                    continue
+                try:
+                    state[name] = getattr(self, name)
+                except AttributeError:
+                    pass
+        return state
+    def __setstate__(self, state):
+        for name in _derived_attributes:
+            if hasattr(type(self), name):
+                setattr(self, name, None)
+        for name, value in state.items():
+            setattr(self, name, value)
     def pack(self, obj):
         stream = BytesIO()
         self._pack(obj, stream, {}, Config())
         return stream.getvalue()
+    def pack_many(self, objs, errors = "capture", lazy = False):
+        """Packs each of the given objects, reusing a single stream and config across the batch. Returns a list
+        of byte strings, or a generator with ``lazy``; objects that fail to pack are replaced by their exceptions
+        unless ``errors = "raise"`` (see :func:`construct3.batch.pack_many`)"""
+        from construct3.batch import pack_many, iter_pack_many
+        return (iter_pack_many if lazy else pack_many)(self, objs, errors)
     def pack_to_stream(self, obj, stream):
         self._pack(obj, stream, {}, Config())
+    def pack_into(self, obj, buffer, offset = 0):
+        """Packs the object directly into the given writable buffer (``bytearray``, ``memoryview``, ``mmap``),
+        starting at ``offset``. Returns the number of bytes written"""
+        stream = BufferStream(buffer, offset)
+        self._pack(obj, stream, {}, Config())
+        return stream.offset - offset
     def _pack(self, obj, stream, ctx, cfg):
         raise NotImplementedError()
 
-    def unpack(self, buf_or_stream):
-        if not hasattr(buf_or_stream, "read"):
+    def unpack(self, buf_or_stream, zero_copy = False):
+        """Unpacks an object from the given buffer or stream. With ``zero_copy``, the buffer (``bytes``,
+        ``bytearray``, ``memoryview`` or ``mmap``) is accessed through a :class:`BufferStream`: numbers are
+        decoded in place and raw data is returned as ``memoryview`` slices instead of copies"""
+        if zero_copy:
+            if buf_or_stream.__class__ is not BufferStream:
+                buf_or_stream = BufferStream(buf_or_stream)
+        elif not hasattr(buf_or_stream, "read"):
             buf_or_stream = BytesIO(buf_or_stream)
         return self._unpack(buf_or_stream, {}, Config())
     def _unpack(self, stream, ctx, cfg):
         raise NotImplementedError()
+    def unpack_traced(self, buf_or_stream, root = None, many = False):
+        """Unpacks the given buffer (or stream) while recording the byte range of every field, returning a
+        :class:`construct3.trace.Trace` that holds the value (see :func:`construct3.trace.trace_unpack`)"""
+        from construct3.trace import trace_unpack
+        return trace_unpack(self, buf_or_stream, root, many)
+    def iter_unpack(self, stream_or_path, chunk_size = 64 * 1024, offset = None):
+        """Returns an iterator over the records concatenated in the given file (or path), which reads it in
+        chunks of ``chunk_size`` bytes. The iterator's ``offset`` attribute is the position of the next record,
+        which can be passed back as ``offset`` to resume from there
+        (see :class:`construct3.streaming.RecordIterator`)"""
+        from construct3.streaming import RecordIterator
+        return RecordIterator(self, stream_or_path, chunk_size, offset)
+    def unpack_many(self, buffers, zero_copy = False, errors = "capture", lazy = False):
+        """Unpacks an object from each of the given buffers (e.g., datagrams), reusing a single stream and config
+        across the batch. Returns a list of the results, or a generator with ``lazy``; items that fail to unpack
+        are replaced by their exceptions unless ``errors = "raise"`` (see :func:`construct3.batch.unpack_many`)"""
+        from construct3.batch import unpack_many, iter_unpack_many
+        return (iter_unpack_many if lazy else unpack_many)(self, buffers, zero_copy, errors)
+    def parallel_unpack(self, path, workers = None, ordered = True):
+        """Decodes the records concatenated in the given file using a pool of worker processes
+        (see :func:`construct3.parallel.parallel_unpack`)"""
+        from construct3.parallel import parallel_unpack
+        return parallel_unpack(self, path, workers, ordered)
+    def unpack_async(self, reader):
+        """A coroutine that reads and unpacks a single record from an ``asyncio.StreamReader``
+        (see :func:`construct3.aio.unpack_async`)"""
+        from construct3.aio import unpack_async
+        return unpack_async(self, reader)
+    def pack_async(self, obj, writer):
+        """A coroutine that packs the object and writes it to an ``asyncio.StreamWriter``
+        (see :func:`construct3.aio.pack_async`)"""
+        from construct3.aio import pack_async
+        return pack_async(self, obj, writer)
 
     def sizeof(self, ctx = None, cfg = None):
+        size = _static_sizes.get(self)
+        if size is None:
+            from construct3.layout import analyze, depends_on_cases
+            layout = analyze(self)
+            size = layout.size if layout.fixed else -1
+            if not depends_on_cases(self):
+                _static_sizes[self] = size
+        if size >= 0:
+            return size
         return self._sizeof(ctx or {}, cfg or Config())
     def _sizeof(self, ctx, cfg):
         raise NotImplementedError()
@@ -93,13 +186,13 @@ def _contextify(value):
 
 class Adapter(Packer):
     #__slots__ = ["underlying", "_decode", "_encode"]
+    _decode = None
+    _encode = None
     def __init__(self, underlying, decode = None, encode = None):
         self.underlying = underlying
-
-        if not hasattr(self, '_decode') and decode is None:
+        if decode is not None:
             self._decode = decode
-
-        if not hasattr(self, '_encode') and encode is None:
+        if encode is not None:
             self._encode = encode
 
     def __repr__(self):
@@ -126,18 +219,25 @@ class Adapter(Packer):
             return obj
 
 class Raw(Packer):
-    __slots__ = ["length"]
+    __slots__ = ["length", "_plan"]
     def __init__(self, length):
         self.length = _contextify(length)
+        self._plan = None
     def __repr__(self):
         return "Raw(%r)" % (self.length,)
     def _pack(self, obj, stream, ctx, cfg):
-        length = self.length(ctx)
+        plan = self._plan
+        if plan is None:
+            plan = self._plan = compile_expr(self.length)
+        length = plan(ctx)
         if len(obj) != length:
             raise RawError("Expected buffer of length %d, got %d" % (length, len(obj)))
         stream.write(obj)
     def _unpack(self, stream, ctx, cfg):
-        length = self.length(ctx)
+        plan = self._plan
+        if plan is None:
+            plan = self._plan = compile_expr(self.length)
+        length = plan(ctx)
         data = stream.read(length)
         if len(data) != length:
             raise RawError("Expected buffer of length %d, got %d" % (length, len(data)))
@@ -145,6 +245,40 @@ class Raw(Packer):
     def _sizeof(self, ctx, cfg):
         return self.length(ctx)
 
+class FusedFormatted(Packer):
+    """Several consecutive fixed-size numbers that are read and written with a single struct format. Created
+    by :func:`construct3.fusion.fuse_formatted` from runs of ``Formatted`` members; it unpacks into a tuple of
+    values"""
+    __slots__ = ["fmt", "members"]
+    def __init__(self, format, members):
+        self.fmt = _struct.Struct(format)
+        self.members = members
+    def __repr__(self):
+        return "FusedFormatted(%s)" % (", ".join(repr(m) for m in self.members),)
+    def _unpack(self, stream, ctx, cfg):
+        size = self.fmt.size
+        if stream.__class__ is BufferStream:
+            offset = stream.offset
+            if offset + size > len(stream.buffer):
+                raise RawError("Expected buffer of length %d, got %d" % (size, len(stream.buffer) - offset))
+            stream.offset = offset + size
+            return self.fmt.unpack_from(stream.buffer, offset)
+        data = stream.read(size)
+        if len(data) != size:
+            raise RawError("Expected buffer of length %d, got %d" % (size, len(data)))
+        return self.fmt.unpack(data)
+    def _pack(self, obj, stream, ctx, cfg):
+        if stream.__class__ is BufferStream:
+            self.fmt.pack_into(stream.buffer, stream.reserve(self.fmt.size), *obj)
+        else:
+            stream.write(self.fmt.pack(*obj))
+    def _sizeof(self, ctx, cfg):
+        return self.fmt.size
+
+def _fuse(members):
+    from construct3.fusion import fuse_formatted
+    return fuse_formatted(members)
+
 def Named(*args, **kwargs):
     if (args and kwargs) or (not args and not kwargs):
         raise TypeError("This function takes either two positional arguments or a single keyword attribute", 
@@ -195,12 +329,31 @@ class Embedded(UnnamedPackerMixin, Packer):
         with cfg.set(embedded = True):
             return self.underlying._sizeof(ctx, cfg)
 
+def _record_fields(members):
+    fields = []
+    for name, pkr in members:
+        if isinstance(pkr, Embedded):
+            if type(pkr.underlying) is not Struct:
+                raise ValueError("Record structs can only embed Structs: %r" % (pkr,))
+            fields.extend(_record_fields(pkr.underlying.members))
+        elif name:
+            fields.append(name)
+    return fields
+
 class Struct(Packer):
-    __slots__ = ["members", "container_factory"]
+    """
+    A sequence of named members. By default, every struct is unpacked into a :class:`Container` (or whatever
+    ``container_factory`` creates); passing ``record = True`` (or a class name) generates a dedicated
+    :class:`Record` type for this struct instead, which is built in a single call once all fields are
+    unpacked. Records keep their fields in ``__slots__``, which saves much memory when many of them are kept
+    """
+    __slots__ = ["members", "container_factory", "record_class", "_plan"]
     
     def __init__(self, *members, **kwargs):
         self.members = members
+        self._plan = None
         self.container_factory = kwargs.pop("container_factory", None)
+        record = kwargs.pop("record", False)
         if kwargs:
             raise TypeError("invalid keyword argument(s): %s" % (", ".join(kwargs.keys()),))
         names = set()
@@ -212,6 +365,13 @@ class Struct(Packer):
                 raise TypeError("Member %r already exists in this struct" % (mem[0],))
             if mem[0]:
                 names.add(mem[0])
+        if record and self.container_factory:
+            raise TypeError("record and container_factory are mutually exclusive")
+        if record:
+            name = record if isinstance(record, str) else "Record"
+            self.record_class = record_class(name, _record_fields(members))
+        else:
+            self.record_class = None
 
     def __repr__(self):
         return "Struct(%s)" % (", ".join(repr(m) for m in self.members),)
@@ -222,17 +382,42 @@ class Struct(Packer):
             ctx2 = ctx
             obj = cfg.container
             del cfg.embedded
+        elif self.record_class is not None:
+            return self._unpack_record(stream, ctx, cfg, factory)
         else:
             ctx2 = {"_" : ctx}
             obj = factory()
+        plan = self._plan
+        if plan is None:
+            plan = self._plan = _fuse(self.members)
         with cfg.set(container = obj, ctx = ctx2, container_factory = factory):
-            for name, pkr in self.members:
+            for name, pkr in plan:
                 cfg.name = name
                 obj2 = pkr._unpack(stream, ctx2, cfg)
-                if name:
+                if pkr.__class__ is FusedFormatted:
+                    for name2, obj3 in zip(name, obj2):
+                        ctx2[name2] = obj[name2] = obj3
+                elif name:
                     ctx2[name] = obj[name] = obj2
         return obj
     
+    def _unpack_record(self, stream, ctx, cfg, factory):
+        # the fields are only collected in the context (embedded structs store theirs there too);
+        # the record is then built in a single call
+        ctx2 = {"_" : ctx}
+        plan = self._plan
+        if plan is None:
+            plan = self._plan = _fuse(self.members)
+        with cfg.set(container = ctx2, ctx = ctx2, container_factory = factory):
+            for name, pkr in plan:
+                cfg.name = name
+                obj2 = pkr._unpack(stream, ctx2, cfg)
+                if pkr.__class__ is FusedFormatted:
+                    ctx2.update(zip(name, obj2))
+                elif name:
+                    ctx2[name] = obj2
+        return self.record_class(*[ctx2[name] for name in self.record_class._fields])
+    
     def _pack(self, obj, stream, ctx, cfg):
         if cfg.embedded:
             ctx2 = ctx
@@ -240,13 +425,22 @@ class Struct(Packer):
             del cfg.embedded
         else:
             ctx2 = {"_" : ctx}
+        plan = self._plan
+        if plan is None:
+            plan = self._plan = _fuse(self.members)
+        get = getattr if isinstance(obj, Record) else _getitem
         with cfg.set(container = obj, ctx = ctx2):
-            for name, pkr in self.members:
+            for name, pkr in plan:
                 cfg.name = name
-                if not name:
+                if pkr.__class__ is FusedFormatted:
+                    obj2 = []
+                    for name2 in name:
+                        obj3 = ctx2[name2] = get(obj, name2)
+                        obj2.append(obj3)
+                elif not name:
                     obj2 = None
                 else:
-                    obj2 = ctx2[name] = obj[name]
+                    obj2 = ctx2[name] = get(obj, name)
                 pkr._pack(obj2, stream, ctx2, cfg)
     
     def _sizeof(self, ctx, cfg):
@@ -259,10 +453,11 @@ class Struct(Packer):
 
 
 class Sequence(Packer):
-    __slots__ = ["members", "container_factory"]
+    __slots__ = ["members", "container_factory", "_plan"]
     
     def __init__(self, *members, **kwargs):
         self.members = members
+        self._plan = None
         self.container_factory = kwargs.pop("container_factory", list)
         if kwargs:
             raise TypeError("Invalid keyword argument(s): %s" % (", ".join(kwargs.keys()),))
@@ -286,11 +481,19 @@ class Sequence(Packer):
             obj = factory()
             i = 0
             embedded = False
+        plan = self._plan
+        if plan is None:
+            plan = self._plan = _fuse(enumerate(self.members))
         with cfg.set(container = obj, ctx = ctx, container_factory = factory):
-            for pkr in self.members:
+            for _, pkr in plan:
                 cfg.name = i
                 obj2 = pkr._unpack(stream, ctx2, cfg)
-                if obj2 is not None:
+                if pkr.__class__ is FusedFormatted:
+                    for obj3 in obj2:
+                        obj.append(obj3)
+                        ctx2[i] = obj3
+                        i += 1
+                elif obj2 is not None:
                     obj.append(obj2)
                     ctx2[i] = obj2
                     i += 1
@@ -300,12 +503,21 @@ class Sequence(Packer):
         from construct3.adapters import Padding
         ctx2 = {"_" : ctx}
         i = 0
-        for pkr in self.members:
-            if isinstance(pkr, Padding):
-                pkr._pack(None, stream, ctx2)
+        plan = self._plan
+        if plan is None:
+            plan = self._plan = _fuse(enumerate(self.members))
+        for _, pkr in plan:
+            if pkr.__class__ is FusedFormatted:
+                obj2 = obj[i:i + len(pkr.members)]
+                for obj3 in obj2:
+                    ctx2[i] = obj3
+                    i += 1
+                pkr._pack(obj2, stream, ctx2, cfg)
+            elif isinstance(pkr, Padding):
+                pkr._pack(None, stream, ctx2, cfg)
             else:
                 obj2 = ctx2[i] = obj[i]
-                pkr._pack(obj2, stream, ctx2)
+                pkr._pack(obj2, stream, ctx2, cfg)
                 i += 1
     
     def _sizeof(self, ctx, cfg):
@@ -314,24 +526,33 @@ class Sequence(Packer):
             del cfg.embedded
         else:
             ctx2 = {"_" : ctx}
-        return sum(pkr._sizeof(ctx2) for pkr in self.members)
+        return sum(pkr._sizeof(ctx2, cfg) for pkr in self.members)
 
 
 class Range(Packer):
-    __slots__ = ["mincount", "maxcount", "itempkr"]
+    __slots__ = ["mincount", "maxcount", "itempkr", "_plan"]
     def __init__(self, mincount, maxcount, itempkr):
         self.mincount = _contextify(mincount)
         self.maxcount = _contextify(maxcount)
         self.itempkr = itempkr
+        self._plan = None
     
     def __repr__(self):
         return "Range(%r, %r, %r)" % (self.mincount, self.maxcount, self.itempkr)
     
+    def _get_plan(self):
+        # the counts' expressions are compiled once, and their functions called directly
+        plan = self._plan
+        if plan is None:
+            plan = self._plan = (compile_expr(self.mincount), compile_expr(self.maxcount))
+        return plan
+    
     def _pack(self, obj, stream, ctx, cfg):
-        mincount = self.mincount(ctx)
+        mincount, maxcount = self._plan or self._get_plan()
+        mincount = mincount(ctx)
         if mincount is None:
             mincount = 0
-        maxcount = self.maxcount(ctx)
+        maxcount = maxcount(ctx)
         if maxcount is None:
             maxcount = sys.maxsize
         assert maxcount >= mincount
@@ -345,10 +566,11 @@ class Range(Packer):
             self.itempkr._pack(item, stream, ctx2, cfg)
     
     def _unpack(self, stream, ctx, cfg):
-        mincount = self.mincount(ctx)
+        mincount, maxcount = self._plan or self._get_plan()
+        mincount = mincount(ctx)
         if mincount is None:
             mincount = 0
-        maxcount = self.maxcount(ctx)
+        maxcount = maxcount(ctx)
         if maxcount is None:
             maxcount = sys.maxsize
         assert maxcount >= mincount
@@ -368,7 +590,11 @@ class Range(Packer):
         return obj
 
     def _sizeof(self, ctx, cfg):
-        return self.count(ctx) * self.itempkr._sizeof({"_" : ctx}, cfg)
+        mincount = self.mincount(ctx)
+        maxcount = self.maxcount(ctx)
+        if mincount is None or mincount != maxcount:
+            raise RangeError("Cannot compute the size of a variable-length range %r" % (self,))
+        return mincount * self.itempkr._sizeof({"_" : ctx}, cfg)
 
 
 class While(Packer):
@@ -400,25 +626,54 @@ class While(Packer):
             i += 1
         return obj
     
-    def _sizeof(self):
+    def _sizeof(self, ctx, cfg):
         raise NotImplementedError("Cannot compute sizeof of %r" % (self,))
 
 
 class Switch(Packer):
-    __slots__ = ["expr", "cases", "default"]
+    """
+    Chooses the packer by the value of ``expr`` (a contextual expression): ``cases`` maps values to packers,
+    and values that are not in it use ``default`` (or raise ``SwitchError``). On first use, the expression is
+    compiled, so dispatching costs one call and one lookup in ``cases`` (which may still be changed).
+    ``count_hits()`` enables counting how many times each value was dispatched, for profiling
+    """
+    __slots__ = ["expr", "cases", "default", "_plan", "_hits"]
     def __init__(self, expr, cases, default = NotImplemented):
         self.expr = expr
         self.cases = cases
         self.default = default
-    
+        self._plan = None
+        self._hits = None
+
+    def count_hits(self, enabled = True):
+        """Enables (or disables and clears) the per-value hit counters, see :attr:`hits`. Note that compiled code
+        only counts if counting was enabled when it was compiled, and that code taken from the compiler cache
+        counts on the switch it was originally compiled from"""
+        self._hits = {} if enabled else None
+    @property
+    def hits(self):
+        """A dict mapping each dispatched value to the number of times it was dispatched (since the counters were
+        enabled)"""
+        return dict(self._hits or ())
+
+    def _get_plan(self):
+        plan = self._plan
+        if plan is None:
+            plan = self._plan = compile_expr(self.expr)
+        return plan
+
     def _choose_packer(self, ctx):
-        val = self.expr(ctx)
-        if val in self.cases:
-            return self.cases[val]
-        elif self.default is not NotImplemented:
-            return self.default
-        else:
+        plan = self._plan
+        if plan is None:
+            plan = self._get_plan()
+        val = plan(ctx)
+        hits = self._hits
+        if hits is not None:
+            hits[val] = hits.get(val, 0) + 1
+        pkr = self.cases.get(val, self.default)
+        if pkr is NotImplemented:
             raise SwitchError("Cannot find a handler for %r" % (val,))
+        return pkr
     
     def _pack(self, obj, stream, ctx, cfg):
         pkr = self._choose_packer(ctx)
@@ -435,22 +690,152 @@ class Switch(Packer):
 # Stream-related
 #=======================================================================================================================
 class Bitwise(Packer):
+    __slots__ = ["underlying", "_fields"]
     def __init__(self, underlying):
         self.underlying = underlying
+        self._fields = None
     def __repr__(self):
         return "Bitwise(%r)" % (self.underlying,)
+    def _get_fields(self):
+        fields = self._fields
+        if fields is None:
+            fields = self._fields = _bit_fields(self.underlying)
+        return fields
     def _unpack(self, stream, ctx, cfg):
+        fields = self._fields
+        if fields is None:
+            fields = self._get_fields()
+        if fields and not cfg.embedded:
+            size, members = fields
+            data = stream.read(size)
+            if len(data) != size:
+                raise RawError("Expected buffer of length %d, got %d" % (size, len(data)))
+            return _unpack_bit_fields(self.underlying, members, bytes_to_int(data), ctx,
+                cfg.container_factory or Container)
         stream2 = BitStreamReader(stream)
         obj = self.underlying._unpack(stream2, ctx, cfg)
         stream2.close()
         return obj
     def _pack(self, obj, stream, ctx, cfg):
+        fields = self._fields
+        if fields is None:
+            fields = self._get_fields()
+        if fields and not cfg.embedded:
+            size, members = fields
+            stream.write(int_to_bytes(_pack_bit_fields(members, obj, ctx), size))
+            return
         stream2 = BitStreamWriter(stream)
         self.underlying._pack(obj, stream2, ctx, cfg)
         stream2.close()
     def _sizeof(self, ctx, cfg):
         return self.underlying._sizeof(ctx, cfg) // 8
 
+#
+# Bitwise fast path: a Struct made only of fixed-width bit fields (Bits, Raw, plain Adapters over them, and
+# nested Structs thereof) that sums up to whole bytes is read as a single integer, out of which every field is
+# extracted with a precomputed shift and mask (like MaskedInteger does). Packing ORs the fields back together
+#
+def _bit_leaf(pkr):
+    from construct3.numbers import Bits
+    adapters = []
+    while type(pkr)._unpack is Adapter._unpack and type(pkr)._pack is Adapter._pack:
+        adapters.append(pkr)
+        pkr = pkr.underlying
+    if type(pkr) is Bits and not pkr.swapped:
+        return pkr.width, adapters[::-1], pkr
+    if (type(pkr) is Raw and isinstance(pkr.length, CtxConst) and
+            isinstance(pkr.length.value, six.integer_types) and pkr.length.value > 0):
+        return pkr.length.value, adapters[::-1], pkr
+    return None
+
+def _bit_members(pkr, end):
+    # returns (start, members), where members are (name, shift, mask, adapters, leaf, submembers) in order
+    members = []
+    for name, pkr2 in pkr.members:
+        if type(pkr2) is Struct:
+            res = _bit_members(pkr2, end)
+            if res is None or not name:
+                return None
+            end, submembers = res
+            members.append((name, None, None, (), pkr2, submembers))
+            continue
+        leaf = _bit_leaf(pkr2)
+        if leaf is None:
+            return None
+        width, adapters, leaf = leaf
+        members.append((name, width, (1 << width) - 1, adapters, leaf, None))
+        end += width
+    return end, members
+
+def _bit_fields(pkr):
+    if type(pkr) is not Struct:
+        return False
+    res = _bit_members(pkr, 0)
+    if res is None or not res[0] or res[0] & 7:
+        return False
+    width, members = res
+    # turn the widths into shifts, counting from the least significant bit
+    def place(members, shift):
+        placed = []
+        for name, width, mask, adapters, leaf, submembers in members:
+            if submembers is not None:
+                submembers, shift = place(submembers, shift)
+                placed.append((name, None, None, adapters, leaf, submembers))
+            else:
+                shift -= width
+                placed.append((name, shift, mask, adapters, leaf, None))
+        return placed, shift
+    return width >> 3, place(members, width)[0]
+
+def _unpack_bit_fields(pkr, members, num, ctx, factory):
+    ctx2 = {"_" : ctx}
+    factory = pkr.container_factory or factory
+    for name, shift, mask, adapters, leaf, submembers in members:
+        if submembers is not None:
+            obj = _unpack_bit_fields(leaf, submembers, num, ctx2, factory)
+        else:
+            obj = (num >> shift) & mask
+            if leaf.__class__ is Raw:
+                obj = _to_bitstr(obj, leaf.length.value)
+            elif leaf.signed and obj >> (leaf.width - 1):
+                obj -= 1 << leaf.width
+            for adapter in adapters:
+                obj = adapter.decode(obj, ctx2)
+        if name:
+            ctx2[name] = obj
+    if pkr.record_class is not None:
+        return pkr.record_class(*[ctx2[name] for name in pkr.record_class._fields])
+    del ctx2["_"]
+    if factory is Container:
+        return Container(ctx2)
+    obj = factory()
+    for name, value in ctx2.items():
+        obj[name] = value
+    return obj
+
+def _pack_bit_fields(members, obj, ctx):
+    ctx2 = {"_" : ctx}
+    get = getattr if isinstance(obj, Record) else _getitem
+    num = 0
+    for name, shift, mask, adapters, leaf, submembers in members:
+        if name:
+            obj2 = ctx2[name] = get(obj, name)
+        else:
+            obj2 = None
+        if submembers is not None:
+            num |= _pack_bit_fields(submembers, obj2, ctx2)
+            continue
+        for adapter in reversed(adapters):
+            obj2 = adapter.encode(obj2, ctx2)
+        if leaf.__class__ is Raw:
+            if len(obj2) != leaf.length.value:
+                raise RawError("Expected buffer of length %d, got %d" % (leaf.length.value, len(obj2)))
+            obj2 = bits_to_num(obj2)
+        elif obj2 < 0 and not leaf.signed:
+            raise ValueError("%r is negative, but field is not signed" % (obj2,))
+        num |= (int(obj2) & mask) << shift
+    return num
+
 @singleton
 class anchor(Packer):
     __slots__ = ()
@@ -464,21 +849,28 @@ class anchor(Packer):
         return 0
 
 class Pointer(Packer):
-    __slots__ = ["underlying", "offset"]
+    __slots__ = ["underlying", "offset", "_plan"]
     def __init__(self, offset, underlying):
         self.underlying = underlying
         self.offset = _contextify(offset)
+        self._plan = None
     def __repr__(self):
         return "Pointer(%r, %r)" % (self.offset, self.underlying)
     def _unpack(self, stream, ctx, cfg):
-        newpos = self.offset(ctx)
+        plan = self._plan
+        if plan is None:
+            plan = self._plan = compile_expr(self.offset)
+        newpos = plan(ctx)
         origpos = stream.tell()
         stream.seek(newpos)
         obj = self.underlying._unpack(stream, ctx, cfg)
         stream.seek(origpos)
         return obj
     def _pack(self, obj, stream, ctx, cfg):
-        newpos = self.offset(ctx)
+        plan = self._plan
+        if plan is None:
+            plan = self._plan = compile_expr(self.offset)
+        newpos = plan(ctx)
         origpos = stream.tell()
         stream.seek(newpos)
         self.underlying._pack(obj, stream, ctx, cfg)
@@ -0,0 +1,124 @@
+"""
+Multi-core decoding of large files of concatenated records. The file is split into record-aligned shards,
+which are decoded by a pool of worker processes; every worker memory-maps the file and decodes its own shard
+with (a pickled copy of) the same packer.
+
+Shard boundaries are computed in the parent process: for fixed-size packers they follow from the static size,
+and for length-prefixed packers (see :func:`construct3.streaming.framer`) from a quick pre-scan of the length
+prefixes, which decodes only the prefixes rather than whole records.
+"""
+import os
+import mmap
+import multiprocessing
+from construct3.packers import PackerError
+from construct3.layout import analyze
+from construct3.lib.buffers import CopyingBufferStream
+from construct3.lib.config import Config
+from construct3.streaming import TruncatedRecordError, _frame_function, _Incomplete
+
+
+def _map_file(path):
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+
+def _fixed_shards(size, filesize, count):
+    if filesize % size:
+        raise TruncatedRecordError("Truncated record at offset %d (%d trailing bytes)" % (
+            filesize - filesize % size, filesize % size))
+    records = filesize // size
+    per_shard = max(1, -(-records // count))
+    return [(i * size, min(i + per_shard, records) * size) for i in range(0, records, per_shard)]
+
+def _scanned_shards(frame, buf, count):
+    # walks the records by their length prefixes, cutting a shard whenever it grows past the target size
+    filesize = len(buf)
+    target = max(1, filesize // count)
+    shards = []
+    start = offset = 0
+    while offset < filesize:
+        try:
+            size = frame(buf, offset, {})
+        except _Incomplete:
+            size = None
+        if size is None or offset + size > filesize:
+            raise TruncatedRecordError("Truncated record at offset %d (%d trailing bytes)" % (
+                offset, filesize - offset))
+        if size == 0:
+            raise PackerError("Empty record at offset %d" % (offset,))
+        offset += size
+        if offset - start >= target:
+            shards.append((start, offset))
+            start = offset
+    if start < filesize:
+        shards.append((start, filesize))
+    return shards
+
+def shard_file(packer, path, count):
+    """Splits the given file into (up to) ``count`` record-aligned shards, returning a list of ``(start, end)``
+    offsets. Raises ``PackerError`` if the packer is neither fixed-size nor length-prefixed"""
+    filesize = os.path.getsize(path)
+    if not filesize:
+        return []
+    layout = analyze(packer)
+    if layout.fixed and layout.size:
+        return _fixed_shards(layout.size, filesize, count)
+    frame = _frame_function(packer)
+    if frame is None or layout.fixed:
+        raise PackerError("%r is neither fixed-size nor length-prefixed, so its records cannot be sharded" % (
+            packer,))
+    mm = _map_file(path)
+    try:
+        view = memoryview(mm)
+        try:
+            return _scanned_shards(frame, view, count)
+        finally:
+            view.release()
+    finally:
+        mm.close()
+
+def _unpack_shard(args):
+    packer, path, start, end = args
+    mm = _map_file(path)
+    stream = CopyingBufferStream(mm, start)
+    try:
+        records = []
+        while stream.offset < end:
+            records.append(packer._unpack(stream, {}, Config()))
+        if stream.offset != end:
+            raise PackerError("Record at offset %d crosses the shard boundary %d" % (stream.offset, end))
+    finally:
+        stream.buffer.release()
+        mm.close()
+    return records
+
+def parallel_unpack(packer, path, workers = None, ordered = True, shards_per_worker = 4):
+    """
+    Decodes the records concatenated in the given file using a pool of ``workers`` processes (defaults to the
+    number of CPUs; ``1`` decodes in-process), returning an iterator over the records. With ``ordered``,
+    records are returned in file order; otherwise shards are returned as soon as they are decoded. The file is
+    split into ``workers * shards_per_worker`` shards (see :func:`shard_file`); the packer must be picklable
+    """
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    shards = shard_file(packer, path, workers * shards_per_worker)
+    tasks = [(packer, path, start, end) for start, end in shards]
+    return _iter_results(tasks, workers, ordered)
+
+def _iter_results(tasks, workers, ordered):
+    if not tasks:
+        return
+    if workers <= 1:
+        for task in tasks:
+            for obj in _unpack_shard(task):
+                yield obj
+        return
+    pool = multiprocessing.Pool(min(workers, len(tasks)))
+    try:
+        results = pool.imap(_unpack_shard, tasks) if ordered else pool.imap_unordered(_unpack_shard, tasks)
+        for records in results:
+            for obj in records:
+                yield obj
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
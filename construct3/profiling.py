@@ -0,0 +1,301 @@
+"""
+Per-field profiling of packing and unpacking::
+
+    with construct3.profile("ipv4_header") as prof:
+        for buf in buffers:
+            ipv4_header.unpack(buf)
+    print(prof.table())
+    prof.dump_collapsed("ipv4.folded")     # for flamegraph.pl, speedscope, etc.
+
+While a profile is active, the ``_unpack`` and ``_pack`` methods of every packer class are replaced by wrappers
+that record, per node, the number of calls, the cumulative and self time, and the number of bytes consumed (or
+produced). Nodes are keyed by their field path (``ipv4_header.tos.precedence``) and their packer class, since a
+single field may be made of several nodes (e.g., an adapter over ``Raw``); embedded packers are named by the
+fields they hold (``ipv4_header.{version,header_length}``). The original methods are restored when the profile
+ends, so the instrumentation costs nothing when disabled.
+
+The fast paths that decode several fields at once (fused numbers and byte-aligned bit structs) are turned off
+while profiling, so that every field is a node of its own; compiled packers are still a single node. Only one
+profile may be active at a time, and it is not thread-safe: it assumes the packers are only used by the thread
+that profiles them
+"""
+import time
+from construct3.packers import Packer, Struct, Sequence, Bitwise, Embedded
+
+
+_clock = getattr(time, "perf_counter", time.time)
+_active = None
+
+
+class NodeStats(object):
+    """The statistics of a single node: ``calls``, ``cumulative`` and ``self_time`` (in seconds), and
+    ``bytes`` (``None`` if the node works on a bit stream)"""
+    __slots__ = ["path", "kind", "calls", "cumulative", "self_time", "bytes"]
+    def __init__(self, path, kind):
+        self.path = path
+        self.kind = kind
+        self.calls = 0
+        self.cumulative = 0.0
+        self.self_time = 0.0
+        self.bytes = None
+    def __repr__(self):
+        return "NodeStats(%s [%s], calls = %d, cumulative = %.6f, self = %.6f, bytes = %r)" % (self.path,
+            self.kind, self.calls, self.cumulative, self.self_time, self.bytes)
+
+class _Frame(object):
+    __slots__ = ["stats", "path", "label", "depth", "stack", "entered", "start", "pos", "children", "outermost"]
+
+
+def _packer_classes():
+    classes = []
+    pending = [Packer]
+    while pending:
+        cls = pending.pop()
+        if cls not in classes:
+            classes.append(cls)
+            pending.extend(cls.__subclasses__())
+    return classes
+
+def _tell(stream):
+    try:
+        return stream.tell()
+    except (AttributeError, IOError, OSError):
+        return None
+
+def _wrap_unpack(func):
+    def _unpack(self, stream, ctx, cfg):
+        prof = _active
+        if prof is None:
+            return func(self, stream, ctx, cfg)
+        frame = prof._enter(self, stream, cfg)
+        try:
+            return func(self, stream, ctx, cfg)
+        finally:
+            prof._exit(frame, stream)
+    return _unpack
+
+def _wrap_pack(func):
+    def _pack(self, obj, stream, ctx, cfg):
+        prof = _active
+        if prof is None:
+            return func(self, obj, stream, ctx, cfg)
+        frame = prof._enter(self, stream, cfg)
+        try:
+            func(self, obj, stream, ctx, cfg)
+        finally:
+            prof._exit(frame, stream)
+    return _pack
+
+# the execution plans of the fast paths that decode several fields at once, and the plain plans that replace
+# them (for the duration of a call) when fast paths are turned off
+_plain_plans = {
+    Struct : ("_plan", lambda pkr: pkr.members),
+    Sequence : ("_plan", lambda pkr: list(enumerate(pkr.members))),
+    Bitwise : ("_fields", lambda pkr: ()),
+}
+
+def _without_fast_path(func, attr, make_plan):
+    def wrapper(self, *args):
+        saved = getattr(self, attr)
+        setattr(self, attr, make_plan(self))
+        try:
+            return func(self, *args)
+        finally:
+            setattr(self, attr, saved)
+    return wrapper
+
+
+class Instrument(object):
+    """
+    The base of :class:`Profile` and :class:`construct3.trace.Trace`: while started, the ``_unpack`` and
+    ``_pack`` methods of every packer class call ``_enter(pkr, stream, cfg)`` before running and
+    ``_exit(frame, stream)`` (with whatever ``_enter`` returned) after it, even if it raised. Only one instrument
+    may be active at a time. Instruments whose ``fast_paths`` is false turn off the fast paths that decode several
+    fields at once
+    """
+    fast_paths = True
+
+    def __init__(self, root = None):
+        self.root = root
+        self._patched = []
+
+    def __enter__(self):
+        self.start()
+        return self
+    def __exit__(self, t, v, tb):
+        self.stop()
+
+    def start(self):
+        global _active
+        if _active is not None:
+            raise RuntimeError("Another profile (or trace) is already active")
+        _active = self
+        for cls in _packer_classes():
+            for name, wrap in (("_unpack", _wrap_unpack), ("_pack", _wrap_pack)):
+                func = cls.__dict__.get(name)
+                if func is not None:
+                    self._patched.append((cls, name, func))
+                    if not self.fast_paths and cls in _plain_plans:
+                        func = _without_fast_path(func, *_plain_plans[cls])
+                    setattr(cls, name, wrap(func))
+    def stop(self):
+        global _active
+        if _active is not self:
+            return
+        for cls, name, func in reversed(self._patched):
+            setattr(cls, name, func)
+        del self._patched[:]
+        _active = None
+
+    def _field_path(self, parent_path, parent_depth, pkr, cfg):
+        # returns the field path of a node, and its config depth, given those of its parent node
+        depth = len(cfg._frames)
+        if parent_path is None:
+            return self.root or type(pkr).__name__, depth
+        name = cfg.name
+        if depth > parent_depth and name is not None:
+            # containers push a config frame and set ``cfg.name`` before calling their members; wrappers
+            # (adapters, switches, ...) call their underlying packers under their own name. Fused numbers
+            # are named by a tuple of their fields
+            if isinstance(name, tuple):
+                name = "{%s}" % (",".join(name),)
+            return "%s.%s" % (parent_path, name), depth
+        return parent_path, depth
+
+    def _enter(self, pkr, stream, cfg):
+        raise NotImplementedError()
+    def _exit(self, frame, stream):
+        raise NotImplementedError()
+
+
+def _embedded_fields(pkr, names):
+    # collects the names of the fields that an embedded packer stores in the enclosing struct
+    while isinstance(pkr, (Embedded, Bitwise)) or (not isinstance(pkr, (Struct, Sequence)) and
+            isinstance(getattr(pkr, "underlying", None), Packer)):
+        pkr = pkr.underlying
+    if isinstance(pkr, Struct):
+        for name, pkr2 in pkr.members:
+            if isinstance(pkr2, Embedded):
+                _embedded_fields(pkr2, names)
+            elif name:
+                names.append(name)
+    return names
+
+
+class Profile(Instrument):
+    """Collects per-node statistics while active (see :func:`profile`); ``stats`` maps ``(path, kind)`` to
+    :class:`NodeStats`"""
+    fast_paths = False
+
+    def __init__(self, root = None):
+        Instrument.__init__(self, root)
+        self.stats = {}
+        self.stacks = {}
+        self._labels = {}
+        root_frame = _Frame()
+        root_frame.path = None
+        root_frame.label = None
+        root_frame.depth = -1
+        root_frame.stack = ()
+        root_frame.children = 0.0
+        self._frames = [root_frame]
+
+    def __repr__(self):
+        return "Profile(%r, %d nodes)" % (self.root, len(self.stats))
+
+    def _enter(self, pkr, stream, cfg):
+        entered = _clock()
+        parent = self._frames[-1]
+        path, depth = self._field_path(parent.path, parent.depth, pkr, cfg)
+        if pkr.__class__ is Embedded:
+            # embedded packers keep the path of their parent (for their fields), but are not counted as it
+            label = self._labels.get(id(pkr))
+            if label is None:
+                label = self._labels[id(pkr)] = "%s.{%s}" % (path, ",".join(_embedded_fields(pkr, [])))
+        elif path == parent.path:
+            label = parent.label
+        else:
+            label = path
+        kind = type(pkr).__name__
+        key = (label, kind)
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = self.stats[key] = NodeStats(label, kind)
+        frame = _Frame()
+        frame.entered = entered
+        frame.stats = stats
+        frame.path = path
+        frame.label = label
+        frame.depth = depth
+        frame.stack = parent.stack + ("%s [%s]" % (label, kind),)
+        frame.children = 0.0
+        # recursive nodes only add the time of their outermost call to the cumulative time
+        frame.outermost = all(f.stats is not stats for f in self._frames[1:])
+        frame.pos = _tell(stream)
+        self._frames.append(frame)
+        frame.start = _clock()
+        return frame
+
+    def _exit(self, frame, stream):
+        elapsed = _clock() - frame.start
+        self._frames.pop()
+        stats = frame.stats
+        stats.calls += 1
+        if frame.outermost:
+            stats.cumulative += elapsed
+        self_time = elapsed - frame.children
+        stats.self_time += self_time
+        self.stacks[frame.stack] = self.stacks.get(frame.stack, 0.0) + self_time
+        if frame.pos is not None:
+            pos = _tell(stream)
+            if pos is not None:
+                stats.bytes = (stats.bytes or 0) + pos - frame.pos
+        # the bookkeeping is excluded from the parent's self time as well
+        self._frames[-1].children += _clock() - frame.entered
+
+    _sort_keys = {
+        "self" : lambda s: -s.self_time,
+        "cumulative" : lambda s: -s.cumulative,
+        "calls" : lambda s: -s.calls,
+        "bytes" : lambda s: -(s.bytes or 0),
+        "path" : lambda s: (s.path, s.kind),
+    }
+
+    def sorted_stats(self, sort = "self"):
+        """Returns the :class:`NodeStats` sorted by ``self`` time (the default), ``cumulative`` time,
+        ``calls``, ``bytes`` or ``path``"""
+        if sort not in self._sort_keys:
+            raise ValueError("sort must be one of %s, got %r" % (", ".join(sorted(self._sort_keys)), sort))
+        return sorted(self.stats.values(), key = self._sort_keys[sort])
+
+    def table(self, sort = "self", limit = None):
+        """Returns the statistics as a text table (times in milliseconds), sorted as in :func:`sorted_stats`"""
+        stats = self.sorted_stats(sort)[:limit]
+        total = sum(s.self_time for s in self.stats.values()) or 1.0
+        lines = ["%10s %12s %12s %7s %12s  %s" % ("calls", "cumul (ms)", "self (ms)", "self %", "bytes", "node")]
+        for s in stats:
+            lines.append("%10d %12.3f %12.3f %6.1f%% %12s  %s [%s]" % (s.calls, s.cumulative * 1000,
+                s.self_time * 1000, s.self_time * 100 / total, "-" if s.bytes is None else s.bytes, s.path,
+                s.kind))
+        return "\n".join(lines)
+
+    def collapsed(self):
+        """Returns the self time of every stack of nodes in the collapsed-stack format of flame graph tools
+        (``frame;frame;frame count``, with counts in microseconds)"""
+        return ["%s %d" % (";".join(stack), round(self_time * 1e6))
+            for stack, self_time in sorted(self.stacks.items())]
+
+    def dump_collapsed(self, file_or_path):
+        """Writes :func:`collapsed` to the given file (or path)"""
+        lines = "".join(line + "\n" for line in self.collapsed())
+        if hasattr(file_or_path, "write"):
+            file_or_path.write(lines)
+        else:
+            with open(file_or_path, "w") as f:
+                f.write(lines)
+
+
+def profile(root = None):
+    """Returns a :class:`Profile` to be used in a ``with`` statement, which instruments all packers while
+    the block runs. ``root`` names the top-level packer in the field paths (the class name by default)"""
+    return Profile(root)
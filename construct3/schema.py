@@ -0,0 +1,223 @@
+"""
+A declarative, JSON-compatible form of packer trees. For instance, ``Raw(this.length)`` becomes::
+
+    {"type" : "Raw", "length" : {"this" : ["length"]}}
+
+Every packer becomes a dict holding its class (``type``) and its attributes; the predefined packers of
+construct3 (``uint8``, ``flag``, ...), as well as functions and classes, are referred to by name (``ref``).
+Tuples map to JSON arrays, and the other non-JSON values are tagged (``{"list" : [...]}``,
+``{"bytes" : "<hex>"}``, ``{"this" : [...]}`` for context expressions, etc.). Packers are rebuilt from their
+attributes directly, without re-running their constructors.
+
+Lambdas and other anonymous functions cannot be referred to by name, so packers that hold them raise
+:class:`SchemaError`; use module-level functions instead.
+"""
+import sys
+import json
+import operator
+import struct as _struct
+from binascii import hexlify, unhexlify
+from functools import partial
+from importlib import import_module
+import six
+from construct3.packers import Packer, PackerError, CtxConst
+from construct3.lib import _reduce_singleton
+from construct3.lib.thisexpr import Path, BinExpr, UniExpr, opnames
+from construct3.lib.containers import Record, _rebuild_record_class
+
+
+class SchemaError(PackerError):
+    pass
+
+# the modules whose packer classes and predefined packers are referred to by their short names
+_builtin_modules = ["construct3.packers", "construct3.numbers", "construct3.adapters", "construct3.macros",
+    "construct3.lazy"]
+_registry = None
+
+def _get_registry():
+    global _registry
+    if _registry is None:
+        classes = {}
+        packers = {}
+        names = {}
+        for modname in _builtin_modules:
+            module = import_module(modname)
+            for name, obj in vars(module).items():
+                if isinstance(obj, type) and issubclass(obj, Packer) and obj.__module__ == modname:
+                    classes[name] = obj
+                elif isinstance(obj, Packer) and not name.startswith("_"):
+                    if type(obj).__reduce__ is _reduce_singleton:
+                        name = type(obj).__name__
+                    packers.setdefault(name, obj)
+                    names.setdefault(id(obj), name)
+        _registry = (classes, packers, names)
+    return _registry
+
+_unops = {"-" : operator.neg, "+" : operator.pos, "~" : operator.not_}
+_binops = dict((sym, op) for op, sym in opnames.items() if op not in _unops.values())
+
+
+#=======================================================================================================================
+# encoding
+#=======================================================================================================================
+def _qualified_name(obj, path):
+    modname = getattr(obj, "__module__", None)
+    name = getattr(obj, "__qualname__", None) or getattr(obj, "__name__", None)
+    if modname is not None and name is not None:
+        target = sys.modules.get(modname)
+        for part in name.split("."):
+            target = getattr(target, part, None)
+        if target is obj:
+            return "%s:%s" % (modname, name)
+    raise SchemaError("%s: %r cannot be referred to by name (use a module-level function or class)" % (
+        path, obj))
+
+def _encode_packer(pkr, path):
+    classes, _, names = _get_registry()
+    name = names.get(id(pkr))
+    if name is not None:
+        return {"ref" : name}
+    cls = type(pkr)
+    if cls.__reduce__ is _reduce_singleton:
+        return {"ref" : "%s:%s" % (cls.__module__, cls.__name__)}
+    typename = cls.__name__ if classes.get(cls.__name__) is cls else _qualified_name(cls, path)
+    schema = {"type" : typename}
+    for name, value in pkr.__getstate__().items():
+        schema[name] = _encode(value, "%s.%s" % (path, name))
+    return schema
+
+def _encode(value, path):
+    if value is None or isinstance(value, (bool, float) + six.integer_types + six.string_types):
+        return value
+    elif isinstance(value, Packer):
+        return _encode_packer(value, path)
+    elif isinstance(value, tuple):
+        return tuple(_encode(v, "%s[%d]" % (path, i)) for i, v in enumerate(value))
+    elif isinstance(value, list):
+        return {"list" : [_encode(v, "%s[%d]" % (path, i)) for i, v in enumerate(value)]}
+    elif isinstance(value, dict):
+        return {"dict" : [(_encode(k, path), _encode(v, "%s[%r]" % (path, k))) for k, v in value.items()]}
+    elif isinstance(value, six.binary_type):
+        return {"bytes" : hexlify(value).decode("ascii")}
+    elif isinstance(value, CtxConst):
+        return {"const" : _encode(value.value, path)}
+    elif isinstance(value, Path):
+        names = []
+        while value._Path__parent is not None:
+            names.append(value._Path__name)
+            value = value._Path__parent
+        return {"this" : tuple(reversed(names))}
+    elif isinstance(value, BinExpr):
+        op = opnames[value.op] if value.op in opnames else _encode(value.op, path)
+        return {"binop" : op, "lhs" : _encode(value.lhs, path), "rhs" : _encode(value.rhs, path)}
+    elif isinstance(value, UniExpr):
+        op = opnames[value.op] if value.op in opnames else _encode(value.op, path)
+        return {"unop" : op, "operand" : _encode(value.operand, path)}
+    elif isinstance(value, _struct.Struct):
+        return {"format" : value.format if isinstance(value.format, str) else value.format.decode("ascii")}
+    elif isinstance(value, partial):
+        return {"partial" : _encode(value.func, path), "args" : _encode(tuple(value.args), path),
+            "keywords" : _encode(dict(value.keywords or {}), path)}
+    elif value is NotImplemented:
+        return {"special" : "NotImplemented"}
+    elif isinstance(value, type) and issubclass(value, Record) and value is not Record:
+        try:
+            return {"ref" : _qualified_name(value, path)}
+        except SchemaError:
+            return {"record" : value.__name__, "fields" : tuple(value._fields)}
+    elif callable(value):
+        return {"ref" : _qualified_name(value, path)}
+    else:
+        raise SchemaError("%s: cannot serialize %r" % (path, value))
+
+def to_schema(pkr):
+    """Returns the declarative (JSON-compatible) form of the given packer tree; raises :class:`SchemaError` if
+    it holds values that cannot be serialized (e.g., lambdas)"""
+    return _encode_packer(pkr, type(pkr).__name__)
+
+
+#=======================================================================================================================
+# decoding
+#=======================================================================================================================
+def _resolve(name):
+    modname, _, qualname = name.partition(":")
+    try:
+        target = import_module(modname)
+        for part in qualname.split("."):
+            target = getattr(target, part)
+    except (ImportError, AttributeError):
+        raise SchemaError("Cannot resolve %r" % (name,))
+    return target
+
+def _decode_packer(schema):
+    classes, _, _ = _get_registry()
+    typename = schema["type"]
+    cls = classes.get(typename) or _resolve(typename)
+    if not (isinstance(cls, type) and issubclass(cls, Packer)):
+        raise SchemaError("%r is not a packer class" % (typename,))
+    pkr = cls.__new__(cls)
+    pkr.__setstate__(dict((name, _decode(value)) for name, value in schema.items() if name != "type"))
+    return pkr
+
+def _decode(value):
+    if isinstance(value, (tuple, list)):
+        return tuple(_decode(v) for v in value)
+    elif not isinstance(value, dict):
+        return value
+    elif "type" in value:
+        return _decode_packer(value)
+    elif "ref" in value:
+        name = value["ref"]
+        if ":" not in name:
+            try:
+                return _get_registry()[1][name]
+            except KeyError:
+                raise SchemaError("Unknown packer %r" % (name,))
+        return _resolve(name)
+    elif "list" in value:
+        return [_decode(v) for v in value["list"]]
+    elif "dict" in value:
+        return dict((_decode(k), _decode(v)) for k, v in value["dict"])
+    elif "bytes" in value:
+        return unhexlify(value["bytes"].encode("ascii"))
+    elif "const" in value:
+        return CtxConst(_decode(value["const"]))
+    elif "this" in value:
+        expr = Path("this")
+        for name in value["this"]:
+            expr = Path(name, expr)
+        return expr
+    elif "binop" in value:
+        op = value["binop"]
+        op = _binops[op] if isinstance(op, six.string_types) else _decode(op)
+        return BinExpr(op, _decode(value["lhs"]), _decode(value["rhs"]))
+    elif "unop" in value:
+        op = value["unop"]
+        op = _unops[op] if isinstance(op, six.string_types) else _decode(op)
+        return UniExpr(op, _decode(value["operand"]))
+    elif "format" in value:
+        return _struct.Struct(str(value["format"]))
+    elif "partial" in value:
+        return partial(_decode(value["partial"]), *_decode(value["args"]), **_decode(value["keywords"]))
+    elif "special" in value:
+        if value["special"] != "NotImplemented":
+            raise SchemaError("Unknown special value %r" % (value["special"],))
+        return NotImplemented
+    elif "record" in value:
+        return _rebuild_record_class(value["record"], tuple(value["fields"]))
+    else:
+        raise SchemaError("Invalid schema value %r" % (value,))
+
+def from_schema(schema):
+    """Rebuilds a packer tree from its declarative form (see :func:`to_schema`)"""
+    return _decode(schema)
+
+
+def dumps(pkr, **kwargs):
+    """Returns the declarative form of the packer as a JSON string (keys are sorted, so the output is stable)"""
+    kwargs.setdefault("sort_keys", True)
+    return json.dumps(to_schema(pkr), **kwargs)
+
+def loads(text):
+    """Rebuilds a packer tree from a JSON string produced by :func:`dumps`"""
+    return from_schema(json.loads(text))
@@ -0,0 +1,334 @@
+"""
+Streaming decoding of files (or sockets, pipes, etc.) that consist of many concatenated top-level records.
+:class:`RecordIterator` (returned by :func:`Packer.iter_unpack`) reads the input in chunks and yields one
+record at a time, so memory is bounded by the chunk size and the size of the largest record.
+:class:`Decoder` is the push-style counterpart, for data that arrives in arbitrary chunks (e.g., from a
+socket).
+"""
+import six
+from construct3.packers import Adapter, Raw, Range, Struct, Sequence, Embedded, PackerError, RawError, RangeError
+from construct3.layout import analyze
+from construct3.lib.buffers import CopyingBufferStream
+from construct3.lib.config import Config
+
+
+class TruncatedRecordError(RawError):
+    """Raised when the input ends in the middle of a record"""
+    pass
+
+class RecordError(PackerError):
+    """Raised when a record fails to decode for another reason than missing data; ``offset`` is the position of
+    the record in the input and ``error`` is the original exception (which is also its cause)"""
+    def __init__(self, error, offset):
+        PackerError.__init__(self, "%s: %s (record at offset %d)" % (type(error).__name__, error, offset))
+        self.error = error
+        self.offset = offset
+
+
+class _TrackingStream(CopyingBufferStream):
+    # records whether a read ran past the end of the buffer, that is, whether decoding needed more data than
+    # was buffered (as opposed to failing on the data itself)
+    __slots__ = ["exhausted"]
+    def __init__(self, buffer, offset = 0):
+        CopyingBufferStream.__init__(self, buffer, offset)
+        self.exhausted = False
+    def read(self, count = -1):
+        if count is None or count < 0 or self.offset + count > len(self.buffer):
+            self.exhausted = True
+        return CopyingBufferStream.read(self, count)
+
+
+class RecordIterator(object):
+    """
+    Iterates over the records in ``source``, which is either a file-like object or a path. Reaching the end of
+    the input at a record boundary stops the iteration; reaching it in the middle of a record raises
+    :class:`TruncatedRecordError`.
+
+    ``offset`` is the (absolute) position of the next record in the input; saving it after processing a
+    record and passing it back later (``iter_unpack(path, offset = saved)``) resumes from that record. Files
+    opened by the iterator are closed when it is exhausted, or by :func:`close` (or a ``with`` block).
+
+    Records should be self-delimiting: when decoding a record (of variable size) reaches the end of the data
+    read so far, it is parsed again with more data, in case it had a greedy member (e.g., ``uint8[:]``). Other
+    errors (e.g., a validation error in a corrupt record) raise a :class:`RecordError`
+    """
+    def __init__(self, packer, source, chunk_size = 64 * 1024, offset = None):
+        if isinstance(source, six.string_types) or hasattr(source, "__fspath__"):
+            self._stream = open(source, "rb")
+            self._owned = True
+        else:
+            self._stream = source
+            self._owned = False
+        if offset is not None:
+            self._stream.seek(offset)
+        else:
+            try:
+                offset = self._stream.tell()
+            except (AttributeError, IOError, OSError):
+                offset = 0
+        self.packer = packer
+        self.chunk_size = chunk_size
+        self.offset = offset
+        self._buffer = six.b("")
+        self._pos = 0
+        self._eof = False
+        layout = analyze(packer)
+        self._size = layout.size if layout.fixed and layout.size else None
+
+    def __repr__(self):
+        return "RecordIterator(%r, offset = %d)" % (self.packer, self.offset)
+    def __iter__(self):
+        return self
+    def __enter__(self):
+        return self
+    def __exit__(self, t, v, tb):
+        self.close()
+    def close(self):
+        if self._owned and not self._stream.closed:
+            self._stream.close()
+        self._eof = True
+        self._buffer = six.b("")
+        self._pos = 0
+
+    def _fill(self, count):
+        # appends at least ``count`` bytes (unless the input ends), dropping the consumed data
+        chunks = []
+        while count > 0 and not self._eof:
+            chunk = self._stream.read(max(count, self.chunk_size))
+            if not chunk:
+                self._eof = True
+                break
+            chunks.append(chunk)
+            count -= len(chunk)
+        if chunks:
+            self._buffer = self._buffer[self._pos:] + six.b("").join(chunks)
+            self._pos = 0
+
+    def _truncated(self, reason):
+        available = len(self._buffer) - self._pos
+        self.close()
+        raise TruncatedRecordError("Truncated record at offset %d (%d trailing bytes): %s" % (
+            self.offset, available, reason))
+
+    def __next__(self):
+        while True:
+            available = len(self._buffer) - self._pos
+            if self._size is not None and available < self._size and not self._eof:
+                self._fill(self._size - available)
+                continue
+            if available == 0:
+                if not self._eof:
+                    self._fill(self.chunk_size)
+                    continue
+                self.close()
+                raise StopIteration()
+            if self._size is not None and available < self._size:
+                self._truncated("expected %d bytes" % (self._size,))
+            stream = _TrackingStream(self._buffer, self._pos)
+            try:
+                obj = self.packer._unpack(stream, {}, Config())
+            except Exception as ex:
+                if not stream.exhausted or not isinstance(ex, (RawError, RangeError)):
+                    six.raise_from(RecordError(ex, self.offset), ex)
+                if self._eof:
+                    self._truncated(ex)
+                self._fill(max(available, self.chunk_size))
+                continue
+            end = stream.offset
+            if (stream.exhausted or end == len(self._buffer)) and self._size is None and not self._eof:
+                self._fill(self.chunk_size)
+                continue
+            self.offset += end - self._pos
+            self._pos = end
+            return obj
+    next = __next__
+
+
+#=======================================================================================================================
+# push decoding
+#=======================================================================================================================
+class _Incomplete(Exception):
+    # raised by frame functions when ``needed`` bytes (from the start of the record) are required to go on
+    def __init__(self, needed):
+        Exception.__init__(self, needed)
+        self.needed = needed
+
+class _FrameContext(dict):
+    # the context of a partially received record: members are only decoded when an expression looks them up
+    __slots__ = ["_view", "_members"]
+    def __init__(self, parent, view):
+        dict.__init__(self, _ = parent)
+        self._view = view
+        self._members = {}
+    def __missing__(self, name):
+        pkr, offset, size = self._members[name]
+        if offset + size > len(self._view):
+            raise _Incomplete(offset + size)
+        obj = self[name] = pkr._unpack(CopyingBufferStream(self._view, offset), self, Config())
+        return obj
+
+def _plain_underlying(pkr):
+    while isinstance(pkr, Adapter) and type(pkr)._unpack is Adapter._unpack:
+        pkr = pkr.underlying
+    return pkr
+
+def _frame_function(pkr):
+    # returns a function ``(view, start, ctx)`` that computes the size of the record at ``view[start:]``
+    # (raising _Incomplete with an absolute offset), or None if the packer's size cannot be computed up front
+    layout = analyze(pkr)
+    if layout.fixed:
+        size = layout.size
+        return lambda view, start, ctx: size
+    inner = _plain_underlying(pkr)
+    if type(inner) is Raw:
+        return lambda view, start, ctx: inner.length(ctx)
+    if type(inner) is Range:
+        item = analyze(inner.itempkr)
+        if not item.fixed or inner.mincount is not inner.maxcount:
+            return None
+        itemsize = item.size
+        return lambda view, start, ctx: inner.mincount(ctx) * itemsize
+    if type(inner) is Struct:
+        members = inner.members
+    elif type(inner) is Sequence:
+        members = list(enumerate(inner.members))
+    else:
+        return None
+    parts = []
+    for name, pkr2 in members:
+        if isinstance(pkr2, Embedded):
+            return None
+        frame2 = _frame_function(pkr2)
+        if frame2 is None:
+            return None
+        parts.append((name, pkr2, frame2))
+    def frame(view, start, ctx):
+        ctx2 = _FrameContext(ctx, view)
+        offset = start
+        for name, pkr2, frame2 in parts:
+            size = frame2(view, offset, ctx2)
+            if name is not None:
+                ctx2._members[name] = (pkr2, offset, size)
+            offset += size
+        return offset - start
+    return frame
+
+def framer(pkr):
+    """Returns a function ``(view, ctx)`` that computes the size of the record at the start of ``view``, or
+    ``None`` if more data is needed to tell. The size is known for fixed-size packers, and for Structs and
+    Sequences (possibly under adapters, e.g., ``PascalString``) made of fixed-size members, ``Raw`` members and
+    arrays of fixed-size items whose length/count is given by preceding members (length prefixes). Returns
+    ``None`` for other packers"""
+    frame = _frame_function(pkr)
+    if frame is None:
+        return None
+    def frame_size(view, ctx):
+        try:
+            return frame(view, 0, ctx)
+        except _Incomplete:
+            return None
+    return frame_size
+
+
+class Decoder(object):
+    """
+    An incremental (push) decoder: ``feed()`` it data as it arrives and it returns the records that were
+    completed. When the size of the pending record can be computed up front (see :func:`framer`), the record
+    is parsed only once all of its bytes have arrived; otherwise parsing is attempted again whenever the pending
+    data has doubled, so that a large record fed in small chunks is not parsed over and over (``flush()`` and
+    ``close()`` parse it right away). Either way, bytes of records that were already returned are never parsed
+    again, and incoming chunks are only joined once a record may be complete.
+
+    ``offset`` is the number of bytes consumed by the returned records; ``pending`` is the number of buffered
+    bytes (of an incomplete record). A record that fails to decode for another reason than missing data raises
+    a :class:`RecordError`; if records were completed before it by the same ``feed()``, they are returned first
+    and the error is raised by the next call. The failing record remains pending, so feeding more data raises
+    the error again
+    """
+    def __init__(self, packer):
+        self.packer = packer
+        self.offset = 0
+        self._framer = _frame_function(packer)
+        self._buffer = six.b("")
+        self._pos = 0
+        self._chunks = []
+        self._available = 0
+        self._needed = 1
+        self._error = None
+
+    def __repr__(self):
+        return "Decoder(%r, offset = %d, pending = %d)" % (self.packer, self.offset, self.pending)
+    @property
+    def pending(self):
+        return self._available
+
+    def _raise_error(self):
+        ex = self._error
+        if ex is not None:
+            self._error = None
+            six.raise_from(ex, ex.error)
+
+    def feed(self, data):
+        """Adds the given data, returning a list of the records completed by it"""
+        if data:
+            self._chunks.append(data)
+            self._available += len(data)
+        self._raise_error()
+        if self._available < self._needed:
+            return []
+        buffer = self._buffer[self._pos:] + six.b("").join(self._chunks)
+        del self._chunks[:]
+        pos = 0
+        records = []
+        try:
+            while pos < len(buffer):
+                available = len(buffer) - pos
+                stream = _TrackingStream(buffer, pos)
+                if self._framer is not None:
+                    try:
+                        size = self._framer(stream.buffer, pos, {})
+                    except _Incomplete as ex:
+                        size = ex.needed - pos
+                    if size > available:
+                        self._needed = size
+                        break
+                    obj = self.packer._unpack(stream, {}, Config())
+                else:
+                    try:
+                        obj = self.packer._unpack(stream, {}, Config())
+                    except (RawError, RangeError):
+                        if not stream.exhausted:
+                            raise
+                        self._needed = 2 * available
+                        break
+                self.offset += stream.offset - pos
+                pos = stream.offset
+                records.append(obj)
+            else:
+                self._needed = 1
+        except Exception as ex:
+            if not records:
+                six.raise_from(RecordError(ex, self.offset), ex)
+            self._error = RecordError(ex, self.offset)
+        finally:
+            # the buffered data is kept (from the first record that was not returned) even if decoding failed
+            self._buffer = buffer
+            self._pos = pos
+            self._available = len(buffer) - pos
+        return records
+
+    def flush(self):
+        """Parses the pending data right away, returning a list of the records completed by it"""
+        self._needed = 0
+        return self.feed(None)
+
+    def close(self):
+        """Signals the end of the input, returning a list of the records completed by the pending data; raises
+        :class:`TruncatedRecordError` if an incomplete record remains (or the error of the pending record, if it
+        fails for another reason)"""
+        records = self.flush()
+        self._raise_error()
+        if self._available:
+            raise TruncatedRecordError("Truncated record at offset %d (%d trailing bytes)" % (
+                self.offset, self._available))
+        return records
@@ -0,0 +1,237 @@
+"""
+Tracing of decoding: which byte range every field was decoded from::
+
+    trace = trace_unpack(ipv4_header, data, "ipv4_header")
+    trace.value                   # the unpacked object (or None if unpacking failed; see ``trace.error``)
+    for path, start, end, pkr in trace:
+        ...
+    print(trace.hexdump(data))    # an annotated hexdump of the fields
+
+The trace is a parse tree stored in flat arrays (the field path, start and end offsets, packer and parent of
+every node, in pre-order), rather than in an object per node, so that large inputs can be traced. It is
+collected with the same instrumentation as :mod:`construct3.profiling`, so nodes are named by their field
+paths, and fields that are decoded together by fast paths (fused numbers, byte-aligned bit structs, compiled
+packers) are a single node. The offsets of fields inside bit structs are rounded out to whole bytes.
+"""
+from array import array
+from bisect import bisect_left
+from construct3.packers import FusedFormatted, PackerError
+from construct3.profiling import Instrument
+from construct3.lib.binutil import BitStreamReader, BitStreamWriter, annotated_hexdump
+from construct3.lib.buffers import CopyingBufferStream
+from construct3.lib.config import Config
+
+
+def _bit_position(stream):
+    # the position of the stream in bits, or None if it cannot tell
+    try:
+        if isinstance(stream, BitStreamReader):
+            return stream.stream.tell() * 8 - stream.count
+        elif isinstance(stream, BitStreamWriter):
+            return stream.stream.tell() * 8 + stream.count
+        return stream.tell() * 8
+    except (AttributeError, IOError, OSError):
+        return None
+
+
+class Trace(Instrument):
+    """
+    The parse tree of an unpacked input (see :func:`trace_unpack`). Node ``i`` is the field ``paths[path_ids[i]]``
+    decoded by ``packers[packer_ids[i]]`` from ``starts[i]`` to ``ends[i]``; ``parents[i]`` is the index of its
+    parent node (``-1`` for top-level nodes). Indexing or iterating the trace gives
+    ``(path, start, end, packer)`` tuples.
+
+    ``value`` is the unpacked object and ``error`` the exception that stopped unpacking (if any); ``failed`` is
+    then the index of the last node that started before the error
+    """
+    def __init__(self, root = None):
+        Instrument.__init__(self, root)
+        self.paths = []
+        self.packers = []
+        self.path_ids = array("l")
+        self.packer_ids = array("l")
+        self.starts = array("q")
+        self.ends = array("q")
+        self.parents = array("l")
+        self.value = None
+        self.error = None
+        self.failed = None
+        self._path_index = {}
+        self._packer_index = {}
+        self._ascending = True
+        self._frames = [(-1, None, -1, None)]
+
+    def __repr__(self):
+        return "Trace(%r, %d nodes)" % (self.root, len(self))
+    def __len__(self):
+        return len(self.starts)
+    def __getitem__(self, index):
+        return (self.paths[self.path_ids[index]], self.starts[index], self.ends[index],
+            self.packers[self.packer_ids[index]])
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def _add(self, path, pkr, start, end, parent):
+        path_id = self._path_index.get(path)
+        if path_id is None:
+            path_id = self._path_index[path] = len(self.paths)
+            self.paths.append(path)
+        packer_id = self._packer_index.get(id(pkr))
+        if packer_id is None:
+            # the packer is kept in ``packers``, so its id cannot be reused
+            packer_id = self._packer_index[id(pkr)] = len(self.packers)
+            self.packers.append(pkr)
+        if self.starts and start < self.starts[-1]:
+            self._ascending = False
+        self.path_ids.append(path_id)
+        self.packer_ids.append(packer_id)
+        self.starts.append(start)
+        self.ends.append(end)
+        self.parents.append(parent)
+        return len(self.starts) - 1
+
+    def _enter(self, pkr, stream, cfg):
+        parent, parent_path, parent_depth, _ = self._frames[-1]
+        path, depth = self._field_path(parent_path, parent_depth, pkr, cfg)
+        if stream.__class__ is CopyingBufferStream:
+            start = stream.offset
+        else:
+            pos = _bit_position(stream)
+            start = -1 if pos is None else pos >> 3
+        index = self._add(path, pkr, start, start, parent)
+        frame = (index, path, depth, cfg.name if pkr.__class__ is FusedFormatted else None)
+        self._frames.append(frame)
+        return frame
+
+    def _exit(self, frame, stream):
+        self._frames.pop()
+        index, path, _, names = frame
+        if self.starts[index] < 0:
+            return
+        if stream.__class__ is CopyingBufferStream:
+            self.ends[index] = stream.offset
+        else:
+            pos = _bit_position(stream)
+            if pos is None:
+                return
+            self.ends[index] = (pos + 7) >> 3
+        if names is None:
+            return
+        fused = self.packers[self.packer_ids[index]]
+        if isinstance(names, tuple) and self.ends[index] - self.starts[index] == fused.fmt.size:
+            # the fields of fused numbers are added as children, so they can be told apart
+            base = path.rsplit(".", 1)[0]
+            offset = self.starts[index]
+            for name, pkr in zip(names, fused.members):
+                size = pkr.fmt.size
+                self._add("%s.%s" % (base, name), pkr, offset, offset + size, index)
+                offset += size
+
+    def fields(self):
+        """Returns the indices of the innermost fields, that is, the outermost node of every field path that has
+        no sub-fields, with a known (and non-empty) byte range; fields are sorted by their start"""
+        count = len(self)
+        outer = [-1] * count
+        has_subfields = [False] * count
+        path_ids = self.path_ids
+        parents = self.parents
+        for i in range(count):
+            p = parents[i]
+            if p >= 0 and path_ids[p] == path_ids[i]:
+                outer[i] = outer[p]
+            else:
+                outer[i] = i
+                if p >= 0:
+                    has_subfields[outer[p]] = True
+        starts = self.starts
+        ends = self.ends
+        indices = [i for i in range(count)
+            if outer[i] == i and not has_subfields[i] and 0 <= starts[i] < ends[i]]
+        indices.sort(key = starts.__getitem__)
+        return indices
+
+    def _is_field(self, index):
+        # whether the node is one of fields(), looking only at its parent and at the start of its subtree (which
+        # is contiguous in pre-order): it has no sub-fields if its descendants only wrap the same path
+        if not 0 <= self.starts[index] < self.ends[index]:
+            return False
+        path_ids = self.path_ids
+        parents = self.parents
+        path_id = path_ids[index]
+        if parents[index] >= 0 and path_ids[parents[index]] == path_id:
+            return False
+        i = index + 1
+        while i < len(parents) and parents[i] >= index:
+            if path_ids[i] != path_id:
+                return False
+            i += 1
+        return True
+
+    def _region_fields(self, start, end):
+        # the fields() that overlap ``[start, end)``. The starts of the nodes ascend in pre-order (unless a field
+        # was decoded out of order, e.g., by a Pointer), so the nodes in the region are found by bisection
+        if not self._ascending:
+            return self.fields()
+        starts = self.starts
+        ends = self.ends
+        first = bisect_left(starts, start)
+        # the nodes that start before the region but end in it (or are empty) precede the first node in it
+        while first > 0 and (ends[first - 1] > start or starts[first - 1] == ends[first - 1]):
+            first -= 1
+        indices = [i for i in range(first, bisect_left(starts, end)) if self._is_field(i)]
+        indices.sort(key = starts.__getitem__)
+        return indices
+
+    def hexdump(self, data, start = 0, end = None, linesize = 16, color = False):
+        """Returns an annotated hexdump of ``data`` (the traced input) that marks the boundaries of the fields
+        and labels them by their paths (see :func:`construct3.lib.binutil.annotated_hexdump`). Only the fields
+        in the dumped lines are looked up, so a region of a large trace is dumped quickly"""
+        prefix = (self.root + ".") if self.root else None
+        if end is None or end > len(data):
+            end = len(data)
+        spans = []
+        for i in self._region_fields(start - start % linesize, end):
+            label = self.paths[self.path_ids[i]]
+            if prefix and label.startswith(prefix):
+                label = label[len(prefix):]
+            spans.append((self.starts[i], self.ends[i], label))
+        return annotated_hexdump(data, spans, linesize, start, end, color)
+
+
+def trace_unpack(packer, buf_or_stream, root = None, many = False):
+    """
+    Unpacks an object from the given buffer (or stream) while tracing it, returning a :class:`Trace`; ``root``
+    names the top-level packer in the field paths (the class name by default). With ``many``, records are
+    unpacked one after the other until the end of the buffer, and ``value`` is the list of records (a record
+    that consumes no data fails with a :class:`PackerError`, rather than being repeated forever).
+    Exceptions raised while unpacking are not propagated, but kept in the trace's ``error``
+    """
+    if hasattr(buf_or_stream, "read"):
+        stream = buf_or_stream
+        if many:
+            pos = stream.tell()
+            size = stream.seek(0, 2)
+            stream.seek(pos)
+    else:
+        stream = CopyingBufferStream(buf_or_stream)
+        size = len(stream.buffer)
+    trace = Trace(root)
+    values = []
+    with trace:
+        try:
+            if not many:
+                values.append(packer._unpack(stream, {}, Config()))
+            while many and stream.tell() < size:
+                offset = stream.tell()
+                values.append(packer._unpack(stream, {}, Config()))
+                if stream.tell() == offset:
+                    raise PackerError("Empty record at offset %d" % (offset,))
+        except Exception as ex:
+            trace.error = ex
+            trace.failed = len(trace) - 1 if len(trace) else None
+    if many:
+        trace.value = values
+    elif values:
+        trace.value = values[0]
+    return trace
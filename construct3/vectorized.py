@@ -0,0 +1,120 @@
+"""
+Vectorized decoding of arrays of fixed-layout records into NumPy structured arrays. A packer is eligible when
+it is built only of ``Formatted`` numbers, fixed-size ``Raw`` data and ``Padding``, arranged in (possibly
+nested or embedded) Structs and fixed-count arrays. The whole array is then decoded with a single
+``numpy.frombuffer`` call instead of building a ``Container`` per record.
+
+NumPy is an optional dependency; it is only imported when this module is used.
+"""
+from construct3.packers import PackerError, Struct, Range, Raw, Embedded, CtxConst
+from construct3.numbers import Formatted
+from construct3.adapters import Padding
+from construct3.layout import analyze
+from construct3.fusion import split_format
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class NotVectorizableError(PackerError):
+    pass
+
+_codes = {
+    "b" : "i1", "B" : "u1", "h" : "i2", "H" : "u2", "i" : "i4", "I" : "u4", "l" : "i4", "L" : "u4",
+    "q" : "i8", "Q" : "u8", "e" : "f2", "f" : "f4", "d" : "f8",
+}
+
+def _require_numpy():
+    if numpy is None:
+        raise ImportError("construct3.vectorized requires numpy (pip install numpy)")
+
+def _const_count(pkr):
+    if (isinstance(pkr.mincount, CtxConst) and isinstance(pkr.maxcount, CtxConst) and
+            pkr.mincount.value is not None and pkr.mincount.value == pkr.maxcount.value):
+        return pkr.mincount.value
+    return None
+
+def _struct_fields(pkr, path, names, formats, offsets, base):
+    offset = base
+    for name, pkr2 in pkr.members:
+        if isinstance(pkr2, Embedded) and isinstance(pkr2.underlying, Struct):
+            offset = _struct_fields(pkr2.underlying, path, names, formats, offsets, offset)
+            continue
+        if isinstance(pkr2, Padding):
+            size = analyze(pkr2).size
+            if size is None:
+                raise NotVectorizableError("%s: padding must have a fixed size" % (path,))
+            offset += size
+            continue
+        if name is None:
+            raise NotVectorizableError("%s: unnamed member %r cannot be vectorized" % (path, pkr2))
+        dtype = _to_dtype(pkr2, "%s.%s" % (path, name))
+        names.append(name)
+        formats.append(dtype)
+        offsets.append(offset)
+        offset += dtype.itemsize
+    return offset
+
+def _to_dtype(pkr, path):
+    if isinstance(pkr, Formatted):
+        info = split_format(pkr)
+        if info is None or info[1] not in _codes:
+            raise NotVectorizableError("%s: unsupported number format %r" % (path, pkr.FORMAT))
+        order, code = info
+        return numpy.dtype(("|" if order is None else order) + _codes[code])
+    elif type(pkr) is Raw:
+        if not isinstance(pkr.length, CtxConst):
+            raise NotVectorizableError("%s: raw data must have a fixed length" % (path,))
+        return numpy.dtype("V%d" % (pkr.length.value,))
+    elif type(pkr) is Range:
+        count = _const_count(pkr)
+        if count is None:
+            raise NotVectorizableError("%s: arrays must have a fixed number of items" % (path,))
+        return numpy.dtype((_to_dtype(pkr.itempkr, path + "[]"), (count,)))
+    elif type(pkr) is Struct:
+        names, formats, offsets = [], [], []
+        size = _struct_fields(pkr, path, names, formats, offsets, 0)
+        return numpy.dtype({"names" : names, "formats" : formats, "offsets" : offsets, "itemsize" : size})
+    else:
+        raise NotVectorizableError("%s: %r cannot be mapped to a numpy dtype (only numbers, fixed-size raw "
+            "data, padding, Structs and fixed-count arrays are supported)" % (path, pkr))
+
+def to_dtype(pkr):
+    """Returns the numpy dtype equivalent to the given (fixed-layout) packer, or raises
+    :class:`NotVectorizableError`"""
+    _require_numpy()
+    return _to_dtype(pkr, type(pkr).__name__)
+
+def _item_and_count(pkr, count):
+    if type(pkr) is Range:
+        if count is None:
+            count = _const_count(pkr)
+        return pkr.itempkr, count
+    return pkr, count
+
+def unpack_array(pkr, buf, count = None, offset = 0):
+    """Decodes an array of records from the given buffer into a numpy structured array. ``pkr`` is either the
+    record packer or a ``Range``/``Array`` over it; ``count`` defaults to the (constant) count of the Range,
+    or to as many records as the buffer holds. The returned array is a view of ``buf`` (no copy is made)"""
+    itempkr, count = _item_and_count(pkr, count)
+    dtype = to_dtype(itempkr)
+    return numpy.frombuffer(buf, dtype, -1 if count is None else count, offset)
+
+def pack_array(pkr, arr):
+    """Encodes a numpy (structured) array of records, returning the packed bytes"""
+    itempkr, count = _item_and_count(pkr, None)
+    dtype = to_dtype(itempkr)
+    arr = numpy.asarray(arr)
+    if count is not None and len(arr) != count:
+        raise NotVectorizableError("Expected %d items, found %d" % (count, len(arr)))
+    if arr.dtype != dtype:
+        if arr.dtype.names is not None and dtype.names is not None:
+            arr2 = numpy.zeros(len(arr), dtype)
+            for name in dtype.names:
+                arr2[name] = arr[name]
+            arr = arr2
+        else:
+            arr = arr.astype(dtype)
+    return arr.tobytes()
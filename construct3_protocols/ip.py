@@ -1,16 +1,24 @@
-from construct3 import (Struct, Adapter, Enum, int8u, this, Computed, int16ub, Raw, Padding, flag, 
+from binascii import unhexlify
+from construct3 import (Struct, Adapter, Enum, uint8, this, Computed, uint16b, Raw, Padding, flag, Embedded,
     BitStruct, Bits, nibble)
 
-ipaddr = Adapter(int8u[4], 
-    decode = lambda obj, ctx: ".".join(str(x) for x in obj),
-    encode = lambda obj, ctx: [int(x) for x in obj.split(".")]
-)
+# module-level functions (rather than lambdas), so that these packers can be pickled and serialized
+def _join_ipaddr(obj, ctx):
+    return ".".join(str(x) for x in obj)
+def _split_ipaddr(obj, ctx):
+    return [int(x) for x in obj.split(".")]
+def _words_to_bytes(obj, ctx):
+    return obj * 4
+def _bytes_to_words(obj, ctx):
+    return obj // 4
+
+ipaddr = Adapter(uint8[4], decode = _join_ipaddr, encode = _split_ipaddr)
 
 ipv4_header = Struct(
-    +BitStruct(
+    Embedded(BitStruct(
         "version" / nibble,
-        "header_length" / Adapter(nibble, decode = lambda obj, _: obj * 4, encode = lambda obj, _: obj / 4),
-    ),
+        "header_length" / Adapter(nibble, decode = _words_to_bytes, encode = _bytes_to_words),
+    )),
     "tos" / BitStruct(
         "precedence" / Bits(3),
         "minimize_delay" / flag,
@@ -19,20 +27,20 @@ ipv4_header = Struct(
         "minimize_cost" / flag,
         Padding(1),
     ),
-    "total_length" / int16ub,
+    "total_length" / uint16b,
     "payload_length" / Computed(this.total_length - this.header_length),
-    int16ub / "identification",
-    +BitStruct(
+    "identification" / uint16b,
+    Embedded(BitStruct(
         "flags" / Struct(
             Padding(1),
             "dont_fragment" / flag,
             "more_fragments" / flag,
         ),
         "frame_offset" / Bits(13),
-    ),
-    "ttl" / int8u,
-    "protocol" / Enum(int8u, ICMP = 1, TCP = 6, UDP = 17),
-    "checksum" / int16ub,
+    )),
+    "ttl" / uint8,
+    "protocol" / Enum(uint8, ICMP = 1, TCP = 6, UDP = 17),
+    "checksum" / uint16b,
     "source" / ipaddr,
     "destination" / ipaddr,
     "options" / Raw(this.header_length - 20),
@@ -40,18 +48,9 @@ ipv4_header = Struct(
 
 
 if __name__ == "__main__":
-    cap = "4500003ca0e3000080116185c0a80205d474a126".decode("hex")
+    cap = unhexlify("4500003ca0e3000080116185c0a80205d474a126")
     obj = ipv4_header.unpack(cap)
     print (obj)
     #rebuilt = ipv4_header.pack(obj)
     #print (repr(rebuilt))
     #assert cap == rebuilt
-
-
-
-
-
-
-
-
-
@@ -15,10 +15,11 @@ setup(name = "construct3",
     author_email = "tomerfiliba@gmail.com",
     license = "MIT",
     url = "http://construct.readthedocs.org",
-    packages = ["construct3", "construct3.lib"],
+    packages = ["construct3", "construct3.lib", "construct3.compiler"],
     platforms = ["POSIX", "Windows"],
     requires = ["six"],
     install_requires = ["six"],
+    extras_require = {"numpy" : ["numpy"]},
     keywords = "construct, data structure, binary, parser, builder, pack, unpack",
     #use_2to3 = False,
     #zip_safe = True,
@@ -0,0 +1,105 @@
+import asyncio
+import struct
+import unittest
+from construct3 import Struct, Raw, PascalString, OneOf, this, uint8, uint16b, uint32b
+from construct3.packers import PackerError
+from construct3.adapters import ValidationError
+from construct3.streaming import TruncatedRecordError, RecordError
+from construct3.aio import unpack_async, pack_async, AsyncRecordStream, AsyncRecordWriter
+
+
+class CountingReader(asyncio.StreamReader):
+    def __init__(self, data):
+        asyncio.StreamReader.__init__(self)
+        self.feed_data(data)
+        self.feed_eof()
+        self.calls = 0
+    async def readexactly(self, n):
+        self.calls += 1
+        return await asyncio.StreamReader.readexactly(self, n)
+
+class FakeWriter(object):
+    def __init__(self):
+        self.writes = []
+    def write(self, data):
+        self.writes.append(data)
+    async def drain(self):
+        pass
+
+
+class TestAsync(unittest.TestCase):
+    fixed = Struct("a" / uint16b, "b" / uint32b)
+    framed = Struct("length" / uint16b, "data" / Raw(this.length), "crc" / uint32b)
+
+    def run_async(self, func, data):
+        # readers must be created within the event loop
+        async def main():
+            return await func(CountingReader(data))
+        return asyncio.run(main())
+
+    def test_unpack_fixed(self):
+        async def read(reader):
+            return [await self.fixed.unpack_async(reader) for _ in range(2)], reader.calls
+        self.assertEqual(self.run_async(read, self.fixed.pack(dict(a = 1, b = 2)) * 2),
+            ([dict(a = 1, b = 2)] * 2, 2))
+
+    def test_unpack_length_prefixed(self):
+        obj = dict(length = 5, data = b"hello", crc = 7)
+        async def read(reader):
+            return (await self.framed.unpack_async(reader), await PascalString(uint8).unpack_async(reader),
+                reader.calls)
+        self.assertEqual(self.run_async(read, self.framed.pack(obj) + b"\x02hi"), (obj, "hi", 4))
+
+    def test_unpack_errors(self):
+        self.assertRaises(asyncio.IncompleteReadError, self.run_async,
+            lambda reader: unpack_async(self.framed, reader), b"\x00\x05hel")
+        pkr = Struct("count" / uint8, "items" / PascalString(uint8)[this.count])
+        self.assertRaises(PackerError, self.run_async, lambda reader: unpack_async(pkr, reader), b"")
+
+    def test_record_stream(self):
+        records = [dict(length = i, data = b"x" * i, crc = i) for i in range(100)]
+        data = b"".join(self.framed.pack(r) for r in records)
+        async def read(reader):
+            return [r async for r in AsyncRecordStream(self.framed, reader, chunk_size = 13)]
+        self.assertEqual(self.run_async(read, data), records)
+        self.assertRaises(TruncatedRecordError, self.run_async, read, data[:-1])
+
+    def test_record_stream_errors(self):
+        pkr = Struct("tag" / OneOf(uint8, [1]), "value" / uint8)
+        async def read(reader):
+            records = []
+            try:
+                async for r in AsyncRecordStream(pkr, reader):
+                    records.append(r)
+            except RecordError as ex:
+                return records, ex
+        records, ex = self.run_async(read, b"\x01\x05\x01\x06\x09\x07\x01\x08")
+        self.assertEqual(records, [dict(tag = 1, value = 5), dict(tag = 1, value = 6)])
+        self.assertTrue("record at offset 4" in str(ex))
+        self.assertTrue(isinstance(ex.error, ValidationError))
+
+    def test_writer(self):
+        fake = FakeWriter()
+        writer = AsyncRecordWriter(self.framed, fake, size_hint = 8)
+        records = [dict(length = i * 10, data = b"y" * (i * 10), crc = i) for i in range(20)]
+        async def send(reader):
+            for r in records:
+                await writer.send(r)
+        self.run_async(send, b"")
+        self.assertEqual(fake.writes, [self.framed.pack(r) for r in records])
+        self.assertRaises(struct.error, writer.write, dict(length = 1, data = b"y", crc = "bad"))
+
+    def test_pack_async(self):
+        fake = FakeWriter()
+        records = [dict(a = 1, b = 2), dict(length = 100, data = b"z" * 100, crc = 3)]
+        async def send(reader):
+            await self.fixed.pack_async(records[0], fake)
+            await pack_async(self.framed, records[1], fake, size_hint = 16)
+        self.run_async(send, b"")
+        self.assertTrue(all(isinstance(data, memoryview) for data in fake.writes))
+        self.assertEqual([data.tobytes() for data in fake.writes], [self.fixed.pack(records[0]),
+            self.framed.pack(records[1])])
+
+
+if __name__ == "__main__":
+    unittest.main()
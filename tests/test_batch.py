@@ -0,0 +1,75 @@
+import unittest
+import struct
+from six import b
+from construct3 import Struct, Sequence, Raw, PascalString, this, uint8, uint16b, uint32b, uint32l, Container
+from construct3.packers import RawError
+from construct3.batch import _get_plan
+
+
+header = Struct("kind" / uint8, "length" / uint16b, "seq" / uint32b)
+message = Struct("kind" / uint8, "length" / uint8, "data" / Raw(this.length), "name" / PascalString(uint8))
+
+
+class TestUnpackMany(unittest.TestCase):
+    def test_fused(self):
+        self.assertIsNotNone(_get_plan(header))
+        objs = [Container(kind = i, length = i * 3, seq = i * 1000) for i in range(10)]
+        buffers = [header.pack(obj) for obj in objs]
+        self.assertEqual(header.unpack_many(buffers), objs)
+        self.assertEqual(list(header.unpack_many(iter(buffers), lazy = True)), objs)
+        # trailing data is ignored, as with unpack()
+        self.assertEqual(header.unpack_many([buffers[1] + b("xx")]), [objs[1]])
+
+    def test_fused_kinds(self):
+        rec = Struct("a" / uint8, "b" / uint16b, record = True)
+        self.assertEqual([(r.a, r.b) for r in rec.unpack_many([b("\x01\x00\x02"), b("\x03\x00\x04")])],
+            [(1, 2), (3, 4)])
+        self.assertEqual(uint16b.unpack_many([b("\x00\x05"), b("\x01\x00")]), [5, 256])
+        seq = Sequence(uint8, uint16b)
+        self.assertIsNotNone(_get_plan(seq))
+        self.assertIsNone(_get_plan(Struct("a" / uint16b, "b" / uint32l)))
+        self.assertEqual(seq.unpack_many([b("\x01\x00\x02")]), [[1, 2]])
+
+    def test_interpreted(self):
+        self.assertIsNone(_get_plan(message))
+        objs = [Container(kind = i, length = i, data = b("x") * i, name = "n%d" % (i,)) for i in range(5)]
+        buffers = [message.pack(obj) for obj in objs]
+        self.assertEqual(message.unpack_many(buffers), [message.unpack(buf) for buf in buffers])
+        self.assertEqual(message.unpack_many(buffers), objs)
+        views = message.unpack_many([bytearray(buf) for buf in buffers], zero_copy = True)
+        self.assertIsInstance(views[2].data, memoryview)
+        self.assertEqual(views[2].data.tobytes(), b("xx"))
+
+    def test_errors(self):
+        for pkr, good, bad in [(header, header.pack(dict(kind = 1, length = 2, seq = 3)), b("\x01\x00")),
+                (message, message.pack(dict(kind = 1, length = 1, data = b("x"), name = "")), b("\x01\x05ab"))]:
+            results = pkr.unpack_many([good, bad, good])
+            self.assertEqual(len(results), 3)
+            self.assertIsInstance(results[1], RawError)
+            self.assertEqual(results[0], pkr.unpack(good))
+            self.assertEqual(results[2], pkr.unpack(good))
+            self.assertRaises(RawError, pkr.unpack_many, [good, bad], errors = "raise")
+            self.assertRaises(ValueError, pkr.unpack_many, [good], errors = "ignore")
+
+
+class TestPackMany(unittest.TestCase):
+    def test_pack(self):
+        for pkr, objs in [(header, [dict(kind = i, length = i, seq = i) for i in range(5)]),
+                (message, [dict(kind = i, length = i, data = b("y") * i, name = "abc") for i in range(5)]),
+                (uint16b, [1, 2, 3])]:
+            self.assertEqual(pkr.pack_many(objs), [pkr.pack(obj) for obj in objs])
+            self.assertEqual(list(pkr.pack_many(iter(objs), lazy = True)), [pkr.pack(obj) for obj in objs])
+
+    def test_errors(self):
+        for pkr, good, bad in [(header, dict(kind = 1, length = 2, seq = 3), dict(kind = 1, length = 2)),
+                (header, dict(kind = 1, length = 2, seq = 3), dict(kind = 1000, length = 2, seq = 3)),
+                (message, dict(kind = 1, length = 1, data = b("x"), name = ""), dict(kind = 1, length = 1))]:
+            results = pkr.pack_many([good, bad, good])
+            self.assertEqual(results[0], pkr.pack(good))
+            self.assertEqual(results[2], pkr.pack(good))
+            self.assertIsInstance(results[1], (KeyError, struct.error))
+            self.assertRaises((KeyError, struct.error), pkr.pack_many, [bad], errors = "raise")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,166 @@
+import unittest
+from io import BytesIO
+from six import b
+from construct3 import (BitStruct, Bits, bit, nibble, octet, flag, Padding, Raw, Struct, Adapter, Container, uint8,
+    this, Embedded)
+from construct3.packers import RawError, Bitwise
+from construct3.lib.binutil import BitStreamReader, BitStreamWriter
+from construct3.compiler import compile_packer
+
+
+class TestBitStreams(unittest.TestCase):
+    def test_reader(self):
+        reader = BitStreamReader(BytesIO(b("\xa5\x0f\xff")))
+        self.assertEqual(reader.read_int(3), 5)
+        self.assertEqual(reader.read(5), b("\x00\x00\x01\x00\x01"))
+        self.assertEqual(reader.read_int(12), 0x0ff)
+        self.assertRaises(ValueError, reader.close)
+        self.assertEqual(reader.read_int(4), 0xf)
+        reader.close()
+        self.assertRaises(EOFError, reader.read_int, 1)
+
+    def test_writer(self):
+        stream = BytesIO()
+        writer = BitStreamWriter(stream)
+        writer.write_int(5, 3)
+        writer.write(b("\x00\x00\x01\x00\x01"))
+        writer.write_int(0x0ff, 12)
+        self.assertRaises(ValueError, writer.close)
+        writer.write_int(0xf, 4)
+        writer.close()
+        self.assertEqual(stream.getvalue(), b("\xa5\x0f\xff"))
+
+    def test_large(self):
+        data = bytes(bytearray(range(256))) * 64
+        reader = BitStreamReader(BytesIO(data))
+        values = [reader.read_int(4) for _ in range(len(data) * 2)]
+        reader.close()
+        stream = BytesIO()
+        writer = BitStreamWriter(stream)
+        for v in values:
+            writer.write_int(v, 4)
+        writer.close()
+        self.assertEqual(stream.getvalue(), data)
+
+
+class TestBits(unittest.TestCase):
+    pkr = BitStruct(
+        "version" / nibble,
+        "ihl" / nibble,
+        "flag" / flag,
+        "more" / bit,
+        "delta" / Bits(6, signed = True),
+        "swapped" / Bits(16, swapped = True),
+        Padding(4),
+        "raw" / Raw(4),
+    )
+    data = b("\x45\x83\x12\x34\x0a")
+
+    def test_roundtrip(self):
+        obj = self.pkr.unpack(self.data)
+        self.assertEqual((obj.version, obj.ihl, obj.flag, obj.more, obj.delta, obj.swapped),
+            (4, 5, True, 0, 3, 0x3412))
+        self.assertEqual(obj.raw, b("\x01\x00\x01\x00"))
+        self.assertEqual(self.pkr.pack(obj), self.data)
+        obj.delta = -3
+        self.assertEqual(self.pkr.unpack(self.pkr.pack(obj)).delta, -3)
+
+    def test_compiled(self):
+        compiled = compile_packer(self.pkr)
+        obj = compiled.unpack(self.data)
+        self.assertEqual(obj, self.pkr.unpack(self.data))
+        self.assertEqual(compiled.pack(obj), self.data)
+
+    def test_errors(self):
+        pkr = Struct("a" / uint8, "b" / BitStruct("x" / Bits(12), "y" / nibble))
+        self.assertRaises(RawError, pkr.unpack, b("\x01\x02"))
+        self.assertRaises(RawError, compile_packer(pkr).unpack, b("\x01\x02"))
+        self.assertRaises(ValueError, pkr.pack, dict(a = 1, b = dict(x = -1, y = 0)))
+        self.assertEqual(octet.unpack(b("\x00\x01\x01\x01\x00\x00\x00\x01")), 0x71)
+
+
+class TestBitFields(unittest.TestCase):
+    def make(self):
+        return Struct(
+            "a" / BitStruct(
+                "version" / nibble,
+                "header_length" / Adapter(nibble, decode = lambda obj, _: obj * 4, encode = lambda obj, _: obj // 4),
+            ),
+            "tos" / BitStruct(
+                "precedence" / Bits(3),
+                "minimize_delay" / flag,
+                "high_throughput" / flag,
+                "high_reliability" / flag,
+                "minimize_cost" / flag,
+                Padding(1),
+            ),
+            "b" / BitStruct(
+                "flags" / Struct(Padding(1), "dont_fragment" / flag, "more_fragments" / flag),
+                "frame_offset" / Bits(13, signed = True),
+            ),
+        )
+
+    def test_fast_path(self):
+        pkr = self.make()
+        slow = self.make()
+        for _, member in slow.members:
+            member._fields = False
+        self.assertTrue(pkr.members[2][1]._get_fields())
+        for data in [b("\x45\xb4\x40\x05"), b("\x4f\x48\x3f\xff"), b("\x00\x00\x00\x00")]:
+            obj = pkr.unpack(data)
+            self.assertEqual(obj, slow.unpack(data))
+            self.assertEqual(pkr.pack(obj), data)
+            self.assertEqual(slow.pack(obj), data)
+        obj = pkr.unpack(b("\x45\xb4\x5f\xff"))
+        self.assertEqual(obj.a, Container(version = 4, header_length = 20))
+        self.assertEqual(obj.tos.precedence, 5)
+        self.assertEqual((obj.tos.minimize_delay, obj.tos.high_throughput), (True, False))
+        self.assertEqual(obj.b.flags, Container(dont_fragment = True, more_fragments = False))
+        self.assertEqual(obj.b.frame_offset, -1)
+
+    def test_compiled(self):
+        pkr = self.make()
+        compiled = compile_packer(pkr)
+        self.assertTrue("read_int" not in compiled.source)
+        for data in [b("\x45\xb4\x40\x05"), b("\x4f\x48\x3f\xff")]:
+            obj = compiled.unpack(data)
+            self.assertEqual(obj, pkr.unpack(data))
+            self.assertEqual(compiled.pack(obj), data)
+        self.assertRaises(RawError, compiled.unpack, b("\x45\xb4\x40"))
+        pkr = Bitwise(Struct("x" / nibble, "y" / nibble, record = True))
+        obj = compile_packer(pkr).unpack(b("\x12"))
+        self.assertTrue(type(obj) is pkr.underlying.record_class)
+        self.assertEqual(compile_packer(pkr).pack(obj), b("\x12"))
+
+    def test_not_eligible(self):
+        self.assertFalse(BitStruct("x" / nibble)._get_fields())
+        self.assertFalse(BitStruct("x" / Bits(8, swapped = True))._get_fields())
+        self.assertFalse(BitStruct("x" / nibble, "y" / Raw(this.x))._get_fields())
+        self.assertRaises(ValueError, BitStruct("x" / nibble).unpack, b("\x12"))
+
+    def test_errors(self):
+        pkr = BitStruct("x" / Bits(12), "y" / nibble, "r" / Raw(8))
+        self.assertRaises(RawError, pkr.unpack, b("\x01\x02"))
+        self.assertRaises(ValueError, pkr.pack, dict(x = -1, y = 0, r = b("\x00") * 8))
+        self.assertRaises(RawError, pkr.pack, dict(x = 1, y = 0, r = b("\x00")))
+
+    def test_records(self):
+        pkr = Bitwise(Struct("x" / nibble, "y" / nibble, record = True))
+        obj = pkr.unpack(b("\x12"))
+        self.assertTrue(type(obj) is pkr.underlying.record_class)
+        self.assertEqual((obj.x, obj.y), (1, 2))
+        self.assertEqual(pkr.pack(obj), b("\x12"))
+        pkr = Bitwise(Struct("x" / nibble, "y" / nibble, container_factory = dict))
+        self.assertEqual(pkr.unpack(b("\x12")), {"x" : 1, "y" : 2})
+
+    def test_embedded(self):
+        # embedded bit structs store their fields in the enclosing struct, so they take the slow path
+        pkr = Struct(Embedded(BitStruct("x" / nibble, "y" / nibble)), "data" / Raw(this.y))
+        obj = pkr.unpack(b("\x12ab"))
+        self.assertEqual(obj, Container(x = 1, y = 2, data = b("ab")))
+        self.assertEqual(pkr.pack(obj), b("\x12ab"))
+        self.assertEqual(compile_packer(pkr).unpack(b("\x12ab")), obj)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import mmap
+import tempfile
+import unittest
+from six import b
+from construct3 import (Struct, Sequence, Raw, Pointer, anchor, this, uint8, uint16b, uint32l, float64l, flag,
+    PascalString, BitStruct, nibble)
+from construct3.packers import RawError
+from construct3.lib.buffers import BufferStream
+
+
+record = Struct(
+    "len" / uint8,
+    "data" / Raw(this.len),
+    "a" / uint16b,
+    "b" / uint32l,
+    "c" / float64l,
+    "name" / PascalString(uint8),
+    "ok" / flag,
+    "bits" / BitStruct("x" / nibble, "y" / nibble),
+    "ptr" / Pointer(0, uint8),
+    "here" / anchor,
+)
+data = b("\x03xyz\x00\x05\x06\x00\x00\x00") + b("\x00") * 8 + b("\x02hi\x01\x87")
+
+
+class TestZeroCopy(unittest.TestCase):
+    def test_same_result(self):
+        for buf in [data, bytearray(data), memoryview(data)]:
+            self.assertEqual(record.unpack(buf, zero_copy = True), record.unpack(data))
+
+    def test_memoryview_slices(self):
+        buf = bytearray(data)
+        obj = record.unpack(buf, zero_copy = True)
+        self.assertTrue(isinstance(obj.data, memoryview))
+        buf[1:4] = b("XYZ")
+        self.assertEqual(obj.data, b("XYZ"))
+        self.assertEqual(obj.here, len(data))
+
+    def test_offsets(self):
+        stream = BufferStream(b("\x00\x00") + data)
+        stream.seek(2)
+        self.assertEqual(record.unpack(stream, zero_copy = True).a, 5)
+        self.assertEqual(stream.tell(), len(data) + 2)
+
+    def test_fused(self):
+        pkr = Sequence(uint8, uint16b, uint32l)
+        self.assertEqual(pkr.unpack(b("\x01\x00\x02\x03\x00\x00\x00"), zero_copy = True), [1, 2, 3])
+        self.assertRaises(RawError, pkr.unpack, b("\x01\x00\x02\x03"), zero_copy = True)
+        self.assertRaises(RawError, uint16b.unpack, b("\x01"), zero_copy = True)
+
+    def test_mmap(self):
+        with tempfile.TemporaryFile() as f:
+            f.write(data)
+            f.flush()
+            mm = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+            obj = record.unpack(mm, zero_copy = True)
+            self.assertEqual(obj.data, b("xyz"))
+            self.assertEqual(obj.name, "hi")
+            del obj
+            mm.close()
+
+
+class TestPackInto(unittest.TestCase):
+    def test_pack_into(self):
+        obj = record.unpack(data)
+        buf = bytearray(len(data))
+        self.assertEqual(record.pack_into(obj, buf), len(data))
+        self.assertEqual(bytes(buf), data)
+
+    def test_offset(self):
+        pkr = Struct("len" / uint8, "data" / Raw(this.len), "a" / uint16b, "b" / uint32l)
+        buf = bytearray(12)
+        self.assertEqual(pkr.pack_into(dict(len = 2, data = b("hi"), a = 1, b = 2), buf, 2), 9)
+        self.assertEqual(bytes(buf), b("\x00\x00\x02hi\x00\x01\x02\x00\x00\x00\x00"))
+
+    def test_reuse(self):
+        pkr = Struct("a" / uint8, "b" / uint16b, "payload" / Raw(2))
+        buf = bytearray(10)
+        view = memoryview(buf)
+        offset = 0
+        for i in range(2):
+            offset += pkr.pack_into(dict(a = i, b = 0x102, payload = b("xy")), view, offset)
+        self.assertEqual(offset, 2 * pkr.sizeof())
+        self.assertEqual(bytes(buf[:offset]), b("\x00\x01\x02xy\x01\x01\x02xy"))
+
+    def test_too_small(self):
+        self.assertRaises(ValueError, Struct("a" / uint8, "b" / uint32l).pack_into, dict(a = 1, b = 2), bytearray(3))
+        self.assertRaises(ValueError, Raw(4).pack_into, b("abcd"), bytearray(3))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,199 @@
+import unittest
+from binascii import unhexlify
+from collections import OrderedDict
+from six import b
+from construct3 import (Struct, Sequence, Raw, Range, Embedded, Bitwise, Pointer, anchor, this, uint8, sint8,
+    uint16b, uint32l, float64l, uint24b, nibble, Padding, Computed, Enum, PascalString, BitStruct, Array, If, noop,
+    Bijection, Bits)
+from construct3.packers import Packer, Switch, SwitchError, RawError, RangeError
+from construct3.adapters import Flags
+from construct3.compiler import compile_packer, CompiledPacker, CompilerCache, LazyCompiled, structural_key
+
+
+class TestCompiler(unittest.TestCase):
+    def assertSame(self, pkr, data):
+        compiled = compile_packer(pkr)
+        self.assertTrue(isinstance(compiled, CompiledPacker))
+        obj = pkr.unpack(data)
+        self.assertEqual(compiled.unpack(data), obj)
+        self.assertEqual(compiled.pack(obj), pkr.pack(obj))
+        return compiled, obj
+
+    def test_numbers(self):
+        self.assertSame(Struct("a" / uint8, "b" / sint8, "c" / uint16b, "d" / uint32l, "e" / float64l),
+            b("\x01\xff\x00\x02\x03\x00\x00\x00") + b("\x00") * 8)
+
+    def test_context(self):
+        pkr = Struct(
+            "len" / uint8,
+            "data" / Raw(this.len * 2),
+            "inner" / Struct("x" / uint8, "y" / Raw(this._.len)),
+            "total" / Computed(this.len + this.inner.x),
+        )
+        _, obj = self.assertSame(pkr, b("\x02abcd\x05zz"))
+        self.assertEqual(obj.data, b("abcd"))
+        self.assertEqual(obj.total, 7)
+
+    def test_embedded_and_padding(self):
+        pkr = Struct(
+            "a" / uint8,
+            Padding(2),
+            Embedded(Struct("b" / uint8, "c" / Computed(this.b - this.a))),
+        )
+        _, obj = self.assertSame(pkr, b("\x01\x00\x00\x05"))
+        self.assertEqual(obj.c, 4)
+        pkr = Sequence(uint8, Padding(1), Embedded(Sequence(uint8, uint8)))
+        self.assertEqual(compile_packer(pkr).unpack(b("\x01\x00\x02\x03")), pkr.unpack(b("\x01\x00\x02\x03")))
+
+    def test_sequence_none(self):
+        # members whose value is None are skipped, and the following members are indexed accordingly
+        pkr = Sequence(uint8, If(this[0], uint8, noop), uint8, Computed(this[1] * 2))
+        self.assertEqual(pkr.unpack(b("\x00\x05")), [0, 5, 10])
+        self.assertEqual(compile_packer(pkr).unpack(b("\x00\x05")), [0, 5, 10])
+        self.assertEqual(compile_packer(pkr).unpack(b("\x01\x05\x06")), pkr.unpack(b("\x01\x05\x06")))
+        pkr = Sequence(uint8, Computed(None), Sequence(uint8), Computed(this[1][0] + 1))
+        self.assertEqual(compile_packer(pkr).unpack(b("\x01\x02")), [1, [2], 3])
+
+    def test_range(self):
+        self.assertSame(Struct("count" / uint8, "items" / Array(this.count, uint16b)), b("\x02\x00\x01\x00\x02"))
+        compiled = compile_packer(Range(1, 3, uint8))
+        self.assertEqual(compiled.unpack(b("\x01\x02\x03\x04")), [1, 2, 3])
+        self.assertRaises(RangeError, compiled.unpack, b(""))
+        self.assertRaises(RangeError, compiled.pack, [1, 2, 3, 4])
+
+    def test_switch(self):
+        pkr = Struct("type" / uint8, "value" / Switch(this.type, {1 : uint8, 2 : uint16b}))
+        self.assertSame(pkr, b("\x01\x07"))
+        self.assertSame(pkr, b("\x02\x00\x07"))
+        self.assertRaises(SwitchError, compile_packer(pkr).unpack, b("\x03\x00"))
+        self.assertSame(Struct("a" / uint8, "b" / If(this.a, uint8, Raw(0))), b("\x01\x02"))
+
+    def test_switch_cases(self):
+        pkr = Struct("type" / uint8, "value" / Switch(this.type, {
+            1 : Struct("x" / uint8, "data" / Raw(this._.type)),
+            2 : If(this.type > 1, uint16b, uint8),
+        }, default = Raw(2)))
+        for data in [b("\x01\x05a"), b("\x02\x00\x07"), b("\x09ab")]:
+            self.assertSame(pkr, data)
+        switch = pkr.members[1][1]
+        self.assertEqual(compile_packer(switch).sizeof({"type" : 1}), switch.sizeof({"type" : 1}))
+        pkr = BitStruct("type" / nibble, "value" / Switch(this.type, {1 : nibble, 2 : Raw(4)}))
+        self.assertSame(pkr, b("\x1f"))
+        self.assertSame(pkr, b("\x25"))
+
+    def test_switch_hits(self):
+        switch = Switch(this.type, {1 : uint8, 2 : uint16b}, default = Raw(1))
+        pkr = Struct("type" / uint8, "value" / switch)
+        uncounted = compile_packer(pkr)
+        self.assertFalse("_hits" in uncounted.source)
+        pkr.unpack(b("\x01\x07"))
+        self.assertEqual(switch.hits, {})
+        switch.count_hits()
+        compiled = compile_packer(pkr)
+        for data in [b("\x01\x07"), b("\x02\x00\x07"), b("\x05\x00")]:
+            pkr.unpack(data)
+            compiled.unpack(data)
+            uncounted.unpack(data)
+        self.assertEqual(switch.hits, {1 : 2, 2 : 2, 5 : 2})
+        switch.count_hits(False)
+        pkr.unpack(b("\x01\x07"))
+        self.assertEqual(switch.hits, {})
+
+    def test_adapters(self):
+        pkr = Struct(
+            "kind" / Enum(uint8, foo = 1, bar = 2),
+            "flags" / Flags(uint8, x = 1, y = 4),
+            "name" / PascalString(uint8),
+            "num" / uint24b,
+        )
+        _, obj = self.assertSame(pkr, b("\x02\x05\x03abc\x01\x02\x03"))
+        self.assertEqual(obj.kind, "bar")
+        self.assertEqual(obj.name, "abc")
+
+    def test_bitwise(self):
+        self.assertSame(BitStruct("x" / nibble, "y" / nibble), b("\x87"))
+        self.assertSame(Bitwise(Sequence(nibble, nibble)), b("\x87"))
+
+    def test_embedded_bitwise(self):
+        # embedded bit structs are inlined, with or without the single-integer fast path
+        from construct3_protocols.ip import ipv4_header
+        compiled, obj = self.assertSame(ipv4_header, unhexlify("4500003ca0e3000080116185c0a80205d474a126"))
+        self.assertFalse("_unpack(" in compiled.source or "_pack(" in compiled.source)
+        self.assertEqual(obj.frame_offset, 0)
+        pkr = Struct("a" / uint8, Embedded(BitStruct("b" / nibble, "c" / Array(2, Bits(2)))),
+            "d" / Computed(this.b + this.a))
+        compiled, obj = self.assertSame(pkr, b("\x01\x2d"))
+        self.assertFalse("_unpack(" in compiled.source)
+        self.assertEqual((obj.b, obj.c, obj.d), (2, [3, 1], 3))
+
+    def test_pointer(self):
+        pkr = Struct("offset" / uint8, "value" / Pointer(this.offset, uint8), "here" / anchor)
+        _, obj = self.assertSame(pkr, b("\x02\x00\x09"))
+        self.assertEqual(obj.value, 9)
+        self.assertEqual(obj.here, 1)
+
+    def test_sizeof(self):
+        self.assertEqual(compile_packer(Struct("a" / uint8, "b" / uint32l, Padding(3))).sizeof(), 8)
+        self.assertEqual(compile_packer(Struct("a" / uint8, "b" / Raw(this._.a))).sizeof({"a" : 5}), 6)
+        self.assertEqual(compile_packer(Bitwise(Sequence(nibble, nibble))).sizeof(), 1)
+
+    def test_short_read(self):
+        self.assertRaises(RawError, compile_packer(Struct("a" / uint16b)).unpack, b("\x01"))
+
+    def test_fallback(self):
+        class Custom(Packer):
+            def _unpack(self, stream, ctx, cfg):
+                return stream.read(2).upper()
+        compiled = compile_packer(Struct("a" / uint8, "b" / Custom()))
+        self.assertTrue("_unpack" in compiled.source)
+        self.assertEqual(compiled.unpack(b("\x01ab")).b, b("AB"))
+
+
+class TestCompilerCache(unittest.TestCase):
+    def test_structural_key(self):
+        def make():
+            return Struct("len" / uint8, "data" / Raw(this.len * 2), Padding(1))
+        self.assertEqual(structural_key(make()), structural_key(make()))
+        used = make()
+        used.unpack(b("\x01ab\x00"))
+        self.assertEqual(structural_key(used), structural_key(make()))
+        self.assertNotEqual(structural_key(make()), structural_key(Struct("len" / uint8, "data" / Raw(this.len))))
+
+    def test_equal_values(self):
+        # values that compare equal but differ in type (or order) are different structures
+        keys = [structural_key(Computed(v)) for v in (1, 1.0, True)]
+        self.assertEqual(len(set(keys)), 3)
+        self.assertNotEqual(structural_key(Computed(this[1])), structural_key(Computed(this[True])))
+        self.assertNotEqual(structural_key(OrderedDict([("a", 1), ("b", 2)])),
+            structural_key(OrderedDict([("b", 2), ("a", 1)])))
+        cache = CompilerCache()
+        ints = cache.compile(Bijection(Raw(1), {1 : b("\x01"), 0 : b("\x00")}))
+        bools = cache.compile(Bijection(Raw(1), {True : b("\x01"), False : b("\x00")}))
+        self.assertIsNot(bools, ints)
+        self.assertIs(bools.unpack(b("\x01")), True)
+        self.assertIs(ints.unpack(b("\x01")), 1)
+        self.assertEqual(cache.compile(Computed(1.0)).unpack(b("")), 1.0)
+        self.assertIsInstance(cache.compile(Computed(1)).unpack(b("")), int)
+
+    def test_hits_and_eviction(self):
+        cache = CompilerCache(maxsize = 2)
+        c1 = cache.compile(Struct("a" / uint8))
+        self.assertTrue(cache.compile(Struct("a" / uint8)) is c1)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        cache.compile(Struct("b" / uint8))
+        cache.compile(Struct("c" / uint8))
+        self.assertEqual(len(cache), 2)
+        self.assertFalse(cache.compile(Struct("a" / uint8)) is c1)
+        self.assertEqual((cache.hits, cache.misses), (1, 4))
+
+    def test_lazy(self):
+        cache = CompilerCache()
+        pkr = LazyCompiled(Struct("a" / uint8, "b" / uint16b), cache)
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(pkr.unpack(b("\x01\x00\x02")), dict(a = 1, b = 2))
+        self.assertEqual(pkr.pack(dict(a = 1, b = 2)), b("\x01\x00\x02"))
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+from construct3.lib.config import Config
+
+
+class TestConfig(unittest.TestCase):
+    def test_frames(self):
+        cfg = Config()
+        self.assertEqual(cfg.container, None)
+        with cfg.set(container = 1, embedded = True):
+            with cfg.set(container = 2, name = "a"):
+                self.assertEqual((cfg.container, cfg.embedded, cfg.name), (2, True, "a"))
+                cfg.name = "b"
+                cfg.digestor = 3
+            # only the attributes set by the frame are restored
+            self.assertEqual((cfg.container, cfg.embedded, cfg.name, cfg.digestor), (1, True, None, 3))
+            del cfg.embedded
+            self.assertEqual(len(cfg._frames), 1)
+        self.assertEqual((cfg.container, cfg.embedded), (None, None))
+        self.assertFalse("container" in cfg.__dict__)
+        self.assertFalse("embedded" in cfg.__dict__)
+        self.assertEqual(cfg._frames, [])
+
+    def test_restore_on_error(self):
+        cfg = Config()
+        try:
+            with cfg.set(container = 1):
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertEqual(cfg.container, None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+import sys
+import pickle
+import importlib
+import unittest
+from six import b
+from construct3 import Container, Struct, Embedded, Raw, Computed, this, uint8, uint16b
+from construct3.lib import containers
+from construct3.lib.containers import Record, record_class
+
+
+def pure_ordered_dict():
+    # the pure-Python OrderedDict, which Container is based on before Python 3.7 (on Python 2 in particular)
+    saved = sys.modules.pop("collections")
+    sys.modules["_collections"] = None
+    try:
+        return importlib.import_module("collections").OrderedDict
+    finally:
+        sys.modules["collections"] = saved
+        del sys.modules["_collections"]
+
+
+class TestContainer(unittest.TestCase):
+    def test_order(self):
+        c = Container([("b", 1), ("a", 2)], z = 3)
+        c.y = 4
+        self.assertEqual(list(c), ["b", "a", "z", "y"])
+        del c.a
+        c.a = 5
+        self.assertEqual(list(c.keys()), ["b", "z", "y", "a"])
+        self.assertEqual(list(c.values()), [1, 3, 4, 5])
+
+    def test_attributes(self):
+        c = Container(x = 1)
+        self.assertEqual(c.x, 1)
+        self.assertEqual(c["x"], 1)
+        self.assertFalse(hasattr(c, "y"))
+        self.assertRaises(AttributeError, delattr, c, "y")
+        self.assertEqual(c.pop("x"), 1)
+        self.assertEqual(c, {})
+
+    def test_repr(self):
+        self.assertEqual(repr(Container()), "Container()")
+        self.assertEqual(repr(Container(a = 1, b = Container(c = 2))), "Container:\n  a = 1\n  b = Container:\n    c = 2")
+
+    def test_pickle(self):
+        c = Container(a = 1, b = Container(c = 2))
+        c2 = pickle.loads(pickle.dumps(c))
+        self.assertEqual(c2, c)
+        self.assertEqual(list(c2), ["a", "b"])
+        self.assertTrue(isinstance(c2.b, Container))
+
+    def test_pure_ordered_dict(self):
+        base = pure_ordered_dict()
+        attrs = dict((k, v) for k, v in vars(Container).items() if k not in ("__slots__", "__dict__", "__weakref__"))
+        saved = containers._ordered_dict
+        containers._ordered_dict = base
+        try:
+            cls = type("Container", (base,), attrs)
+            c = cls([("b", 1)], a = 2)
+            c.z = 3
+            self.assertEqual(list(c.items()), [("b", 1), ("a", 2), ("z", 3)])
+            self.assertEqual((c.a, c["z"]), (2, 3))
+            del c.b
+            self.assertEqual(list(c), ["a", "z"])
+            self.assertFalse(hasattr(c, "y"))
+            self.assertEqual(repr(cls()), "Container()")
+        finally:
+            containers._ordered_dict = saved
+
+
+class TestRecord(unittest.TestCase):
+    def test_record(self):
+        Header = record_class("Header", ["version", "length", "flags"])
+        self.assertTrue(issubclass(Header, Record))
+        h = Header(4, length = 20)
+        self.assertEqual(h.version, 4)
+        self.assertEqual(h["length"], 20)
+        self.assertEqual(list(h), ["version", "length"])
+        h.flags = 0
+        self.assertEqual(h, Container(version = 4, length = 20, flags = 0))
+        self.assertEqual(h.items(), [("version", 4), ("length", 20), ("flags", 0)])
+        self.assertRaises(AttributeError, setattr, h, "other", 1)
+        self.assertRaises(KeyError, h.__getitem__, "other")
+        self.assertFalse(hasattr(h, "__dict__"))
+
+    def test_invalid_names(self):
+        self.assertRaises(ValueError, record_class, "R", ["a-b"])
+        self.assertRaises(ValueError, record_class, "R", ["keys"])
+        self.assertRaises(ValueError, record_class, "R", ["a", "a"])
+
+
+class TestStructRecords(unittest.TestCase):
+    pkr = Struct(
+        "version" / uint8,
+        "length" / uint16b,
+        Embedded(Struct("kind" / uint8, "double" / Computed(this.kind * 2))),
+        "data" / Raw(this.length),
+        record = "Header",
+    )
+
+    def test_unpack(self):
+        obj = self.pkr.unpack(b("\x04\x00\x02\x07ab"))
+        self.assertEqual(type(obj).__name__, "Header")
+        self.assertTrue(isinstance(obj, Record))
+        self.assertEqual(obj._fields, ("version", "length", "kind", "double", "data"))
+        self.assertEqual(obj, Container(version = 4, length = 2, kind = 7, double = 14, data = b("ab")))
+        self.assertFalse(hasattr(obj, "__dict__"))
+        self.assertTrue(type(self.pkr.unpack(b("\x04\x00\x00\x07"))) is type(obj))
+
+    def test_pack(self):
+        data = b("\x04\x00\x02\x07ab")
+        self.assertEqual(self.pkr.pack(self.pkr.unpack(data)), data)
+        self.assertEqual(self.pkr.pack(dict(version = 4, length = 2, kind = 7, double = 0, data = b("ab"))), data)
+
+    def test_compiled(self):
+        from construct3.compiler import compile_packer
+        compiled = compile_packer(self.pkr)
+        data = b("\x04\x00\x02\x07ab")
+        obj = compiled.unpack(data)
+        self.assertTrue(type(obj) is self.pkr.record_class)
+        self.assertEqual(obj, self.pkr.unpack(data))
+        self.assertEqual(compiled.pack(obj), data)
+        self.assertEqual(compiled.pack(Container(obj.items())), data)
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, Struct, "keys" / uint8, record = True)
+        self.assertRaises(TypeError, Struct, "a" / uint8, record = True, container_factory = dict)
+
+
+if __name__ == "__main__":
+    unittest.main()
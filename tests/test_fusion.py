@@ -0,0 +1,46 @@
+import unittest
+from six import b
+from construct3 import Struct, Sequence, Raw, this, uint8, sint8, uint16b, uint16l, uint32b, float64l, Padding
+from construct3.packers import FusedFormatted, RawError
+from construct3.compiler import compile_packer
+from construct3.fusion import fuse_formatted
+
+
+class TestFusion(unittest.TestCase):
+    def test_plan(self):
+        plan = fuse_formatted([("a", uint8), ("b", uint16b), ("c", uint32b), ("d", Raw(2)), ("e", uint8)])
+        self.assertEqual([name for name, _ in plan], [("a", "b", "c"), "d", "e"])
+        self.assertTrue(isinstance(plan[0][1], FusedFormatted))
+        self.assertEqual(plan[0][1].fmt.format, ">BHL")
+
+    def test_byteorder(self):
+        plan = fuse_formatted([("a", uint16b), ("b", uint8), ("c", uint16l), ("d", float64l)])
+        self.assertEqual([name for name, _ in plan], [("a", "b"), ("c", "d")])
+        self.assertEqual(plan[1][1].fmt.format, "<Hd")
+
+    def test_unnamed_not_fused(self):
+        plan = fuse_formatted([("a", uint8), (None, uint8), ("b", uint8)])
+        self.assertEqual([name for name, _ in plan], ["a", None, "b"])
+
+    def test_struct(self):
+        pkr = Struct("a" / uint8, "b" / sint8, "c" / uint16b, "len" / uint8, "data" / Raw(this.len), "d" / uint16l)
+        data = b("\x01\xff\x00\x02\x03xyz\x04\x00")
+        obj = pkr.unpack(data)
+        self.assertEqual(obj, dict(a = 1, b = -1, c = 2, len = 3, data = b("xyz"), d = 4))
+        self.assertEqual(list(obj.keys()), ["a", "b", "c", "len", "data", "d"])
+        self.assertEqual(pkr.pack(obj), data)
+        self.assertEqual(compile_packer(pkr).unpack(data), obj)
+        self.assertEqual(compile_packer(pkr).pack(obj), data)
+        self.assertRaises(RawError, pkr.unpack, b("\x01\xff"))
+
+    def test_sequence(self):
+        pkr = Sequence(uint8, uint8, Padding(1), uint16b, uint16b)
+        data = b("\x01\x02\x00\x00\x03\x00\x04")
+        self.assertEqual(pkr.unpack(data), [1, 2, 3, 4])
+        self.assertEqual(pkr.pack([1, 2, 3, 4]), data)
+        self.assertEqual(compile_packer(pkr).unpack(data), [1, 2, 3, 4])
+        self.assertEqual(compile_packer(pkr).pack([1, 2, 3, 4]), data)
+
+
+if __name__ == "__main__":
+    unittest.main()
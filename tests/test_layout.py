@@ -0,0 +1,87 @@
+import unittest
+from six import b
+from construct3 import (Struct, Sequence, Raw, Range, Embedded, Bitwise, Pointer, this, uint8, uint16b, uint32l,
+    nibble, Padding, Computed, Array, PascalString, BitStruct, If)
+from construct3.packers import Adapter, Switch, SwitchError, While
+from construct3.layout import analyze, unpack_record, FIXED, CONTEXTUAL, UNKNOWN
+
+
+header = Struct(
+    "a" / uint8,
+    Padding(1),
+    "b" / uint16b,
+    Embedded(Struct("c" / uint32l, "d" / Computed(this.c))),
+    "bits" / BitStruct("x" / nibble, "y" / nibble),
+    "arr" / Array(3, uint8),
+)
+
+
+class TestLayout(unittest.TestCase):
+    def test_fixed(self):
+        layout = analyze(header)
+        self.assertEqual(layout.kind, FIXED)
+        self.assertEqual(layout.size, 12)
+        self.assertEqual([(name, layout.offsetof(name)) for name in ["a", "b", "c", "d", "bits", "arr"]],
+            [("a", 0), ("b", 2), ("c", 4), ("d", 8), ("bits", 8), ("arr", 9)])
+        self.assertTrue(analyze(header) is layout)
+        self.assertEqual(header.sizeof(), 12)
+
+    def test_contextual(self):
+        pkr = Struct("len" / uint8, "data" / Raw(this.len), "tail" / uint16b)
+        layout = analyze(pkr)
+        self.assertEqual(layout.kind, CONTEXTUAL)
+        self.assertEqual(layout.size, None)
+        self.assertEqual(layout.offsetof("data"), 1)
+        self.assertFalse("tail" in layout.fields)
+        self.assertEqual(analyze(Array(this.n, uint8)).kind, CONTEXTUAL)
+        self.assertEqual(analyze(If(this.x, uint8, uint16b)).kind, CONTEXTUAL)
+        self.assertEqual(analyze(If(this.x, uint8, uint8)).kind, FIXED)
+
+    def test_unknown(self):
+        self.assertEqual(analyze(Range(0, None, uint8)).kind, UNKNOWN)
+        self.assertEqual(analyze(Struct("a" / uint8, "b" / Raw(this.a), "c" / uint8[1:3])).kind, UNKNOWN)
+        self.assertEqual(analyze(PascalString(uint8)).kind, CONTEXTUAL)
+
+    def test_sizeof(self):
+        self.assertEqual(Array(this.n, uint16b).sizeof({"n" : 4}), 8)
+        self.assertEqual(Struct("a" / uint8, "b" / Raw(this._.n)).sizeof({"n" : 3}), 4)
+        self.assertEqual(Sequence(uint8, Padding(2), Array(2, uint32l)).sizeof(), 11)
+        self.assertRaises(Exception, Range(1, 3, uint8).sizeof)
+
+    def test_sizeof_overrides(self):
+        # packers that compute their own size are not sized statically
+        class Doubled(Adapter):
+            def _sizeof(self, ctx, cfg):
+                return 2 * self.underlying._sizeof(ctx, cfg)
+        self.assertEqual(analyze(Doubled(uint8)).kind, UNKNOWN)
+        self.assertEqual(Doubled(uint8).sizeof(), 2)
+        self.assertEqual(Struct("a" / Doubled(uint16b), "b" / uint8).sizeof(), 5)
+        # switches without a default raise for keys that have no case
+        switch = Switch(this.t, {1 : uint8, 2 : uint8})
+        self.assertEqual(analyze(switch).kind, CONTEXTUAL)
+        self.assertEqual(switch.sizeof({"t" : 2}), 1)
+        self.assertRaises(SwitchError, switch.sizeof, {"t" : 9})
+        self.assertEqual(analyze(Switch(this.t, {1 : uint8}, default = uint8)).kind, FIXED)
+
+    def test_changed_cases(self):
+        switch = Switch(this.t, {1 : uint8}, default = uint8)
+        pkr = Struct("t" / uint8, "v" / switch)
+        self.assertEqual((analyze(pkr).size, pkr.sizeof()), (2, 2))
+        self.assertEqual(pkr.unpack(b("\x01\x05")).v, 5)
+        switch.cases[2] = uint16b
+        self.assertEqual(pkr.unpack(b("\x02\x00\x07")).v, 7)
+        self.assertEqual(analyze(pkr).kind, CONTEXTUAL)
+        self.assertEqual(switch.sizeof({"t" : 2}), 2)
+        switch.cases[2] = uint8
+        self.assertEqual(analyze(pkr).size, 2)
+
+    def test_unpack_record(self):
+        pkr = Struct("a" / uint8, "b" / uint16b)
+        data = b("\x01\x00\x02\x03\x00\x04\x05\x00\x06")
+        self.assertEqual(unpack_record(pkr, data, 1), dict(a = 3, b = 4))
+        self.assertEqual(unpack_record(pkr, data, 2, zero_copy = True), dict(a = 5, b = 6))
+        self.assertRaises(TypeError, unpack_record, PascalString(uint8), data, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
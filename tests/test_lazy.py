@@ -0,0 +1,175 @@
+import unittest
+from io import BytesIO
+from six import b
+from construct3 import Struct, Adapter, Raw, Padding, Container, this, uint8, uint16b, uint32b
+from construct3.packers import RawError, RangeError
+from construct3.lazy import LazyStruct, LazyContainer, LazyRange, LazyArray, LazyList, materialize
+from construct3 import PascalString, Range
+from construct3.compiler import compile_packer
+
+
+class CountingAdapter(Adapter):
+    def __init__(self, underlying):
+        Adapter.__init__(self, underlying)
+        self.calls = 0
+    def decode(self, obj, ctx):
+        self.calls += 1
+        return obj
+
+
+class TestLazyStruct(unittest.TestCase):
+    def make(self):
+        self.counter = CountingAdapter(uint32b)
+        return LazyStruct(
+            "kind" / uint8,
+            "length" / uint16b,
+            "value" / self.counter,
+            Padding(1),
+            "payload" / Raw(this.length),
+            "trailer" / Struct("a" / uint8, "b" / uint8),
+        )
+
+    data = b("\x07\x00\x03\x00\x00\x00\x2a\x00abc\x01\x02")
+
+    def test_lazy(self):
+        pkr = self.make()
+        obj = pkr.unpack(self.data)
+        self.assertTrue(isinstance(obj, LazyContainer))
+        self.assertEqual(obj.kind, 7)
+        self.assertEqual(self.counter.calls, 0)
+        self.assertEqual(obj.value, 42)
+        self.assertEqual(obj["value"], 42)
+        self.assertEqual(self.counter.calls, 1)
+        self.assertEqual(obj.trailer, Container(a = 1, b = 2))
+        self.assertEqual(obj.payload, b("abc"))
+        self.assertEqual(list(obj), ["kind", "length", "value", "payload", "trailer"])
+        self.assertEqual(self.counter.calls, 1)
+        self.assertEqual(materialize(obj), Struct(*pkr.members).unpack(self.data))
+        self.assertRaises(AttributeError, getattr, obj, "other")
+
+    def test_stream_position(self):
+        pkr = Struct("first" / self.make(), "after" / uint8)
+        obj = pkr.unpack(self.data + b("\xff"))
+        self.assertEqual(obj.after, 0xff)
+        self.assertEqual(obj.first.payload, b("abc"))
+
+        class Unbuffered(object):
+            def __init__(self, data):
+                self.stream = BytesIO(data)
+            def read(self, count = -1):
+                return self.stream.read(count)
+            def tell(self):
+                return self.stream.tell()
+            def seek(self, pos):
+                return self.stream.seek(pos)
+        stream = Unbuffered(b("\x01\x00\x02\x03"))
+        self.assertEqual(LazyStruct("a" / uint8, "b" / uint16b).unpack(stream).b, 2)
+        self.assertEqual(stream.tell(), 3)
+        stream = Unbuffered(self.data + b("\xff"))
+        self.assertEqual(pkr.unpack(stream).after, 0xff)
+        self.assertEqual(stream.tell(), len(self.data) + 1)
+
+    def test_read_through(self):
+        pkr = self.make()
+        stream = BytesIO(self.data + b("\xff"))
+        obj = pkr.unpack(stream)
+        self.assertEqual(stream.tell(), len(self.data))
+        self.assertEqual(self.counter.calls, 0)
+        self.assertEqual(obj._buffer.tobytes(), self.data)
+        # the stream's buffer is not kept exported
+        stream.write(b("\xfe\xfd"))
+        self.assertEqual(materialize(obj), Struct(*pkr.members).unpack(self.data))
+        self.assertRaises(RawError, pkr.unpack, BytesIO(self.data[:10]))
+
+    def test_length_prefixes(self):
+        counter = CountingAdapter(Raw(this.length))
+        pkr = Struct("first" / LazyStruct("length" / uint8, "payload" / counter, "tail" / uint8), "after" / uint8)
+        data = b("\x03abc\x01\x02")
+        for stream in [data, BytesIO(data)]:
+            obj = pkr.unpack(stream)
+            self.assertEqual((obj.first.tail, obj.after), (1, 2))
+            self.assertEqual(counter.calls, 0)
+        self.assertEqual(obj.first.payload, b("abc"))
+        self.assertEqual(counter.calls, 1)
+
+    def test_zero_copy(self):
+        obj = self.make().unpack(bytearray(self.data), zero_copy = True)
+        self.assertTrue(isinstance(obj.payload, memoryview))
+        self.assertEqual(obj.payload.tobytes(), b("abc"))
+
+    def test_pack_and_compile(self):
+        pkr = self.make()
+        obj = pkr.unpack(self.data)
+        self.assertEqual(pkr.pack(obj), self.data)
+        obj.kind = 8
+        self.assertEqual(pkr.pack(obj)[:1], b("\x08"))
+        self.assertTrue(isinstance(compile_packer(pkr).unpack(self.data), LazyContainer))
+
+    def test_errors(self):
+        self.assertRaises(RawError, self.make().unpack, self.data[:5])
+        self.assertRaises(RawError, LazyStruct("a" / uint32b).unpack, b("\x00"))
+
+
+class TestLazyRange(unittest.TestCase):
+    def test_fixed(self):
+        counter = CountingAdapter(uint16b)
+        pkr = LazyArray(1000, Struct("a" / counter, "b" / uint8), cache_size = 4)
+        data = b("").join(b("\x00") + bytes(bytearray([i % 256, i % 7])) for i in range(1000))
+        view = pkr.unpack(data)
+        self.assertTrue(isinstance(view, LazyList))
+        self.assertEqual(len(view), 1000)
+        self.assertEqual(counter.calls, 0)
+        self.assertEqual(view[300], Container(a = 300 % 256, b = 300 % 7))
+        self.assertEqual(view[-1].a, 999 % 256)
+        self.assertEqual(counter.calls, 2)
+        view[300]
+        self.assertEqual(counter.calls, 2)
+        self.assertEqual([item.b for item in view[10:13]], [3, 4, 5])
+        self.assertEqual(sum(1 for _ in view), 1000)
+        self.assertRaises(IndexError, view.__getitem__, 1000)
+        self.assertEqual(len(view._cache), 4)
+        self.assertEqual(view, Range(1000, 1000, pkr.itempkr).unpack(data))
+        self.assertEqual(pkr.pack(view), data)
+
+    def test_variable_count(self):
+        pkr = Struct("items" / LazyRange(2, None, uint16b), "after" / uint8)
+        obj = pkr.unpack(b("\x00\x01\x00\x02\x00\x03\x04"))
+        self.assertEqual(list(obj["items"]), [1, 2, 3])
+        self.assertEqual(obj.after, 4)
+        self.assertRaises(RangeError, LazyRange(2, 5, uint16b).unpack, b("\x00\x01"))
+        self.assertRaises(RangeError, LazyArray(3, uint16b).unpack, b("\x00\x01\x00\x02"))
+
+    def test_variable_size(self):
+        item = PascalString(uint8)
+        data = b("\x01a\x02bc\x03def\x00")
+        pkr = Struct("items" / LazyRange(0, None, item), "after" / uint8)
+        obj = pkr.unpack(data + b("\x07"))
+        self.assertEqual(len(obj["items"]), 4)
+        self.assertEqual(obj.after, 7)
+
+        view = LazyRange(0, None, item, scan = False).unpack(data)
+        self.assertEqual(list(view._offsets), [0])
+        self.assertEqual(view[2], "def")
+        self.assertEqual(len(view._offsets), 4)
+        self.assertEqual(list(view), ["a", "bc", "def", ""])
+        self.assertEqual(len(view), 4)
+        self.assertEqual(view[1:3], ["bc", "def"])
+        self.assertRaises(IndexError, view.__getitem__, 4)
+        self.assertEqual(materialize(LazyArray(2, item, scan = False).unpack(data)), ["a", "bc"])
+
+        stream = BytesIO(data + b("\x07"))
+        view = LazyRange(0, None, item).unpack(stream)
+        self.assertEqual(stream.tell(), len(data))
+        self.assertEqual(len(view._buffer), len(data))
+        stream.write(b("\x08"))
+        self.assertEqual(list(view), ["a", "bc", "def", ""])
+        stream = BytesIO(b("\x00\x01\x00\x02\x00\x03\x04"))
+        self.assertEqual(list(LazyRange(0, 2, uint16b).unpack(stream)), [1, 2])
+        self.assertEqual(stream.tell(), 4)
+
+    def test_compile(self):
+        self.assertTrue(isinstance(compile_packer(LazyArray(2, uint8)).unpack(b("\x01\x02")), LazyList))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import os
+import pickle
+import tempfile
+import unittest
+from binascii import unhexlify
+from six import b
+from construct3 import (Struct, Sequence, Raw, PascalString, BitStruct, Bits, If, this, uint8, word8, uint16b,
+    uint32b, uint16l, uint24l, sint24b)
+from construct3.packers import PackerError
+from construct3.streaming import TruncatedRecordError
+from construct3.parallel import parallel_unpack, shard_file
+from construct3_protocols.ip import ipv4_header
+
+
+class TestPickling(unittest.TestCase):
+    def roundtrip(self, obj):
+        return pickle.loads(pickle.dumps(obj, pickle.HIGHEST_PROTOCOL))
+
+    def test_singletons(self):
+        self.assertIs(self.roundtrip(uint8), uint8)
+        self.assertIs(self.roundtrip(word8), uint8)
+        self.assertIs(self.roundtrip(uint16l), uint16l)
+
+    def test_expressions(self):
+        for expr in [this.a, this._.b[0], this.a * 2 + 1, -this.a]:
+            self.assertEqual(repr(self.roundtrip(expr)), repr(expr))
+        self.assertEqual(self.roundtrip(this.a * 2 + 1)({"a" : 3}), 7)
+
+    def test_packers(self):
+        pkr = Struct("length" / uint8, "data" / Raw(this.length), "items" / uint16b[this.length],
+            "name" / PascalString(uint8), "flags" / BitStruct("a" / Bits(3), "b" / Bits(5)))
+        data = pkr.pack(dict(length = 2, data = b("ab"), items = [1, 2], name = "x", flags = dict(a = 1, b = 2)))
+        obj = pkr.unpack(data)
+        pkr2 = self.roundtrip(pkr)
+        self.assertEqual(pkr2.unpack(data), obj)
+        self.assertEqual(pkr2.pack(obj), data)
+
+    def test_adapters(self):
+        for pkr, data in [(uint24l, b("\x01\x02\x03")), (sint24b, b("\xff\xff\xfe")),
+                (Struct("flag" / uint8, "value" / If(this.flag, uint8, uint16b)), b("\x00\x00\x05"))]:
+            pkr2 = self.roundtrip(pkr)
+            self.assertEqual(pkr2.unpack(data), pkr.unpack(data))
+
+    def test_protocols(self):
+        data = unhexlify("4500003ca0e3000080116185c0a80205d474a126")
+        pkr2 = self.roundtrip(ipv4_header)
+        self.assertEqual(pkr2.unpack(data), ipv4_header.unpack(data))
+        self.assertEqual(pkr2.pack(pkr2.unpack(data)), data)
+
+    def test_records(self):
+        pkr = Struct("x" / uint8, "y" / uint8, record = "Point")
+        pkr2, rec = self.roundtrip((pkr, pkr.unpack(b("\x01\x02"))))
+        self.assertEqual(rec, dict(x = 1, y = 2))
+        self.assertIs(type(pkr2.unpack(b("\x01\x02"))), type(rec))
+        self.assertEqual(type(rec).__name__, "Point")
+
+
+class TestParallelUnpack(unittest.TestCase):
+    fixed = Struct("a" / uint16b, "b" / uint32b)
+    framed = Struct("length" / uint8, "data" / Raw(this.length))
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+    def tearDown(self):
+        os.remove(self.path)
+    def write(self, pkr, records):
+        with open(self.path, "wb") as f:
+            for r in records:
+                f.write(pkr.pack(r))
+
+    def test_fixed(self):
+        records = [dict(a = i % 65536, b = i) for i in range(1000)]
+        self.write(self.fixed, records)
+        shards = shard_file(self.fixed, self.path, 7)
+        self.assertEqual(shards[0][0], 0)
+        self.assertEqual(shards[-1][1], 6000)
+        self.assertTrue(all(start % 6 == 0 for start, _ in shards))
+        self.assertEqual(list(parallel_unpack(self.fixed, self.path, workers = 2)), records)
+        self.assertEqual(list(self.fixed.parallel_unpack(self.path, workers = 1)), records)
+
+    def test_length_prefixed(self):
+        records = [dict(length = i % 50, data = b("z") * (i % 50)) for i in range(500)]
+        self.write(self.framed, records)
+        self.assertEqual(len(shard_file(self.framed, self.path, 8)), 8)
+        self.assertEqual(list(parallel_unpack(self.framed, self.path, workers = 2)), records)
+        unordered = list(parallel_unpack(self.framed, self.path, workers = 2, ordered = False))
+        self.assertEqual(sorted(r.length for r in unordered), sorted(r["length"] for r in records))
+
+    def test_errors(self):
+        self.write(self.framed, [dict(length = 3, data = b("abc"))])
+        with open(self.path, "ab") as f:
+            f.write(b("\x05ab"))
+        self.assertRaises(TruncatedRecordError, shard_file, self.framed, self.path, 2)
+        self.assertRaises(TruncatedRecordError, shard_file, self.fixed, self.path, 2)
+        self.assertRaises(PackerError, shard_file, Sequence(uint8, uint8[:]), self.path, 2)
+
+    def test_empty(self):
+        self.assertEqual(list(parallel_unpack(self.fixed, self.path, workers = 2)), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
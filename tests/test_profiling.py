@@ -0,0 +1,96 @@
+import unittest
+from io import StringIO
+from six import b
+from construct3 import Struct, Raw, PascalString, BitStruct, Embedded, nibble, this, uint8, uint16b, profile
+from construct3.packers import Packer, RawError
+from construct3.numbers import Formatted
+
+
+header = Struct(
+    Embedded(BitStruct("version" / nibble, "length" / nibble)),
+    "body" / Struct(
+        "size" / uint8,
+        "data" / Raw(this.size),
+    ),
+    "name" / PascalString(uint8),
+)
+data = b("\x45\x03abc\x02hi")
+
+
+class TestProfile(unittest.TestCase):
+    def test_stats(self):
+        with profile("header") as prof:
+            for _ in range(3):
+                obj = header.unpack(data)
+        self.assertEqual(obj.body.data, b("abc"))
+        stats = prof.stats
+        self.assertEqual(stats[("header", "Struct")].calls, 3)
+        # embedded packers are named by their fields, rather than counted as their parent
+        self.assertEqual(stats[("header.{version,length}", "Embedded")].calls, 3)
+        self.assertEqual(stats[("header.{version,length}", "Struct")].calls, 3)
+        self.assertEqual(stats[("header", "Struct")].bytes, 3 * len(data))
+        self.assertEqual(stats[("header.body", "Struct")].calls, 3)
+        self.assertEqual(stats[("header.body.data", "Raw")].bytes, 9)
+        self.assertEqual(stats[("header.body.size", "uint8")].calls, 3)
+        self.assertEqual(stats[("header.name", "StringAdapter")].bytes, 9)
+        self.assertIsNone(stats[("header.version", "Bits")].bytes)
+        root = stats[("header", "Struct")]
+        self.assertTrue(root.cumulative >= stats[("header.body", "Struct")].cumulative)
+        self.assertTrue(0 <= root.self_time <= root.cumulative)
+
+    def test_fast_paths(self):
+        # fused numbers and byte-aligned bit structs are profiled field by field
+        pkr = Struct("a" / uint8, "b" / uint16b, "flags" / BitStruct("x" / nibble, "y" / nibble))
+        with profile("rec") as prof:
+            obj = pkr.unpack(b("\x01\x00\x02\x34"))
+            self.assertEqual(pkr.pack(obj), b("\x01\x00\x02\x34"))
+        self.assertEqual(obj.flags.y, 4)
+        self.assertEqual(prof.stats[("rec.b", "uint16b")].calls, 2)
+        self.assertEqual(prof.stats[("rec.flags.x", "Bits")].calls, 2)
+        self.assertEqual(prof.stats[("rec.flags", "Bitwise")].bytes, 2)
+        # the fast paths are back once the profile ends
+        self.assertEqual(pkr.unpack(b("\x01\x00\x02\x34")), obj)
+        self.assertTrue(pkr.members[2][1]._fields)
+
+    def test_pack(self):
+        obj = header.unpack(data)
+        with profile() as prof:
+            self.assertEqual(header.pack(obj), data)
+        self.assertEqual(prof.stats[("Struct.body.data", "Raw")].bytes, 3)
+        self.assertEqual(prof.stats[("Struct.name", "StringAdapter")].calls, 1)
+
+    def test_output(self):
+        with profile("header") as prof:
+            header.unpack(data)
+        lines = prof.table(sort = "calls", limit = 3).splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[0].split()[0] == "calls")
+        self.assertTrue(lines[1].endswith("header [Struct]"))
+        self.assertRaises(ValueError, prof.table, sort = "foo")
+        collapsed = prof.collapsed()
+        self.assertTrue("header [Struct];header.body [Struct];header.body.data [Raw] " in
+            "\n".join(collapsed))
+        for line in collapsed:
+            stack, count = line.rsplit(" ", 1)
+            self.assertTrue(int(count) >= 0)
+        f = StringIO()
+        prof.dump_collapsed(f)
+        self.assertEqual(f.getvalue().splitlines(), collapsed)
+
+    def test_restored(self):
+        originals = (Packer.__dict__.get("_unpack"), Struct.__dict__["_unpack"], Formatted.__dict__["_pack"])
+        prof = profile()
+        with prof:
+            self.assertIsNot(Struct.__dict__["_unpack"], originals[1])
+            self.assertRaises(RuntimeError, profile().start)
+            self.assertRaises(RawError, header.unpack, data[:4])
+            uint16b.unpack(b("\x00\x01"))
+        self.assertEqual((Packer.__dict__.get("_unpack"), Struct.__dict__["_unpack"], Formatted.__dict__["_pack"]),
+            originals)
+        # the failed call was recorded, and left no frames behind
+        self.assertEqual(prof.stats[("uint16b", "uint16b")].calls, 1)
+        self.assertEqual(len(prof._frames), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import json
+import unittest
+from binascii import unhexlify
+from six import b
+from construct3 import (Struct, Sequence, Raw, PascalString, BitStruct, Bits, If, Enum, Adapter, Embedded, this,
+    uint8, uint16b, uint24l, flag, nibble)
+from construct3.lazy import LazyStruct, LazyArray
+from construct3.schema import to_schema, from_schema, dumps, loads, SchemaError
+from construct3_protocols.ip import ipv4_header
+
+
+def double(obj, ctx):
+    return obj * 2
+def halve(obj, ctx):
+    return obj // 2
+
+
+class TestSchema(unittest.TestCase):
+    def roundtrip(self, pkr, obj):
+        data = pkr.pack(obj)
+        pkr2 = loads(dumps(pkr))
+        self.assertEqual(pkr2.unpack(data), pkr.unpack(data))
+        self.assertEqual(pkr2.pack(obj), data)
+        self.assertEqual(dumps(pkr2), dumps(pkr))
+        return pkr2
+
+    def test_simple(self):
+        self.assertEqual(to_schema(uint8), {"ref" : "uint8"})
+        self.assertIs(from_schema({"ref" : "uint16b"}), uint16b)
+        self.assertEqual(to_schema(Raw(this.a * 2 + 1))["length"],
+            {"binop" : "+", "lhs" : {"binop" : "*", "lhs" : {"this" : ("a",)}, "rhs" : 2}, "rhs" : 1})
+        self.assertEqual(from_schema(to_schema(Raw(-this._.a[0]))).length({"_" : {"a" : [3]}}), -3)
+
+    def test_struct(self):
+        pkr = Struct(
+            "length" / uint8,
+            "data" / Raw(this.length),
+            "x" / uint24l,
+            "name" / PascalString(uint16b),
+            "f" / flag,
+            "kind" / Enum(uint8, a = 1, b = 2),
+            "opt" / If(this.length > 2, uint8, uint16b),
+            "bits" / BitStruct("a" / Bits(3), "b" / nibble, "c" / Bits(1)),
+            "items" / uint16b[this.length * 2],
+            "scaled" / Adapter(uint8, decode = double, encode = halve),
+            Embedded(Struct("e" / uint8)),
+        )
+        self.roundtrip(pkr, dict(length = 3, data = b("abc"), x = 5, name = "hi", f = True, kind = "b", opt = 4,
+            bits = dict(a = 1, b = 2, c = 1), items = list(range(6)), scaled = 10, e = 7))
+
+    def test_records_and_lazy(self):
+        pkr = Sequence(Struct("x" / uint8, "y" / uint8, record = "Point"), LazyStruct("z" / uint8),
+            LazyArray(2, uint8))
+        pkr2 = loads(dumps(pkr))
+        obj = pkr2.unpack(b("\x01\x02\x03\x04\x05"))
+        self.assertEqual(type(obj[0]).__name__, "Point")
+        self.assertEqual(obj[0], dict(x = 1, y = 2))
+        self.assertEqual(obj[1].z, 3)
+        self.assertEqual(list(obj[2]), [4, 5])
+
+    def test_protocols(self):
+        obj = ipv4_header.unpack(unhexlify("4500003ca0e3000080116185c0a80205d474a126"))
+        pkr2 = self.roundtrip(ipv4_header, obj)
+        self.assertEqual(to_schema(pkr2)["members"], to_schema(ipv4_header)["members"])
+
+    def test_json(self):
+        pkr = Struct("a" / uint8, "b" / Raw(this.a))
+        text = dumps(pkr)
+        self.assertEqual(json.loads(text)["type"], "Struct")
+        self.assertEqual(dumps(loads(text)), text)
+
+    def test_errors(self):
+        self.assertRaises(SchemaError, to_schema, Adapter(uint8, decode = lambda obj, ctx: obj))
+        self.assertRaises(SchemaError, from_schema, {"ref" : "no_such_packer"})
+        self.assertRaises(SchemaError, from_schema, {"type" : "construct3.schema:to_schema"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,184 @@
+import os
+import tempfile
+import unittest
+from io import BytesIO
+from six import b
+from construct3 import Struct, Raw, PascalString, Array, OneOf, this, uint8, uint16b, uint32b
+from construct3.packers import PackerError, RangeError
+from construct3.adapters import ValidationError
+from construct3.streaming import RecordIterator, TruncatedRecordError, RecordError, Decoder, framer
+
+
+class TestIterUnpack(unittest.TestCase):
+    fixed = Struct("a" / uint16b, "b" / uint32b)
+    variable = Struct("length" / uint8, "data" / Raw(this.length))
+
+    def test_fixed(self):
+        records = [dict(a = i, b = i * 1000) for i in range(500)]
+        data = b("").join(self.fixed.pack(r) for r in records)
+        self.assertEqual(list(self.fixed.iter_unpack(BytesIO(data), chunk_size = 7)), records)
+
+    def test_variable(self):
+        records = [dict(length = i % 40, data = b("x") * (i % 40)) for i in range(300)]
+        data = b("").join(self.variable.pack(r) for r in records)
+        for chunk_size in (1, 5, 64, 100000):
+            self.assertEqual(list(self.variable.iter_unpack(BytesIO(data), chunk_size = chunk_size)), records)
+        self.assertEqual(list(PascalString(uint8).iter_unpack(BytesIO(b("\x01a\x00\x02bc")), chunk_size = 2)),
+            ["a", "", "bc"])
+
+    def test_truncated(self):
+        data = self.variable.pack(dict(length = 3, data = b("abc")))
+        it = self.variable.iter_unpack(BytesIO(data + data[:2]), chunk_size = 2)
+        self.assertEqual(next(it).data, b("abc"))
+        self.assertRaises(TruncatedRecordError, next, it)
+        it = self.fixed.iter_unpack(BytesIO(b("\x00") * 8))
+        self.assertTrue(next(it))
+        self.assertRaises(TruncatedRecordError, next, it)
+        self.assertTrue(issubclass(TruncatedRecordError, PackerError))
+
+    def test_corrupt(self):
+        # errors that are not caused by running out of data are raised as is, without reading on
+        pkr = Struct("length" / uint8, "flags" / Array(this.length, OneOf(uint8, [1])))
+        stream = BytesIO(b("\x02\x01\x01\x02\x01\x02") + b("\x01\x01") * 300000)
+        it = pkr.iter_unpack(stream, chunk_size = 16)
+        self.assertEqual(next(it).flags, [1, 1])
+        try:
+            next(it)
+        except RecordError as ex:
+            self.assertEqual(ex.offset, 3)
+            self.assertTrue(isinstance(ex.error, RangeError))
+            self.assertTrue(ex.__cause__ is ex.error)
+            self.assertTrue("ValidationError" in str(ex))
+            self.assertTrue("record at offset 3" in str(ex))
+        else:
+            self.fail("expected RecordError")
+        self.assertEqual(it.offset, 3)
+        self.assertTrue(stream.tell() <= 64)
+        it = Struct("x" / OneOf(uint8, [1])).iter_unpack(BytesIO(b("\x01\x05\x01")))
+        self.assertEqual(next(it).x, 1)
+        self.assertRaises(RecordError, next, it)
+        # the original exception is left as it was
+        with self.assertRaises(RecordError) as caught:
+            next(Struct("x" / OneOf(uint8, [1])).iter_unpack(BytesIO(b("\x05"))))
+        self.assertTrue(isinstance(caught.exception.error, ValidationError))
+        self.assertFalse("offset" in str(caught.exception.error))
+
+    def test_resume(self):
+        records = [dict(length = i, data = b("y") * i) for i in range(20)]
+        data = b("").join(self.variable.pack(r) for r in records)
+        fd, path = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            with self.variable.iter_unpack(path, chunk_size = 16) as it:
+                for i, rec in enumerate(it):
+                    if i == 9:
+                        checkpoint = it.offset
+                        break
+            it2 = self.variable.iter_unpack(path, offset = checkpoint)
+            self.assertTrue(isinstance(it2, RecordIterator))
+            self.assertEqual(list(it2), records[10:])
+            self.assertEqual(it2.offset, len(data))
+            self.assertTrue(it2._stream.closed)
+        finally:
+            os.remove(path)
+
+
+class TestDecoder(unittest.TestCase):
+    framed = Struct("length" / uint16b, "data" / Raw(this.length), "crc" / uint32b)
+
+    def _feed(self, pkr, data, chunk_size):
+        decoder = Decoder(pkr)
+        records = []
+        for i in range(0, len(data), chunk_size):
+            records.extend(decoder.feed(data[i:i + chunk_size]))
+        records.extend(decoder.close())
+        self.assertEqual(decoder.offset, len(data))
+        return records
+
+    def test_fixed(self):
+        pkr = TestIterUnpack.fixed
+        records = [dict(a = i, b = i * 1000) for i in range(100)]
+        data = b("").join(pkr.pack(r) for r in records)
+        for chunk_size in (1, 4, 6, 1000):
+            self.assertEqual(self._feed(pkr, data, chunk_size), records)
+
+    def test_length_prefixed(self):
+        records = [dict(length = i * 7, data = b("y") * (i * 7), crc = i) for i in range(50)]
+        data = b("").join(self.framed.pack(r) for r in records)
+        for chunk_size in (1, 3, 100, 100000):
+            self.assertEqual(self._feed(self.framed, data, chunk_size), records)
+        self.assertEqual(self._feed(PascalString(uint8), b("\x01a\x00\x02bc"), 1), ["a", "", "bc"])
+
+    def test_frame_size(self):
+        frame = framer(self.framed)
+        data = self.framed.pack(dict(length = 5, data = b("hello"), crc = 0))
+        self.assertEqual(frame(memoryview(data), {}), 11)
+        self.assertEqual(frame(memoryview(data[:3]), {}), 11)
+        self.assertEqual(frame(memoryview(data[:1]), {}), None)
+        self.assertEqual(framer(PascalString(uint8))(memoryview(b("\x05")), {}), 6)
+        self.assertEqual(framer(uint8[:]), None)
+        array = Struct("count" / uint8, "items" / uint16b[this.count])
+        self.assertEqual(framer(array)(memoryview(b("\x03")), {}), 7)
+
+    def test_waits_for_whole_frame(self):
+        decoder = Decoder(self.framed)
+        data = self.framed.pack(dict(length = 1000, data = b("z") * 1000, crc = 1))
+        self.assertEqual(decoder.feed(data[:2]), [])
+        self.assertEqual(decoder._needed, 1006)
+        for i in range(2, len(data) - 1, 10):
+            self.assertEqual(decoder.feed(data[i:min(i + 10, len(data) - 1)]), [])
+        self.assertEqual(decoder.pending, len(data) - 1)
+        self.assertEqual(decoder.feed(data[-1:] + data[:2]), [dict(length = 1000, data = b("z") * 1000, crc = 1)])
+        self.assertEqual(decoder.pending, 2)
+        self.assertRaises(TruncatedRecordError, decoder.close)
+
+    def test_fallback(self):
+        pkr = Struct("count" / uint8, "items" / PascalString(uint8)[this.count])
+        self.assertEqual(framer(pkr), None)
+        records = [dict(count = i, items = [str(j) for j in range(i)]) for i in range(20)]
+        data = b("").join(pkr.pack(r) for r in records)
+        for chunk_size in (1, 5, 1000):
+            self.assertEqual(self._feed(pkr, data, chunk_size), records)
+
+    def test_fallback_growth(self):
+        # without a framer, a record is parsed again only once the pending data has doubled
+        class Counting(Struct):
+            attempts = 0
+            def _unpack(self, stream, ctx, cfg):
+                Counting.attempts += 1
+                return Struct._unpack(self, stream, ctx, cfg)
+        pkr = Counting("count" / uint16b, "items" / PascalString(uint8)[this.count])
+        data = pkr.pack(dict(count = 1000, items = ["abc"] * 1000))
+        decoder = Decoder(pkr)
+        for i in range(len(data) - 1):
+            self.assertEqual(decoder.feed(data[i:i + 1]), [])
+        self.assertTrue(Counting.attempts <= 14)
+        self.assertEqual(decoder.flush(), [])
+        self.assertEqual(decoder.feed(data[-1:]), [])
+        self.assertEqual(decoder.flush(), [dict(count = 1000, items = ["abc"] * 1000)])
+        self.assertEqual(decoder.close(), [])
+
+    def test_errors(self):
+        pkr = Struct("tag" / OneOf(uint8, [1, 2]), "length" / uint8, "data" / Raw(this.length))
+        for framed in (True, False):
+            decoder = Decoder(pkr)
+            if not framed:
+                decoder._framer = None
+            # the records completed before the corrupt one are returned first
+            self.assertEqual(decoder.feed(b("\x01\x01a\x05\x00\x02")), [dict(tag = 1, length = 1, data = b("a"))])
+            self.assertEqual((decoder.offset, decoder.pending), (3, 3))
+            self.assertRaises(RecordError, decoder.feed, b(""))
+            # the corrupt record remains pending, along with the data fed after it
+            self.assertRaises(RecordError, decoder.feed, b("\x01\x00"))
+            self.assertEqual((decoder.offset, decoder.pending), (3, 5))
+            self.assertEqual(decoder._buffer[decoder._pos:], b("\x05\x00\x02\x01\x00"))
+            decoder = Decoder(pkr)
+            self.assertEqual(decoder.feed(b("\x02\x00")), [dict(tag = 2, length = 0, data = b(""))])
+            self.assertRaises(RecordError, decoder.feed, b("\x07\x00"))
+            self.assertEqual((decoder.offset, decoder.pending), (2, 2))
+            self.assertRaises(RecordError, decoder.close)
+
+
+if __name__ == "__main__":
+    unittest.main()
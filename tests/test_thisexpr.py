@@ -0,0 +1,56 @@
+import pickle
+import operator
+import unittest
+from six import b
+from construct3 import Struct, Raw, Computed, uint8
+from construct3.lib.thisexpr import this, compile_expr, BinExpr
+
+
+class TestCompiledExpr(unittest.TestCase):
+    ctx = {"a" : 1, "b" : 2, "items" : [5, 6], "_" : {"c" : 3}}
+
+    def test_source(self):
+        self.assertEqual(compile_expr(this.a + this.b * 2).source, "lambda ctx: (ctx['a'] + (ctx['b'] * 2))")
+        self.assertEqual(compile_expr(this._.c).source, "lambda ctx: ctx['_']['c']")
+        self.assertEqual(compile_expr(this).source, "lambda ctx: ctx")
+
+    def test_folding(self):
+        expr = this.a * (2 + 3) - (this.b - this.b)
+        self.assertEqual(compile_expr(expr).source, "lambda ctx: ((ctx['a'] * 5) - (ctx['b'] - ctx['b']))")
+        self.assertEqual(compile_expr(this.a + (1 - 3)).source, "lambda ctx: (ctx['a'] + (-2))")
+        self.assertEqual((-2 ** this.a)(self.ctx), -2)
+        self.assertEqual(BinExpr(operator.pow, BinExpr(operator.sub, 0, 2), this.b)(self.ctx), 4)
+        # errors in constant subexpressions are raised when evaluated, not when compiled
+        expr = this.a + BinExpr(operator.floordiv, 1, 0)
+        self.assertRaises(ZeroDivisionError, expr, self.ctx)
+
+    def test_evaluation(self):
+        for expr, value in [(this.a + this.b * 2, 5), (-this._.c, -3), (this.items[1] % 4, 2),
+                (this.a / 2.0, 0.5), (~this.a, False), (this.b > this.a, True), (10 - this.b, 8)]:
+            self.assertEqual(expr(self.ctx), value)
+        self.assertEqual((this.a + (lambda ctx: ctx["b"] * 10))(self.ctx), 21)
+
+    def test_cached(self):
+        expr = this.a + 1
+        func = compile_expr(expr)
+        self.assertIs(compile_expr(expr), func)
+        self.assertEqual(expr(self.ctx), 2)
+        self.assertIs(expr._compiled, func)
+        expr2 = pickle.loads(pickle.dumps(expr))
+        self.assertIs(expr2._compiled, None)
+        self.assertEqual(expr2(self.ctx), 2)
+
+    def test_packers(self):
+        # packers call the compiled functions of their expressions directly
+        pkr = Struct("a" / uint8, "data" / Raw(this.a * 2), "bytes" / uint8[this.a], "n" / Computed(this.a + 1))
+        obj = pkr.unpack(b("\x01ab\x05"))
+        self.assertEqual((obj.data, obj["bytes"], obj.n), (b("ab"), [5], 2))
+        raw, items, computed = [pkr.members[i][1] for i in (1, 2, 3)]
+        self.assertIs(raw._plan, compile_expr(raw.length))
+        self.assertEqual(items._plan, (compile_expr(items.mincount), compile_expr(items.maxcount)))
+        self.assertIs(computed._plan, compile_expr(computed.expr))
+        self.assertIsNone(pickle.loads(pickle.dumps(raw))._plan)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import unittest
+from io import BytesIO
+from six import b
+from construct3 import (Struct, Raw, BitStruct, Embedded, PascalString, Computed, Pointer, nibble, this, uint8, uint16b,
+    uint32b, profile)
+from construct3.packers import PackerError, RawError
+from construct3.lib.binutil import annotated_hexdump
+from construct3.trace import trace_unpack
+
+
+record = Struct(
+    "kind" / uint8,
+    "size" / uint16b,
+    "seq" / uint32b,
+    Embedded(BitStruct("version" / nibble, "flags" / nibble)),
+    "length" / uint8,
+    "data" / Raw(this.length),
+    "name" / PascalString(uint8),
+)
+data = b("\x01\x00\x02\x00\x00\x00\x03\x45\x03abc\x02hi")
+
+
+class TestTrace(unittest.TestCase):
+    def test_nodes(self):
+        trace = record.unpack_traced(data, "rec")
+        self.assertIsNone(trace.error)
+        self.assertEqual(trace.value, record.unpack(data))
+        self.assertEqual(trace[0][:3], ("rec", 0, len(data)))
+        self.assertEqual(trace.parents[0], -1)
+        spans = [trace[i][:3] for i in trace.fields()]
+        self.assertEqual(spans[:7], [("rec.kind", 0, 1), ("rec.size", 1, 3), ("rec.seq", 3, 7),
+            ("rec.version", 7, 8), ("rec.flags", 7, 8), ("rec.length", 8, 9), ("rec.data", 9, 12)])
+        self.assertEqual(spans[-1][1:], (13, 15))
+        # node paths, packers and parents are kept in flat arrays
+        self.assertEqual(len(trace.path_ids), len(trace))
+        self.assertEqual(len(trace.starts), len(trace.ends))
+        for i, (path, start, end, pkr) in enumerate(trace):
+            parent = trace.parents[i]
+            if parent >= 0:
+                self.assertTrue(trace.starts[parent] <= start <= end <= trace.ends[parent])
+                self.assertTrue(path == "rec" or path.startswith("rec."))
+
+    def test_many(self):
+        trace = trace_unpack(record, data * 3, "rec", many = True)
+        self.assertEqual(trace.value, [record.unpack(data)] * 3)
+        roots = [i for i in range(len(trace)) if trace.parents[i] == -1]
+        self.assertEqual([trace[i][1:3] for i in roots], [(0, 15), (15, 30), (30, 45)])
+        trace = trace_unpack(record, BytesIO(data * 2), many = True)
+        self.assertEqual(len(trace.value), 2)
+        self.assertEqual(trace[0][0], "Struct")
+        # records that consume no data fail rather than being repeated forever
+        trace = Struct("a" / Computed(1)).unpack_traced(b("xy"), many = True)
+        self.assertIsInstance(trace.error, PackerError)
+        self.assertIn("Empty record at offset 0", str(trace.error))
+        self.assertEqual(trace.value, [dict(a = 1)])
+
+    def test_errors(self):
+        trace = record.unpack_traced(data[:11])
+        self.assertIsInstance(trace.error, RawError)
+        self.assertIsNone(trace.value)
+        self.assertEqual(trace[trace.failed][0], "Struct.data")
+        # the failed node ends where decoding stopped
+        self.assertEqual(trace[trace.failed][1:3], (9, 11))
+
+    def test_hexdump(self):
+        trace = record.unpack_traced(data, "rec")
+        lines = trace.hexdump(data, linesize = 8).splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[0], "0000   01|00 02|00 00 00 03|45   .......E   kind, size, seq, version, flags")
+        self.assertEqual(lines[1], "0008   03|61 62 63|02|68 69      .abc.hi    length, data, name.0, name.1")
+        self.assertIn("\x1b[", trace.hexdump(data, color = True))
+
+    def test_hexdump_region(self):
+        # the fields of a region are found without going over the whole trace
+        buf = data * 20
+        trace = trace_unpack(record, buf, "rec", many = True)
+        spans = [(trace.starts[i], trace.ends[i], trace.paths[trace.path_ids[i]][4:]) for i in trace.fields()]
+        trace.fields = None
+        for linesize in (4, 7, 16):
+            for start, end in [(0, None), (37, 90), (148, 151), (290, 400)]:
+                self.assertEqual(trace.hexdump(buf, start, end, linesize),
+                    annotated_hexdump(buf, spans, linesize, start, end))
+        # fields decoded out of order are found by going over the whole trace
+        pkr = Struct("offset" / uint8, "value" / Pointer(this.offset, uint16b), "rest" / Raw(3))
+        buf = b("\x02\x00\x01\x02\x03")
+        trace = pkr.unpack_traced(buf, "rec")
+        spans = [(trace.starts[i], trace.ends[i], trace.paths[trace.path_ids[i]][4:]) for i in trace.fields()]
+        self.assertEqual(trace.hexdump(buf, 3, linesize = 2), annotated_hexdump(buf, spans, 2, 3))
+
+    def test_exclusive(self):
+        with profile():
+            self.assertRaises(RuntimeError, record.unpack_traced, data)
+
+
+class TestAnnotatedHexdump(unittest.TestCase):
+    def test_spans(self):
+        buf = b("abcdefghij")
+        text = annotated_hexdump(buf, [(0, 2, "x"), (2, 7, "y"), (8, 10, "z")], linesize = 4)
+        self.assertEqual(text.splitlines(), [
+            "0000   61 62|63 64   abcd   x, y",
+            "0004   65 66 67|68   efgh",
+            "0008   69 6a         ij     z",
+        ])
+        text = annotated_hexdump(buf, [(0, 2, "x"), (2, 7, "y"), (8, 10, "z")], linesize = 4, start = 5, end = 9)
+        self.assertEqual(text.splitlines(), [
+            "0004   65 66 67|68   efgh",
+            "0008   69            i      z",
+        ])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+from six import b
+from construct3 import Struct, Raw, Embedded, Array, this, uint8, uint16b, sint16l, float64l, Padding, PascalString
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+if numpy is not None:
+    from construct3.vectorized import to_dtype, unpack_array, pack_array, NotVectorizableError
+
+
+record = Struct(
+    "id" / uint16b,
+    Padding(1),
+    "temp" / sint16l,
+    Embedded(Struct("value" / float64l)),
+    "samples" / Array(3, uint8),
+    "tag" / Raw(2),
+)
+
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class TestVectorized(unittest.TestCase):
+    def test_dtype(self):
+        dtype = to_dtype(record)
+        self.assertEqual(dtype.itemsize, record.sizeof())
+        self.assertEqual(dtype.names, ("id", "temp", "value", "samples", "tag"))
+        self.assertEqual(dtype.fields["temp"][1], 3)
+
+    def test_roundtrip(self):
+        items = [dict(id = i, temp = -i, value = i / 2.0, samples = [i, i + 1, i + 2], tag = b("ab"))
+            for i in range(5)]
+        data = b("").join(record.pack(item) for item in items)
+        arr = unpack_array(Array(5, record), data)
+        self.assertEqual(len(arr), 5)
+        self.assertEqual(list(arr["id"]), [0, 1, 2, 3, 4])
+        self.assertEqual(list(arr["temp"]), [0, -1, -2, -3, -4])
+        self.assertEqual(list(arr["samples"][2]), [2, 3, 4])
+        self.assertEqual(arr["value"][3], 1.5)
+        self.assertEqual(len(unpack_array(record, data)), 5)
+        self.assertEqual(pack_array(Array(5, record), arr), data)
+        self.assertEqual(pack_array(record, arr[1:3]), data[record.sizeof():3 * record.sizeof()])
+
+    def test_not_eligible(self):
+        self.assertRaises(NotVectorizableError, to_dtype, Struct("a" / uint8, "b" / Raw(this.a)))
+        self.assertRaises(NotVectorizableError, to_dtype, Struct("s" / PascalString(uint8)))
+        self.assertRaises(NotVectorizableError, unpack_array, Array(this.n, uint8[this.m]), b(""))
+
+
+if __name__ == "__main__":
+    unittest.main()